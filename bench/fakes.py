@@ -0,0 +1,158 @@
+"""Local stand-ins for the services the bot and the MCP server call, so load
+tests measure this code rather than Meta's or DuckDuckGo's.
+
+One Starlette app serves all three:
+
+- ``POST /v20.0/{phone_number_id}/messages``: the Graph API send endpoint.
+  Each send resolves the waiter registered for its recipient, which is how
+  the harness measures webhook-to-reply latency.
+- ``GET /html/?q=...``: DuckDuckGo's HTML results page. Like the real one,
+  each result links to a protocol-relative redirect
+  (``//duckduckgo.com/l/?uddg=<url>&rut=...``) whose ``uddg`` parameter is a
+  ``/jobs/{n}`` page on this server.
+- ``GET /jobs/{n}``: a job posting page.
+
+Optional per-endpoint latency and an error rate for the Graph endpoint let a
+run include slow or failing upstreams.
+"""
+import asyncio
+import html
+import itertools
+import random
+from urllib.parse import quote
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.routing import Route
+
+@asynccontextmanager
+async def serve(app, host: str = "127.0.0.1", port: int = 0) -> AsyncIterator[str]:
+    """Run an ASGI app on this event loop; yields its base URL."""
+    config = uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on")
+    server = uvicorn.Server(config)
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()   # surface bind errors
+        await asyncio.sleep(0.01)
+    bound = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://{host}:{bound}"
+    finally:
+        server.should_exit = True
+        await task
+
+class FakeUpstreams:
+    def __init__(self, graph_latency: float = 0.0, graph_error_rate: float = 0.0,
+                 search_latency: float = 0.0, page_latency: float = 0.0, seed: int = 7):
+        self.graph_latency = graph_latency
+        self.graph_error_rate = graph_error_rate
+        self.search_latency = search_latency
+        self.page_latency = page_latency
+        self.base_url = ""
+        self._rnd = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        self.sent = 0
+        self.searches = 0
+        self.pages = 0
+        self.app = Starlette(routes=[
+            Route("/v20.0/{phone_number_id}/messages", self.graph_send, methods=["POST"]),
+            Route("/html/", self.search, methods=["GET", "POST"]),
+            Route("/jobs/{n:int}", self.job_page, methods=["GET"]),
+        ])
+
+    @asynccontextmanager
+    async def running(self) -> AsyncIterator["FakeUpstreams"]:
+        async with serve(self.app) as url:
+            self.base_url = url
+            yield self
+
+    def expect_reply(self, phone: str) -> "asyncio.Future[str]":
+        """Future for the next message sent to ``phone`` (its text body)."""
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(phone, []).append(future)
+        return future
+
+    async def graph_send(self, request: Request) -> JSONResponse:
+        if self.graph_latency:
+            await asyncio.sleep(self.graph_latency)
+        if self.graph_error_rate and self._rnd.random() < self.graph_error_rate:
+            return JSONResponse({"error": {"message": "fake upstream failure"}}, status_code=503)
+        payload = await request.json()
+        self.sent += 1
+        waiters = self._waiters.get(payload.get("to"))
+        if waiters:
+            future = waiters.pop(0)
+            if not future.done():
+                future.set_result(payload["text"]["body"])
+        return JSONResponse({
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": payload.get("to"), "wa_id": payload.get("to")}],
+            "messages": [{"id": f"wamid.fake{next(self._ids)}"}],
+        })
+
+    async def search(self, request: Request) -> HTMLResponse:
+        if self.search_latency:
+            await asyncio.sleep(self.search_latency)
+        self.searches += 1
+        query = html.escape(request.query_params.get("q", ""))
+        start = self._rnd.randrange(1000)
+        results = "\n".join(
+            f'<div class="result"><h2><a class="result__a" href="{self._redirect(start + i)}">'
+            f'{query} #{start + i}</a></h2><a class="result__snippet">Posting {start + i}</a></div>'
+            for i in range(10)
+        )
+        return HTMLResponse(f"<html><body><div id='links'>{results}</div></body></html>")
+
+    def _redirect(self, n: int) -> str:
+        target = quote(f"{self.base_url}/jobs/{n}", safe="")
+        return html.escape(f"//duckduckgo.com/l/?uddg={target}&rut=fake{n}")
+
+    async def job_page(self, request: Request) -> HTMLResponse:
+        if self.page_latency:
+            await asyncio.sleep(self.page_latency)
+        self.pages += 1
+        n = request.path_params["n"]
+        paragraphs = "\n".join(
+            f"<p>Responsibility {i}: build and run Python services for team {n}, "
+            f"review code, and mentor engineers on reliability practices.</p>"
+            for i in range(40)
+        )
+        return HTMLResponse(f"""<html><head><title>Senior Python Engineer #{n}</title></head>
+<body><nav><a href="/">Home</a> | <a href="/jobs">Jobs</a></nav>
+<article><h1>Senior Python Engineer #{n}</h1>
+<p>Acme Corp is hiring a remote Python engineer. Salary 30-40 LPA.</p>
+{paragraphs}
+</article><footer>© Acme</footer></body></html>""")
+
+    def stats(self) -> Dict[str, int]:
+        return {"sent": self.sent, "searches": self.searches, "pages": self.pages}
+
+def webhook_payload(phone: str, text: str, msg_id: str, phone_number_id: str = "100000000000001") -> dict:
+    """A Cloud API ``messages`` webhook delivery carrying one text message."""
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{
+            "id": "200000000000002",
+            "changes": [{
+                "field": "messages",
+                "value": {
+                    "messaging_product": "whatsapp",
+                    "metadata": {"display_phone_number": "15550000000", "phone_number_id": phone_number_id},
+                    "contacts": [{"profile": {"name": "Load Test"}, "wa_id": phone}],
+                    "messages": [{
+                        "from": phone,
+                        "id": msg_id,
+                        "timestamp": "1760000000",
+                        "type": "text",
+                        "text": {"body": text},
+                    }],
+                },
+            }],
+        }],
+    }
@@ -0,0 +1,91 @@
+"""List and complete latency as finished-task history grows.
+
+Fills a scratch tasks.db with done tasks (a tenth of them on the measured
+phone), keeps a fixed number of open tasks, and times the list and complete
+paths at each size. With the partial indexes both should stay flat.
+
+    python -m bench.history --sizes 0,100000,1000000
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from whatsappbot import db, replies
+
+PHONE = "919000000000"
+
+def _percentile(sorted_values, pct: float) -> float:
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+def _grow_history(target: int, current: int, phones: int) -> None:
+    """Insert done tasks until there are ``target`` in total."""
+    batch = 50000
+    with db.get_conn() as conn:
+        while current < target:
+            n = min(batch, target - current)
+            conn.executemany(
+                "INSERT INTO tasks (phone, scope, text, status, completed_at)"
+                " VALUES (?, 'today', ?, 'done', CURRENT_TIMESTAMP)",
+                ((PHONE if i % 10 == 0 else f"91{random.randrange(phones):010d}", f"old task {current + i}")
+                 for i in range(n)),
+            )
+            conn.commit()
+            current += n
+    db.analyze()
+
+def _timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+def measure(ops: int) -> dict:
+    lists, pages, by_text, by_id = [], [], [], []
+    for i in range(ops):
+        pages.append(_timed(db.list_tasks_page, PHONE, None, None, 50))
+        lists.append(_timed(replies.build_task_list_reply, PHONE))   # uncached path
+        db.add_task(PHONE, "week", f"bench errand {i}")
+        by_text.append(_timed(db.complete_task, PHONE, f"bench errand {i}"))
+        task_id = db.add_task(PHONE, "week", f"bench chore {i}")
+        by_id.append(_timed(db.complete_task, PHONE, str(task_id)))
+    out = {}
+    for name, values in (("list_page", pages), ("list_reply", lists),
+                         ("complete_text", by_text), ("complete_id", by_id)):
+        values.sort()
+        out[name] = {"p50_ms": 1000 * statistics.median(values),
+                     "p95_ms": 1000 * _percentile(values, 95)}
+    return out
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="0,10000,100000,1000000",
+                        help="comma-separated history sizes (done tasks)")
+    parser.add_argument("--open", type=int, default=200, help="open tasks on the measured phone")
+    parser.add_argument("--ops", type=int, default=200, help="timed operations per size")
+    parser.add_argument("--phones", type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # a private, unsharded layout: never the real tasks.db or shard map
+        db.close_pool()
+        db.DB_PATH = Path(tmp) / "tasks.db"
+        db.SHARD_MAP_PATH = Path(tmp) / "shards.json"
+        db.init_db()
+        db.add_tasks(PHONE, "today", [f"open task {i}" for i in range(args.open)])
+        done = 0
+        print(f"{'history':>10}  {'list page':>17}  {'list reply':>17}  {'complete text':>17}  {'complete id':>17}")
+        print(f"{'':>10}  " + "  ".join(f"{'p50':>8} {'p95':>8}" for _ in range(4)) + "   (ms)")
+        for size in (int(s) for s in args.sizes.split(",")):
+            _grow_history(size, done, args.phones)
+            done = max(done, size)
+            r = measure(args.ops)
+            print(f"{size:>10}  " + "  ".join(
+                f"{r[k]['p50_ms']:>8.3f} {r[k]['p95_ms']:>8.3f}"
+                for k in ("list_page", "list_reply", "complete_text", "complete_id")))
+        db.close_pool()
+
+if __name__ == "__main__":
+    main()
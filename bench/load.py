@@ -0,0 +1,356 @@
+"""Load harness for the WhatsApp bot and the MCP server.
+
+Everything runs in this process against local fakes (bench/fakes.py):
+
+- ``bot``: simulated users each send a webhook, wait for the bot's reply to
+  reach the fake Graph API, then send the next message. The timed latency
+  is webhook POST -> reply sent, per intent; the webhook ack is reported
+  separately.
+- ``mcp``: concurrent clients issue ``tools/call`` requests over
+  streamable-http, job_finder included (searches and job pages are served
+  by the fakes).
+
+Results are printed and saved as JSON; ``--compare`` prints the change
+against an earlier result file.
+
+    python -m bench.load all --requests 2000 --concurrency 50
+    python -m bench.load bot --graph-latency 0.05 --compare bench/results/before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from bench.fakes import FakeUpstreams, serve, webhook_payload
+
+RESULTS_DIR = Path(__file__).with_name("results")
+PHONE_NUMBER_ID = "100000000000001"
+
+ITEMS = ["buy milk", "call mom", "pay rent", "book dentist", "renew passport", "gym session",
+         "review PR", "water plants", "send invoice", "plan trip", "fix bike", "read chapter"]
+SCOPE_PHRASES = ["today", "this week", "my week", "this month", "monthly"]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, seconds: float, ok: bool) -> None:
+        if ok:
+            self.latencies[name].append(seconds)
+        else:
+            self.errors[name] += 1
+
+    def summary(self, elapsed: float, exclude: Tuple[str, ...] = ()) -> Dict[str, Dict[str, float]]:
+        names = sorted(set(self.latencies) | set(self.errors))
+        rows = {name: _row(self.latencies[name], self.errors[name], elapsed) for name in names}
+        included = [n for n in names if n not in exclude]
+        rows["all"] = _row([v for n in included for v in self.latencies[n]],
+                           sum(self.errors[n] for n in included), elapsed)
+        return rows
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+def _row(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    values = sorted(latencies)
+    count = len(values) + errors
+    return {
+        "count": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(1000 * statistics.mean(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * _percentile(values, 50), 3),
+        "p95_ms": round(1000 * _percentile(values, 95), 3),
+        "p99_ms": round(1000 * _percentile(values, 99), 3),
+        "max_ms": round(1000 * values[-1], 3) if values else 0.0,
+    }
+
+class Budget:
+    """Shared request counter; workers stop once it is spent."""
+
+    def __init__(self, total: int):
+        self.left = total
+
+    def take(self) -> bool:
+        if self.left <= 0:
+            return False
+        self.left -= 1
+        return True
+
+# --- Bot: simulated WhatsApp users ---
+
+BOT_MIX = [("add", 30), ("add_many", 8), ("list", 20), ("more", 4), ("complete", 14),
+           ("complete_many", 4), ("delete", 10), ("help", 5), ("unknown", 5)]
+
+class User:
+    def __init__(self, phone: str, rnd: random.Random):
+        self.phone = phone
+        self.rnd = rnd
+        self.open_ids: List[str] = []
+
+    def next_message(self) -> Tuple[str, str]:
+        rnd = self.rnd
+        intent = rnd.choices([m[0] for m in BOT_MIX], [m[1] for m in BOT_MIX])[0]
+        if intent in ("complete", "complete_many", "delete") and not self.open_ids:
+            intent = "add"
+        if intent == "add":
+            return intent, f"add {rnd.choice(ITEMS)} {rnd.randrange(1000)} to {rnd.choice(SCOPE_PHRASES)}"
+        if intent == "add_many":
+            items = rnd.sample(ITEMS, 3)
+            return intent, f"add {items[0]}, {items[1]} and {items[2]} to {rnd.choice(SCOPE_PHRASES)}"
+        if intent == "list":
+            return intent, rnd.choice(["show today", "show", "list my week", "show this month", "tasks"])
+        if intent == "more":
+            return intent, "more"
+        if intent == "complete":
+            return intent, f"done {self.open_ids.pop(rnd.randrange(len(self.open_ids)))}"
+        if intent == "complete_many":
+            ids = [self.open_ids.pop() for _ in range(min(3, len(self.open_ids)))]
+            return intent, "done " + " ".join(ids)
+        if intent == "delete":
+            return intent, f"delete {self.open_ids.pop(rnd.randrange(len(self.open_ids)))}"
+        if intent == "help":
+            return intent, "help"
+        return intent, rnd.choice(["what's the weather?", "thanks!", "ok"])
+
+    def observe(self, intent: str, reply: str) -> None:
+        if intent in ("add", "add_many"):
+            self.open_ids.extend(re.findall(r"#(\d+)", reply))
+
+async def bench_bot(fakes: FakeUpstreams, requests: int, concurrency: int, timeout: float,
+                    tmp: Path, seed: int) -> Dict[str, Any]:
+    os.environ.update({
+        "WHATSAPP_TOKEN": "bench-token",
+        "WHATSAPP_PHONE_NUMBER_ID": PHONE_NUMBER_ID,
+        "WHATSAPP_API_BASE": f"{fakes.base_url}/v20.0",
+    })
+    # generous send limits so the run measures the bot, not the throttle
+    for key, value in (("WA_BUSINESS_RATE", "100000"), ("WA_BUSINESS_BURST", "100000"),
+                       ("WA_RECIPIENT_RATE", "1000"), ("WA_RECIPIENT_BURST", "1000"),
+                       ("TASK_BACKEND", "direct")):
+        os.environ.setdefault(key, value)
+    from whatsappbot import db
+    db.close_pool()
+    db.DB_PATH = tmp / "bot_tasks.db"
+    db.SHARD_MAP_PATH = tmp / "shards.json"
+    from whatsappbot import main as bot
+
+    recorder = Recorder()
+    budget = Budget(requests)
+    rnd = random.Random(seed)
+    users = [User(f"9198{i:08d}", random.Random(rnd.random())) for i in range(concurrency)]
+
+    async with serve(bot.app) as url:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+
+            async def run_user(user: User) -> None:
+                while budget.take():
+                    intent, text = user.next_message()
+                    reply = fakes.expect_reply(user.phone)
+                    payload = webhook_payload(user.phone, text, f"wamid.{uuid.uuid4().hex}", PHONE_NUMBER_ID)
+                    started = time.perf_counter()
+                    try:
+                        r = await client.post("/wa/webhook", json=payload)
+                        recorder.add("webhook_ack", time.perf_counter() - started, r.status_code == 200)
+                        if r.status_code != 200:
+                            reply.cancel()
+                            recorder.add(intent, 0.0, False)
+                            continue
+                        body = await asyncio.wait_for(reply, timeout)
+                    except (httpx.HTTPError, asyncio.TimeoutError):
+                        recorder.add(intent, 0.0, False)
+                        continue
+                    recorder.add(intent, time.perf_counter() - started, True)
+                    user.observe(intent, body)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(run_user(u) for u in users))
+            elapsed = time.perf_counter() - started
+            # read in process: /stats needs PROFILER_TOKEN
+            server_stats = {"work_queue": bot.work_queue.stats(), "outbound": bot.outbound.stats(),
+                            "task_cache": bot.task_cache.stats()}
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "rows": recorder.summary(elapsed, exclude=("webhook_ack",)),
+        "server": server_stats,
+    }
+
+# --- MCP: tools/call traffic ---
+
+MCP_MIX = [("add_task", 25), ("add_tasks", 8), ("list_tasks", 25), ("complete_task", 12),
+           ("complete_tasks", 4), ("delete_task", 8), ("delete_tasks", 3),
+           ("job_finder_search", 5), ("job_finder_url", 5)]
+
+def _mcp_call(name: str, phone: str, rnd: random.Random, open_ids: List[str],
+              fake_url: str) -> Tuple[str, str, Dict[str, Any]]:
+    """(label, tool, arguments) for one call."""
+    if name in ("complete_task", "complete_tasks", "delete_task", "delete_tasks") and not open_ids:
+        name = "add_task"
+    if name == "add_task":
+        return name, name, {"phone": phone, "scope": rnd.choice(["today", "week", "month"]),
+                            "text": f"{rnd.choice(ITEMS)} {rnd.randrange(1000)}"}
+    if name == "add_tasks":
+        return name, name, {"phone": phone, "scope": "today", "texts": rnd.sample(ITEMS, 3)}
+    if name == "list_tasks":
+        return name, name, {"phone": phone, "scope": rnd.choice([None, "today", "week"])}
+    if name in ("complete_task", "delete_task"):
+        return name, name, {"phone": phone, "task_text_or_id": open_ids.pop(rnd.randrange(len(open_ids)))}
+    if name in ("complete_tasks", "delete_tasks"):
+        return name, name, {"phone": phone, "items": [open_ids.pop() for _ in range(min(3, len(open_ids)))]}
+    if name == "job_finder_search":
+        return name, "job_finder", {"user_goal": f"find {rnd.choice(['python', 'go', 'data'])} jobs in bangalore",
+                                    "summarize": True}
+    return name, "job_finder", {"user_goal": "summarize this posting",
+                                "job_url": f"{fake_url}/jobs/{rnd.randrange(200)}"}
+
+async def bench_mcp(fakes: FakeUpstreams, requests: int, concurrency: int, timeout: float,
+                    tmp: Path, seed: int) -> Dict[str, Any]:
+    os.environ["SEARCH_URL"] = f"{fakes.base_url}/html/"
+    from whatsappbot.mcp_client import MCPClient
+    from whatsappbot.mcp_testserver import local_mcp_server
+
+    recorder = Recorder()
+    budget = Budget(requests)
+    rnd = random.Random(seed)
+
+    async with local_mcp_server(tmp / "mcp_tasks.db") as url:
+        client = MCPClient(url, os.environ["AUTH_TOKEN"], timeout=timeout, max_connections=concurrency)
+        await client.connect()
+
+        async def run_client(i: int) -> None:
+            phone = f"9197{i:08d}"
+            crnd = random.Random(rnd.random())
+            open_ids: List[str] = []
+            while budget.take():
+                name = crnd.choices([m[0] for m in MCP_MIX], [m[1] for m in MCP_MIX])[0]
+                label, tool, arguments = _mcp_call(name, phone, crnd, open_ids, fakes.base_url)
+                started = time.perf_counter()
+                try:
+                    text = await client.call_tool(tool, arguments)
+                except Exception:
+                    recorder.add(label, 0.0, False)
+                    continue
+                recorder.add(label, time.perf_counter() - started, True)
+                if tool in ("add_task", "add_tasks"):
+                    open_ids.extend(re.findall(r"#(\d+)", text))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run_client(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        await client.close()
+
+    return {"elapsed_s": round(elapsed, 3), "rows": recorder.summary(elapsed)}
+
+# --- Reporting ---
+
+def print_rows(title: str, rows: Dict[str, Dict[str, float]]) -> None:
+    print(f"\n{title}")
+    print(f"  {'':<20}{'count':>7}{'err %':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in rows.items():
+        print(f"  {name:<20}{r['count']:>7}{100 * r['error_rate']:>8.2f}{r['throughput_rps']:>9.1f}"
+              f"{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}")
+
+def _change(new: float, old: float) -> str:
+    if not old:
+        return "     n/a"
+    return f"{100 * (new - old) / old:>+7.1f}%"
+
+def print_comparison(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    for section in ("bot", "mcp"):
+        if section not in results or section not in baseline:
+            continue
+        print(f"\n{section} vs baseline ({baseline['meta'].get('commit') or baseline['meta']['started']})")
+        print(f"  {'':<20}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'err pp':>9}")
+        old_rows = baseline[section]["rows"]
+        for name, r in results[section]["rows"].items():
+            old = old_rows.get(name)
+            if old is None:
+                continue
+            print(f"  {name:<20}{_change(r['p50_ms'], old['p50_ms'])}{_change(r['p95_ms'], old['p95_ms'])}"
+                  f"{_change(r['p99_ms'], old['p99_ms'])}{_change(r['throughput_rps'], old['throughput_rps'])}"
+                  f"{100 * (r['error_rate'] - old['error_rate']):>+8.2f}")
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=5, cwd=Path(__file__).parent).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"meta": {
+        "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "args": vars(args),
+    }}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp = Path(tmp_dir)
+        # keep the run away from the real tasks.db, shard map and fetch cache
+        os.environ["DB_SHARD_MAP"] = str(tmp / "shards.json")
+        os.environ.setdefault("FETCH_CACHE_PATH", str(tmp / "fetch_cache.db"))
+        os.environ.setdefault("MAINTENANCE_INTERVAL", "0")
+        fakes = FakeUpstreams(graph_latency=args.graph_latency, graph_error_rate=args.graph_error_rate,
+                              search_latency=args.search_latency, page_latency=args.page_latency,
+                              seed=args.seed)
+        async with fakes.running():
+            if args.target in ("bot", "all"):
+                results["bot"] = await bench_bot(fakes, args.requests, args.concurrency,
+                                                 args.timeout, tmp, args.seed)
+                print_rows(f"bot: webhook -> reply ({results['bot']['elapsed_s']}s)", results["bot"]["rows"])
+            if args.target in ("mcp", "all"):
+                results["mcp"] = await bench_mcp(fakes, args.mcp_requests or args.requests,
+                                                 args.concurrency, args.timeout, tmp, args.seed)
+                print_rows(f"mcp: tools/call ({results['mcp']['elapsed_s']}s)", results["mcp"]["rows"])
+        results["fakes"] = fakes.stats()
+        from whatsappbot import async_db
+        async_db.shutdown()
+    return results
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("target", nargs="?", choices=("bot", "mcp", "all"), default="all")
+    parser.add_argument("--requests", type=int, default=2000, help="webhooks (and tool calls) per run")
+    parser.add_argument("--mcp-requests", type=int, default=None, help="tool calls, if different")
+    parser.add_argument("--concurrency", type=int, default=50, help="simultaneous users / MCP clients")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per request, seconds")
+    parser.add_argument("--graph-latency", type=float, default=0.0, help="fake Graph API delay, seconds")
+    parser.add_argument("--graph-error-rate", type=float, default=0.0, help="fraction of sends answered 503")
+    parser.add_argument("--search-latency", type=float, default=0.0)
+    parser.add_argument("--page-latency", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out", type=Path, default=None,
+                        help="result file (default bench/results/load-<time>.json)")
+    parser.add_argument("--compare", type=Path, default=None, help="earlier result file to diff against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    out = args.out or RESULTS_DIR / f"load-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2, default=str))
+    print(f"\nSaved {out}")
+    if args.compare:
+        print_comparison(results, json.loads(args.compare.read_text()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""NLU cost per message: nlu.parse against the reference parser it replaced.
+
+The corpus (bench/nlu_corpus.txt, one message per line, \\n and \\t
+escapes allowed) and the seeded random variations are also what
+tests/test_nlu.py uses to check that parse() still matches
+reference_parse message for message.
+
+    python -m bench.nlu --rounds 2000
+"""
+import argparse
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from whatsappbot import nlu
+
+CORPUS = Path(__file__).with_name("nlu_corpus.txt")
+
+# --- Reference: the sequential-regex parser that nlu.parse replaced ---
+
+def _normalize_scope(s: Optional[str]) -> Optional[str]:
+    if not s: return None
+    s = s.lower()
+    if s in ("weekly",): return "week"
+    if s in ("monthly",): return "month"
+    if s in ("today","week","month"): return s
+    return None
+
+def reference_parse(text: str) -> Dict[str, Any]:
+    t = text.strip().lower()
+
+    m = re.match(r"(add|append|put|create|new)\s+(?P<what>.+?)\s+(to\s+)?(my\s+)?(?P<scope>today|this week|week|weekly|this month|month|monthly)", t)
+    if m:
+        what = m.group("what")
+        sc = m.group("scope").replace("this ","")
+        return {"intent":"add", "scope": _normalize_scope(sc), "text": what, "items": nlu.split_items(what)}
+
+    m = re.match(r"(show|list|view|see)(\s+my)?\s+(?P<scope>today|this week|week|weekly|this month|month|monthly)?", t)
+    if m:
+        sc = m.group("scope")
+        if sc: sc = sc.replace("this ","")
+        return {"intent":"list", "scope": _normalize_scope(sc), "text": None, "items": None}
+
+    m = re.match(r"(complete|done|finish|tick|mark)\s+(?P<what>.+)", t)
+    if m:
+        what = m.group("what")
+        return {"intent":"complete", "scope": None, "text": what, "items": nlu.split_items(what)}
+
+    m = re.match(r"(delete|del|remove|drop|cancel)\s+(?P<what>.+)", t)
+    if m:
+        what = m.group("what")
+        return {"intent":"delete", "scope": None, "text": what, "items": nlu.split_items(what)}
+
+    if t in ("today","week","weekly","month","monthly"):
+        return {"intent":"list", "scope": _normalize_scope(t), "text": None, "items": None}
+    if t in ("list","show", "tasks"):
+        return {"intent":"list", "scope": None, "text": None, "items": None}
+    if t in ("more","next","more tasks","next page"):
+        return {"intent":"more", "scope": None, "text": None, "items": None}
+    if t in ("help","hi","hello"):
+        return {"intent":"help", "scope": None, "text": None, "items": None}
+
+    return {"intent":"unknown", "scope": None, "text": text, "items": None}
+
+# --- Corpus ---
+
+VERBS = ["add", "append", "put", "create", "new", "show", "list", "view", "see", "complete",
+         "done", "finish", "tick", "mark", "delete", "del", "remove", "drop", "cancel",
+         "adds", "showing", "deleted", "help", "more", "hi", "tasks", ""]
+BODIES = ["milk", "buy milk", "milk, eggs and bread", "3 5 8", "#3, #5", "call mom & dad",
+          "today", "week", "this", "my", "to", "café", "🥛", "a;b;c", "and", ""]
+SCOPES = ["today", "this week", "week", "weekly", "this month", "month", "monthly",
+          "todays", "weeks", "next week", ""]
+JOINERS = [" ", "  ", "\t", "\n", " to ", " to my ", " my ", " please "]
+
+def load_corpus() -> List[str]:
+    lines = CORPUS.read_text(encoding="utf-8").splitlines()
+    return [line.replace("\\n", "\n").replace("\\t", "\t") for line in lines]
+
+def variations(count: int, seed: int = 7) -> List[str]:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(count):
+        parts = [rnd.choice(VERBS), rnd.choice(BODIES), rnd.choice(SCOPES)]
+        msg = rnd.choice(JOINERS).join(parts[:2]) + rnd.choice(JOINERS) + parts[2]
+        if rnd.random() < 0.3:
+            msg = msg.upper()
+        if rnd.random() < 0.2:
+            msg = rnd.choice([" ", "\n", "\t"]) + msg + rnd.choice(["", " ", "!"])
+        out.append(msg)
+    return out
+
+def time_per_message(fn, messages: List[str], rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for msg in messages:
+            fn(msg)
+    return (time.perf_counter() - started) / (rounds * len(messages))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=1000, help="timing passes over the corpus")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    ref = time_per_message(reference_parse, corpus, args.rounds)
+    new = time_per_message(nlu.parse, corpus, args.rounds)
+    print(f"reference_parse: {1e6 * ref:.2f} µs/message")
+    print(f"nlu.parse:       {1e6 * new:.2f} µs/message  ({ref / new:.2f}x)")
+
+if __name__ == "__main__":
+    main()
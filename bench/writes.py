@@ -0,0 +1,57 @@
+"""Write throughput with and without group commit.
+
+Runs the same burst of concurrent add/complete calls through async_db once
+with a commit per write and then with DB_GROUP_COMMIT at each batch size.
+
+    python -m bench.writes --writes 5000 --concurrency 128 --batches 8,32,128
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from whatsappbot import async_db, db
+
+async def burst(writes: int, concurrency: int, phones: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> None:
+        phone = f"91{i % phones:08d}"
+        async with sem:
+            task_id = await async_db.add_task(phone, "today", f"task {i}")
+            await async_db.complete_task(phone, str(task_id))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(writes // 2)))
+    return writes / (time.perf_counter() - started)
+
+async def run(writes: int, concurrency: int, phones: int, batch: int) -> None:
+    db.GROUP_COMMIT = batch > 0
+    os.environ["DB_GROUP_COMMIT_MAX_BATCH"] = str(max(batch, 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        # a private, unsharded layout: never the real tasks.db or shard map
+        db.close_pool()
+        db.DB_PATH = Path(tmp) / "tasks.db"
+        db.SHARD_MAP_PATH = Path(tmp) / "shards.json"
+        await async_db.init_db()
+        rate = await burst(writes, concurrency, phones)
+        stats = db.group_commit_stats()
+        async_db.shutdown()
+    label = f"group commit, batch {batch}" if batch else "commit per write"
+    avg = next(iter(stats.values()))["avg_batch"] if stats else 1
+    print(f"{label:>26}: {rate:8.0f} writes/s  (avg batch {avg})")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--phones", type=int, default=500)
+    parser.add_argument("--batches", default="8,32,128")
+    args = parser.parse_args()
+    for batch in [0] + [int(b) for b in args.batches.split(",")]:
+        asyncio.run(run(args.writes, args.concurrency, args.phones, batch))
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,35 @@
 import asyncio
+import codecs
 from typing import Annotated, Optional
+import json
 import os
+import re
+import time
+from urllib.parse import parse_qs, urlsplit
 from dotenv import load_dotenv
 from fastmcp import FastMCP
+from fastmcp.tools.tool import ToolResult
 from fastmcp.server.auth.providers.bearer import BearerAuthProvider, RSAKeyPair
+from fastmcp.server.middleware import Middleware, MiddlewareContext
 from mcp import ErrorData, McpError
 from mcp.server.auth.provider import AccessToken
 from mcp.types import TextContent, ImageContent, INVALID_PARAMS, INTERNAL_ERROR
 from pydantic import BaseModel, Field, AnyUrl
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
 
-import markdownify
 import httpx
-import readabilipy
 from bs4 import BeautifulSoup
 
 # --- Import your database functions ---
-from whatsappbot.db import init_db, add_task, list_tasks, complete_task, delete_task
+from whatsappbot import async_db, task_tools
+from whatsappbot.cache import task_cache
+from whatsappbot.db import pool_stats
+from whatsappbot.extract import extractor, html_to_markdown, stage_seconds
+from whatsappbot.fetch_cache import CacheEntry, fetch_cache, normalize_query, normalize_url, ttl_from_headers
+from whatsappbot.http_clients import HTTPClients, PoolConfig
+from whatsappbot.maintenance import maintenance
+from whatsappbot.metrics import CONTENT_TYPE, profiler, profiler_authorized, registry
 
 # --- Load environment variables ---
 load_dotenv()
@@ -49,6 +63,33 @@ class RichToolDescription(BaseModel):
     use_when: str
     side_effects: str | None = None
 
+# --- Shared HTTP pools: job pages and search results are separate upstreams ---
+http = HTTPClients({
+    "fetch": PoolConfig(
+        max_connections=int(os.getenv("FETCH_MAX_CONNECTIONS", "40")),
+        max_keepalive=int(os.getenv("FETCH_MAX_KEEPALIVE", "20")),
+        read_timeout=30.0,
+        follow_redirects=True,
+    ),
+    "search": PoolConfig(max_connections=10, max_keepalive=5, read_timeout=15.0),
+})
+
+# --- Upper bound on bytes read from any fetched page ---
+FETCH_MAX_BYTES = int(os.environ.get("FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# DuckDuckGo HTML endpoint; overridable so load tests can use a local fake
+SEARCH_URL = os.environ.get("SEARCH_URL", "https://html.duckduckgo.com/html/")
+
+# --- job_finder search-and-summarize limits ---
+SEARCH_FETCH_CONCURRENCY = int(os.environ.get("SEARCH_FETCH_CONCURRENCY", "5"))
+SEARCH_PER_HOST = int(os.environ.get("SEARCH_PER_HOST", "2"))
+SEARCH_DEADLINE = float(os.environ.get("SEARCH_DEADLINE", "15"))
+SUMMARY_CHARS = 400
+
+# --- Fetch cache lifetimes (seconds); responses' Cache-Control max-age wins ---
+FETCH_CACHE_TTL = float(os.environ.get("FETCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", "900"))
+
 # --- Fetch Utility Class ---
 class Fetch:
     USER_AGENT = "Puch/1.0 (Autonomous)"
@@ -60,41 +101,167 @@ class Fetch:
         user_agent: str,
         force_raw: bool = False,
     ) -> tuple[str, str]:
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    url,
-                    follow_redirects=True,
-                    headers={"User-Agent": user_agent},
-                    timeout=30,
-                )
-            except httpx.HTTPError as e:
-                raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
+        key = f"url:{'raw' if force_raw else 'md'}:{normalize_url(url)}"
+        cached = await fetch_cache.get(key)
+        if cached and cached.fresh:
+            return cached.value, cached.prefix
+
+        headers = {"User-Agent": user_agent}
+        if cached:
+            headers.update(cached.conditional_headers())
+        started = time.perf_counter()
+        try:
+            async with http.get("fetch").stream("GET", url, headers=headers) as response:
+                if cached and response.status_code == 304:
+                    stage_seconds.observe(time.perf_counter() - started, stage="network")
+                    ttl = ttl_from_headers(response.headers, FETCH_CACHE_TTL) or 0.0
+                    cached = await fetch_cache.refresh(key, cached, ttl)
+                    return cached.value, cached.prefix
+
+                if response.status_code >= 400:
+                    raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url} - status code {response.status_code}"))
+
+                # decide from the headers alone whether the body is worth reading
+                content_type = response.headers.get("content-type", "")
+                if not cls.is_textual(content_type):
+                    stage_seconds.observe(time.perf_counter() - started, stage="network")
+                    size = response.headers.get("content-length", "unknown")
+                    content, prefix = "", f"Content type {content_type} ({size} bytes) is not text and was not downloaded.\n"
+                else:
+                    page_raw, truncated = await cls.read_limited(response, FETCH_MAX_BYTES)
+                    stage_seconds.observe(time.perf_counter() - started, stage="network")
+                    is_page_html = "text/html" in content_type
+
+                    if truncated:
+                        content, prefix = (
+                            page_raw,
+                            f"Page exceeds {FETCH_MAX_BYTES} bytes; here are the first {FETCH_MAX_BYTES} bytes of raw content:\n",
+                        )
+                    elif is_page_html and not force_raw:
+                        content, prefix = await extractor.extract(page_raw), ""
+                    else:
+                        content, prefix = (
+                            page_raw,
+                            f"Content type {content_type} cannot be simplified to markdown, but here is the raw content:\n",
+                        )
+        except httpx.HTTPError as e:
+            raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
+
+        ttl = ttl_from_headers(response.headers, FETCH_CACHE_TTL)
+        if ttl is not None:
+            await fetch_cache.put(key, CacheEntry(
+                value=content,
+                prefix=prefix,
+                etag=response.headers.get("etag"),
+                last_modified=response.headers.get("last-modified"),
+                expires_at=time.time() + ttl,
+            ))
+        return content, prefix
+
+    TEXT_TYPES = ("text/", "application/json", "application/xml", "application/xhtml", "application/javascript", "+xml", "+json")
 
-            if response.status_code >= 400:
-                raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url} - status code {response.status_code}"))
+    @classmethod
+    def is_textual(cls, content_type: str) -> bool:
+        ct = content_type.split(";")[0].strip().lower()
+        return not ct or any(t in ct for t in cls.TEXT_TYPES)
 
-            page_raw = response.text
+    @staticmethod
+    async def read_limited(response: httpx.Response, max_bytes: int) -> tuple[str, bool]:
+        """Decode a streamed body incrementally, stopping at max_bytes.
 
-        content_type = response.headers.get("content-type", "")
-        is_page_html = "text/html" in content_type
+        Returns (text, truncated). Memory stays bounded by max_bytes however
+        large (or endless) the response is.
+        """
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        parts: list[str] = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            if received + len(chunk) > max_bytes:
+                parts.append(decoder.decode(chunk[:max_bytes - received], final=True))
+                return "".join(parts), True
+            received += len(chunk)
+            parts.append(decoder.decode(chunk))
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts), False
 
-        if is_page_html and not force_raw:
-            return cls.extract_content_from_html(page_raw), ""
+    @staticmethod
+    def summarize(markdown: str, max_chars: int = SUMMARY_CHARS) -> str:
+        """First heading plus the opening prose of a posting, on one line."""
+        lines = [l.strip() for l in markdown.splitlines() if l.strip()]
+        title = next((l.lstrip("# ") for l in lines if l.startswith("#")), "")
+        body = " ".join(l for l in lines if not l.startswith("#"))
+        body = re.sub(r"\[([^\]]*)\]\([^)]*\)", r"\1", body)   # [text](link) -> text
+        body = re.sub(r"[*_`>|]+", "", body)
+        body = " ".join(body.split())
+        if len(body) > max_chars:
+            body = body[:max_chars].rsplit(" ", 1)[0] + "…"
+        return f"**{title}** — {body}" if title else body
 
-        return (
-            page_raw,
-            f"Content type {content_type} cannot be simplified to markdown, but here is the raw content:\n",
-        )
+    @classmethod
+    async def search_and_summarize(
+        cls,
+        query: str,
+        num_results: int = 5,
+        deadline: float = SEARCH_DEADLINE,
+    ) -> list[tuple[str, str]]:
+        """Search, then fetch and summarize the result pages concurrently.
+
+        Pages are fetched under a global and a per-host concurrency limit and
+        returned in completion order; whatever hasn't finished by ``deadline``
+        seconds is cancelled and reported as timed out.
+        """
+        links = [l for l in await cls.Google_Search_links(query, num_results) if not l.startswith("<error>")]
+        if not links:
+            return [("(none)", "No results found.")]
+
+        overall = asyncio.Semaphore(SEARCH_FETCH_CONCURRENCY)
+        per_host: dict[str, asyncio.Semaphore] = {}
+
+        async def fetch_one(link: str) -> tuple[str, str]:
+            host = urlsplit(link).hostname or ""
+            host_slot = per_host.setdefault(host, asyncio.Semaphore(SEARCH_PER_HOST))
+            # host first, so waiting on a busy host doesn't hold a global slot
+            async with host_slot, overall:
+                try:
+                    content, _ = await cls.fetch_url(link, cls.USER_AGENT)
+                except McpError as e:
+                    return link, f"⚠️ {e.error.message}"
+                except Exception as e:
+                    # one bad page must not fail the whole search
+                    return link, f"⚠️ Failed to fetch {link}: {e!r}"
+            return link, cls.summarize(content) or "(no readable text)"
+
+        tasks = [asyncio.create_task(fetch_one(link)) for link in links]
+        results: list[tuple[str, str]] = []
+        try:
+            for next_done in asyncio.as_completed(tasks, timeout=deadline):
+                results.append(await next_done)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+        finished = {link for link, _ in results}
+        results.extend((link, f"⏱️ Timed out after {deadline:g}s.") for link in links if link not in finished)
+        return results
 
     @staticmethod
     def extract_content_from_html(html: str) -> str:
-        """Extract and convert HTML content to Markdown format."""
-        ret = readabilipy.simple_json.simple_json_from_html_string(html, use_readability=True)
-        if not ret or not ret.get("content"):
-            return "<error>Page failed to be simplified from HTML</error>"
-        content = markdownify.markdownify(ret["content"], heading_style=markdownify.ATX)
-        return content
+        """Extract and convert HTML content to Markdown format (blocking; see `extractor`)."""
+        return html_to_markdown(html)
+
+    @staticmethod
+    def result_url(href: str) -> str | None:
+        """Target of a DuckDuckGo result link. Results point at a
+        protocol-relative redirect (``//duckduckgo.com/l/?uddg=<url>&rut=...``);
+        the real URL is its ``uddg`` parameter."""
+        if href.startswith("//"):
+            href = "https:" + href
+        parts = urlsplit(href)
+        target = parse_qs(parts.query).get("uddg")
+        if target and parts.path.startswith("/l"):
+            href = target[0]
+        return href if urlsplit(href).scheme in ("http", "https") else None
 
     @staticmethod
     async def Google_Search_links(query: str, num_results: int = 5) -> list[str]:
@@ -102,29 +269,61 @@ class Fetch:
         Perform a scoped DuckDuckGo search and return a list of job posting URLs.
         (Using DuckDuckGo because Google blocks most programmatic scraping.)
         """
-        ddg_url = f"https://html.duckduckgo.com/html/?q={query.replace(' ', '+')}"
+        # v2: entries hold decoded result URLs, not DuckDuckGo redirects
+        key = f"search:v2:{num_results}:{normalize_query(query)}"
+        cached = await fetch_cache.get(key)
+        if cached and cached.fresh:
+            return json.loads(cached.value)
+
+        ddg_url = f"{SEARCH_URL}?q={query.replace(' ', '+')}"
         links = []
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(ddg_url, headers={"User-Agent": Fetch.USER_AGENT})
-            if resp.status_code != 200:
-                return ["<error>Failed to perform search.</error>"]
+        with stage_seconds.time(stage="search"):
+            resp = await http.get("search").get(ddg_url, headers={"User-Agent": Fetch.USER_AGENT})
+        if resp.status_code != 200:
+            return ["<error>Failed to perform search.</error>"]
 
         soup = BeautifulSoup(resp.text, "html.parser")
         for a in soup.find_all("a", class_="result__a", href=True):
-            href = a["href"]
-            if "http" in href:
+            href = Fetch.result_url(a["href"])
+            if href:
                 links.append(href)
             if len(links) >= num_results:
                 break
 
-        return links or ["<error>No results found.</error>"]
+        if not links:
+            return ["<error>No results found.</error>"]
+        await fetch_cache.put(key, CacheEntry(value=json.dumps(links), expires_at=time.time() + SEARCH_CACHE_TTL))
+        return links
+
+# --- Metrics ---
+tool_seconds = registry.histogram(
+    "mcp_tool_seconds", "Tool call latency, by tool and outcome (ok, error).", ("tool", "outcome"))
+tools_in_flight = registry.gauge("mcp_tools_in_flight", "Tool calls being served.")
+
+class ToolMetrics(Middleware):
+    """Times every tools/call and runs it under the slow-request profiler."""
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next):
+        tool = context.message.name
+        outcome = "error"
+        started = time.perf_counter()
+        tools_in_flight.inc()
+        try:
+            with profiler.track(f"mcp:{tool}"):
+                result = await call_next(context)
+            outcome = "ok"
+            return result
+        finally:
+            tools_in_flight.dec()
+            tool_seconds.observe(time.perf_counter() - started, tool=tool, outcome=outcome)
 
 # --- MCP Server Setup ---
 mcp = FastMCP(
     "Job Finder MCP Server",
     auth=SimpleBearerAuthProvider(TOKEN),
 )
+mcp.add_middleware(ToolMetrics())
 
 # --- Tool: validate (required by Puch) ---
 @mcp.tool
@@ -144,6 +343,7 @@ async def job_finder(
     job_description: Annotated[str | None, Field(description="Full job description text, if available.")] = None,
     job_url: Annotated[AnyUrl | None, Field(description="A URL to fetch a job description from.")] = None,
     raw: Annotated[bool, Field(description="Return raw HTML content if True")] = False,
+    summarize: Annotated[bool, Field(description="For searches: fetch the top results concurrently and summarize each posting")] = False,
 ) -> str:
     """
     Handles multiple job discovery methods: direct description, URL fetch, or freeform search query.
@@ -157,13 +357,20 @@ async def job_finder(
         )
 
     if job_url:
-        content, _ = await Fetch.fetch_url(str(job_url), Fetch.USER_AGENT, force_raw=raw)
+        content, prefix = await Fetch.fetch_url(str(job_url), Fetch.USER_AGENT, force_raw=raw)
         return (
             f"🔗 **Fetched Job Posting from URL**: {job_url}\n\n"
-            f"---\n{content.strip()}\n---\n\n"
+            f"{prefix}---\n{content.strip()}\n---\n\n"
             f"User Goal: **{user_goal}**"
         )
 
+    if ("look for" in user_goal.lower() or "find" in user_goal.lower()) and summarize:
+        results = await Fetch.search_and_summarize(user_goal)
+        return (
+            f"🔍 **Top Postings for**: _{user_goal}_\n\n" +
+            "\n\n".join(f"- {link}\n  {summary}" for link, summary in results)
+        )
+
     if "look for" in user_goal.lower() or "find" in user_goal.lower():
         links = await Fetch.Google_Search_links(user_goal)
         return (
@@ -178,54 +385,92 @@ async def job_finder(
 
 @mcp.tool(name="add_task", description="Adds a new task to the user's to-do list with a specified scope.")
 async def add_task_tool(phone: str, scope: str, text: str) -> str:
-    try:
-        task_id = add_task(phone, scope, text)
-        return f"✅ Added (#{task_id}) to {scope}: “{text}”"
-    except Exception as e:
-        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to add task: {e}"))
-
-@mcp.tool(name="list_tasks", description="Lists all open tasks for a user, optionally filtered by scope.")
-async def list_tasks_tool(phone: str, scope: Optional[str] = None) -> str:
-    try:
-        rows = list_tasks(phone, scope)
-        if not rows:
-            sc = scope or "all"
-            return f"(empty) No open tasks in {sc}."
-        else:
-            lines = [f"• #{r['id']} [{r['scope']}] {r['text']}" for r in rows]
-            return "Your tasks:\n" + "\n".join(lines)
-    except Exception as e:
-        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to list tasks: {e}"))
+    return await task_tools.add_task(phone, scope, text)
+
+@mcp.tool(name="list_tasks", description=(
+    "Lists a user's open tasks, newest first, optionally filtered by scope. Long lists are paged: "
+    "a page that ends with “older than #N” continues with cursor=N."
+))
+async def list_tasks_tool(phone: str, scope: Optional[str] = None, cursor: Optional[str] = None) -> ToolResult:
+    reply, next_cursor = await task_tools.list_tasks(phone, scope, cursor)
+    # the text for assistants; programmatic clients read the cursor from the structured part
+    return ToolResult(content=[TextContent(type="text", text=reply)],
+                      structured_content={"reply": reply, "cursor": next_cursor})
 
 @mcp.tool(name="complete_task", description="Marks a task as complete using the task ID or text.")
 async def complete_task_tool(phone: str, task_text_or_id: str) -> str:
-    try:
-        count = complete_task(phone, task_text_or_id)
-        if count:
-            return "✅ Marked done."
-        else:
-            return "Couldn’t find that task."
-    except Exception as e:
-        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to complete task: {e}"))
+    return await task_tools.complete_task(phone, task_text_or_id)
 
 @mcp.tool(name="delete_task", description="Deletes a task from the list using the task ID or text.")
 async def delete_task_tool(phone: str, task_text_or_id: str) -> str:
+    return await task_tools.delete_task(phone, task_text_or_id)
+
+@mcp.tool(name="add_tasks", description="Adds several tasks to the same scope in one batch.")
+async def add_tasks_tool(phone: str, scope: str, texts: list[str]) -> str:
+    return await task_tools.add_tasks(phone, scope, texts)
+
+@mcp.tool(name="complete_tasks", description="Marks several tasks as complete, each given by task ID or text.")
+async def complete_tasks_tool(phone: str, items: list[str]) -> str:
+    return await task_tools.complete_tasks(phone, items)
+
+@mcp.tool(name="delete_tasks", description="Deletes several tasks, each given by task ID or text.")
+async def delete_tasks_tool(phone: str, items: list[str]) -> str:
+    return await task_tools.delete_tasks(phone, items)
+
+
+# --- Stats and metrics endpoints (plain HTTP, outside the MCP protocol) ---
+@mcp.custom_route("/stats", methods=["GET"])
+async def stats(request: Request) -> JSONResponse:
+    """Cache, extractor and pool internals; guarded like the profiler."""
+    if not profiler_authorized(request.headers.get("authorization"), request.query_params.get("token")):
+        return JSONResponse({"detail": "Stats disabled or bad token"}, status_code=403)
+    return JSONResponse({
+        "db_pool": pool_stats(),
+        "task_cache": task_cache.stats(),
+        "fetch_cache": fetch_cache.stats(),
+        "extractor": extractor.stats(),
+        "maintenance": maintenance.stats(),
+        "profiler": profiler.stats(),
+    })
+
+# the /stats counters, also scraped from /metrics as gauges
+for prefix, source in (("mcp_task_cache", task_cache.stats), ("mcp_fetch_cache", fetch_cache.stats),
+                       ("mcp_extractor", extractor.stats), ("mcp_maintenance", maintenance.stats)):
+    registry.register_stats(prefix, source)
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics(request: Request) -> Response:
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+@mcp.custom_route("/debug/profiler", methods=["GET"])
+async def profiler_control(request: Request) -> JSONResponse:
+    """Switch the slow-request profiler on/off at runtime and read its captures."""
+    params = dict(request.query_params)
+    if not profiler_authorized(request.headers.get("authorization"), params.pop("token", None)):
+        return JSONResponse({"detail": "Profiler disabled or bad token"}, status_code=403)
     try:
-        count = delete_task(phone, task_text_or_id)
-        if count:
-            return "🗑️ Deleted."
-        else:
-            return "Couldn’t find that task."
-    except Exception as e:
-        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to delete task: {e}"))
+        return JSONResponse(profiler.control(params))
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
 
 
 # --- Run MCP Server ---
 async def main():
     print("🚀 Starting MCP server on http://0.0.0.0:8086")
     # Initialize the database on server startup
-    init_db()
-    await mcp.run_async("streamable-http", host="0.0.0.0", port=8086)
+    await async_db.init_db()
+    await http.start()
+    extractor.start()
+    await fetch_cache.run(fetch_cache.prune)
+    maintenance.start()
+    try:
+        await mcp.run_async("streamable-http", host="0.0.0.0", port=8086)
+    finally:
+        await maintenance.stop()
+        await http.aclose()
+        fetch_cache.close()
+        extractor.shutdown()
+        async_db.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,16 @@
+import pytest
+
+from whatsappbot import db
+from whatsappbot.cache import task_cache
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """An empty, unsharded tasks.db under tmp_path (DB_PATH)."""
+    db.close_pool()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "tasks.db")
+    monkeypatch.setattr(db, "SHARD_MAP_PATH", tmp_path / "shards.json")
+    task_cache.clear()
+    db.init_db()
+    yield tmp_path
+    db.close_pool()
+    task_cache.clear()
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+import pytest
+
+from whatsappbot import async_db, db
+
+def count(histogram, **labels):
+    """Observations recorded under ``labels``, read from the exposition lines."""
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    for line in histogram.lines():
+        if line.startswith(f"{histogram.name}_count{{{wanted}}}"):
+            return int(line.rsplit(" ", 1)[1])
+    return 0
+
+@pytest.fixture
+def executors(monkeypatch):
+    """Fresh db executors for the test, shut down afterwards."""
+    monkeypatch.setattr(async_db, "_executor", None)
+    monkeypatch.setattr(async_db, "_write_executor", None)
+    yield
+    for executor in (async_db._executor, async_db._write_executor):
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+def record_thread(threads, name):
+    def call(*args):
+        threads[name] = threading.current_thread().name
+        return []
+    call.__name__ = name
+    return call
+
+async def add_and_list():
+    await async_db.add_task("911", "today", "milk")
+    await async_db.list_tasks("911")
+
+def test_group_commit_writes_run_on_their_own_threads(executors, monkeypatch):
+    threads = {}
+    monkeypatch.setattr(db, "GROUP_COMMIT", True)
+    monkeypatch.setattr(db, "add_task", record_thread(threads, "add_task"))
+    monkeypatch.setattr(db, "list_tasks", record_thread(threads, "list_tasks"))
+    asyncio.run(add_and_list())
+    assert threads["add_task"].startswith("db-write")
+    assert threads["list_tasks"].startswith("db_")
+    assert async_db.get_write_executor() is not async_db.get_executor()
+
+def test_without_group_commit_writes_share_the_read_threads(executors, monkeypatch):
+    threads = {}
+    monkeypatch.setattr(db, "GROUP_COMMIT", False)
+    monkeypatch.setattr(db, "add_task", record_thread(threads, "add_task"))
+    monkeypatch.setattr(db, "list_tasks", record_thread(threads, "list_tasks"))
+    asyncio.run(add_and_list())
+    assert threads["add_task"].startswith("db_")
+    assert async_db.get_write_executor() is async_db.get_executor()
+
+def test_calls_record_queue_wait_and_query_time(executors, monkeypatch):
+    monkeypatch.setattr(db, "GROUP_COMMIT", True)
+    monkeypatch.setattr(db, "add_task", record_thread({}, "add_task"))
+    monkeypatch.setattr(db, "list_tasks", record_thread({}, "list_tasks"))
+    before = {
+        "read": count(async_db.queue_wait_seconds, pool="read"),
+        "write": count(async_db.queue_wait_seconds, pool="write"),
+        "add_task": count(async_db.query_seconds, op="add_task"),
+        "list_tasks": count(async_db.query_seconds, op="list_tasks"),
+    }
+    asyncio.run(add_and_list())
+    assert count(async_db.queue_wait_seconds, pool="read") == before["read"] + 1
+    assert count(async_db.queue_wait_seconds, pool="write") == before["write"] + 1
+    assert count(async_db.query_seconds, op="add_task") == before["add_task"] + 1
+    assert count(async_db.query_seconds, op="list_tasks") == before["list_tasks"] + 1
+
+def test_failing_call_is_still_timed(executors):
+    def broken():
+        raise RuntimeError("disk on fire")
+    before = count(async_db.query_seconds, op="broken")
+    with pytest.raises(RuntimeError):
+        asyncio.run(async_db.run(broken))
+    assert count(async_db.query_seconds, op="broken") == before + 1
@@ -0,0 +1,74 @@
+import asyncio
+import os
+
+from whatsappbot import db, mcp_client
+from whatsappbot.backends import DirectBackend, InProcessBackend, MCPBackend
+from whatsappbot.cache import task_cache
+from whatsappbot.mcp_testserver import TEST_TOKEN, local_mcp_server
+
+PHONE = "919800000001"
+
+async def script(backend):
+    """The same intents a user would send, in order; returns every reply."""
+    return [
+        await backend.add_task(PHONE, "today", "buy milk"),
+        await backend.add_tasks(PHONE, "week", ["file taxes", "call mom", "book flights"]),
+        await backend.list_tasks(PHONE),
+        await backend.complete_task(PHONE, "buy milk"),
+        await backend.delete_task(PHONE, "2"),
+        await backend.list_tasks(PHONE, "week"),
+        await backend.complete_tasks(PHONE, ["call mom", "no such task"]),
+        await backend.delete_tasks(PHONE, ["4"]),
+        await backend.add_task(PHONE, "today", "water plants"),
+        await backend.list_tasks(PHONE),
+        await backend.complete_task(PHONE, "buy milk"),
+    ]
+
+def fresh_db(tmp_path, name):
+    db.close_pool()
+    task_cache.clear()
+    db.DB_PATH = tmp_path / name / "tasks.db"
+    db.DB_PATH.parent.mkdir()
+    db.init_db()
+
+async def run_mcp(monkeypatch):
+    async with local_mcp_server() as url:
+        monkeypatch.setenv("MCP_SERVER_URL", url)
+        monkeypatch.setenv("MCP_AUTH_TOKEN", TEST_TOKEN)
+        backend = MCPBackend()
+        try:
+            return await script(backend)
+        finally:
+            await backend.close()
+
+def test_backends_return_the_same_replies(tmp_db, monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", TEST_TOKEN)
+    monkeypatch.setattr(mcp_client, "_client", None)
+    monkeypatch.setattr(db, "DB_PATH", db.DB_PATH)
+    results = {}
+    fresh_db(tmp_db, "direct")
+    results["direct"] = asyncio.run(script(DirectBackend()))
+    fresh_db(tmp_db, "inprocess")
+    results["inprocess"] = asyncio.run(script(InProcessBackend()))
+    fresh_db(tmp_db, "mcp")
+    results["mcp"] = asyncio.run(run_mcp(monkeypatch))
+
+    assert results["inprocess"] == results["direct"]
+    assert results["mcp"] == results["direct"]
+    reply, cursor = results["direct"][-2]
+    assert "water plants" in reply and "buy milk" not in reply and cursor is None
+
+def test_local_server_restores_db_path_and_env(tmp_db, monkeypatch):
+    monkeypatch.delenv("AUTH_TOKEN", raising=False)
+    monkeypatch.setenv("MY_NUMBER", "910000000000")
+    path = db.DB_PATH
+
+    async def serve():
+        async with local_mcp_server(tmp_db / "server.db"):
+            assert db.DB_PATH == tmp_db / "server.db"
+            assert os.environ["AUTH_TOKEN"] == TEST_TOKEN
+
+    asyncio.run(serve())
+    assert db.DB_PATH == path
+    assert "AUTH_TOKEN" not in os.environ
+    assert os.environ["MY_NUMBER"] == "910000000000"
@@ -0,0 +1,31 @@
+from whatsappbot import db, replies
+from whatsappbot.cache import MISS, LRUCache, task_cache
+
+def test_version_mismatch_is_a_miss():
+    cache = LRUCache()
+    cache.set(("p", "k"), "v", cache.generation("p"), version=1)
+    assert cache.get(("p", "k"), 1) == "v"
+    assert cache.get(("p", "k"), 2) is MISS
+    assert cache.get(("p", "k"), 1) is MISS   # the stale entry was dropped
+    assert cache.stats()["stale"] == 1
+
+def test_write_from_another_process_invalidates(tmp_db, monkeypatch):
+    db.add_task("p1", "today", "buy milk")
+    first, _ = replies.task_list_reply("p1", "today")
+    assert "buy milk" in first
+    assert replies.task_list_reply("p1", "today") == (first, None)
+
+    # another process writes: the shared version moves, this cache isn't told
+    monkeypatch.setattr(task_cache, "invalidate", lambda phone: None)
+    db.add_task("p1", "today", "call mom")
+    assert "call mom" in replies.task_list_reply("p1", "today")[0]
+    assert "call mom" in "".join(r["text"] for r in db.list_tasks("p1", "today"))
+
+def test_one_lookup_per_list_request(tmp_db):
+    db.add_task("p1", "today", "buy milk")
+    before = task_cache.stats()
+    replies.task_list_reply("p1")
+    replies.task_list_reply("p1")
+    after = task_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bench.fakes import webhook_payload
+from whatsappbot import db, main
+from whatsappbot.dedupe import MessageDeduper
+
+def delivery(*messages):
+    """One webhook delivery carrying ``messages``, given as (phone, id) pairs."""
+    body = webhook_payload(messages[0][0], "show today", messages[0][1])
+    body["entry"][0]["changes"][0]["value"]["messages"] = [
+        {"from": phone, "id": msg_id, "type": "text", "text": {"body": "show today"}}
+        for phone, msg_id in messages
+    ]
+    return body
+
+class FakeQueue:
+    def __init__(self):
+        self.items = []
+        self.full = False
+
+    async def submit(self, key, msg):
+        if self.full:
+            return False
+        self.items.append(msg["id"])
+        return True
+
+@pytest.fixture
+def queued(tmp_db, monkeypatch):
+    """What the webhook hands to the work queue (a fresh deduper per test)."""
+    queue = FakeQueue()
+    monkeypatch.setattr(main, "deduper", MessageDeduper())
+    monkeypatch.setattr(main.work_queue, "submit", queue.submit)
+    return queue
+
+def test_filter_new_drops_redeliveries(tmp_db):
+    deduper = MessageDeduper()
+    assert asyncio.run(deduper.filter_new(["a", "b"])) == ["a", "b"]
+    assert asyncio.run(deduper.filter_new(["b", "c"])) == ["c"]
+    assert deduper.memory_hits == 1
+    # a restarted process has an empty memory and falls back to the table
+    restarted = MessageDeduper()
+    assert asyncio.run(restarted.filter_new(["a", "d"])) == ["d"]
+    assert restarted.db_hits == 1
+
+def test_filter_new_claims_a_repeated_id_once(tmp_db):
+    assert asyncio.run(MessageDeduper().filter_new(["a", "a", "b"])) == ["a", "b"]
+
+def test_webhook_queues_each_message_once(queued):
+    client = TestClient(main.app)
+    body = delivery(("911", "wamid.1"), ("911", "wamid.1"), ("912", "wamid.2"))
+    assert client.post("/wa/webhook", json=body).status_code == 200
+    assert queued.items == ["wamid.1", "wamid.2"]
+    assert client.post("/wa/webhook", json=body).status_code == 200
+    assert queued.items == ["wamid.1", "wamid.2"]
+
+def test_busy_webhook_releases_ids_for_redelivery(queued):
+    client = TestClient(main.app)
+    body = delivery(("911", "wamid.3"), ("912", "wamid.4"))
+    queued.full = True
+    assert client.post("/wa/webhook", json=body).status_code == 503
+    assert main.deduper.released == 2
+    with db.get_conn() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM processed_messages").fetchone()[0] == 0
+    queued.full = False
+    assert client.post("/wa/webhook", json=body).status_code == 200
+    assert queued.items == ["wamid.3", "wamid.4"]
@@ -0,0 +1,86 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from whatsappbot import db
+from whatsappbot.digests import DigestSchedule, DigestScheduler
+
+PHONES = [f"91{i:08d}" for i in range(25)]
+
+def seed(phones, heard_from=True):
+    for phone in phones:
+        db.add_task(phone, "today", f"task for {phone}")
+    if heard_from:
+        db.claim_message_ids([f"wamid.{p}" for p in phones], {f"wamid.{p}": p for p in phones})
+
+def scheduler(sent, fail=()):
+    async def send(phone, body):
+        if phone in fail:
+            raise RuntimeError("upstream down")
+        sent.append(phone)
+        return [{"messages": [{"id": "wamid.x"}]}]
+    return DigestScheduler(send, [DigestSchedule("today", "08:00")], batch=10, rate=10000.0)
+
+def test_run_sends_each_user_once(tmp_db):
+    seed(PHONES)
+    sent = []
+    result = asyncio.run(scheduler(sent).run("today", "today:2026-10-16:a"))
+    assert sorted(sent) == PHONES
+    assert (result["claimed"], result["sent"], result["failed"], result["unsent"]) == (25, 25, 0, 0)
+
+    again = []
+    asyncio.run(scheduler(again).run("today", "today:2026-10-16:a"))
+    assert again == []
+    run = db.get_digest_run("today:2026-10-16:a")
+    assert (run["claimed"], run["sent"], run["unsent"]) == (25, 25, 0)
+
+def test_run_skips_users_outside_the_window_and_counts_failures(tmp_db):
+    seed(PHONES[:20])
+    seed(PHONES[20:], heard_from=False)
+    sent = []
+    result = asyncio.run(scheduler(sent, fail={PHONES[0]}).run("today", "today:2026-10-16:b"))
+    assert sorted(sent) == PHONES[1:20]
+    assert (result["sent"], result["failed"], result["skipped"]) == (19, 1, 5)
+    assert db.list_dead_letters() == []
+
+def test_crash_mid_batch_leaves_the_batch_on_record(tmp_db):
+    seed(PHONES)
+    first = []
+
+    async def crash(phone, body):
+        if len(first) == 12:
+            raise asyncio.CancelledError
+        first.append(phone)
+        return [{}]
+
+    digests = scheduler([])
+    digests.send = crash
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(digests.run("today", "today:2026-10-16:c"))
+    run = db.get_digest_run("today:2026-10-16:c")
+    assert (run["claimed"], run["sent"], run["unsent"]) == (20, 10, 10)
+    [claim] = db.unsent_digest_claims("today:2026-10-16:c")
+    assert (claim["after_phone"], claim["last_phone"], claim["users"]) == (PHONES[9], PHONES[19], 10)
+
+    resumed = []
+    result = asyncio.run(scheduler(resumed).run("today", "today:2026-10-16:c"))
+    assert resumed == PHONES[20:]
+    assert result["unsent"] == 10
+
+def test_claim_is_compare_and_swap(tmp_db):
+    db.start_digest_run("today:x", "today")
+    assert db.claim_digest_batch("today:x", "tasks.db", "", PHONES[9], 10)
+    # a second process still holding the old cursor loses the race
+    assert not db.claim_digest_batch("today:x", "tasks.db", "", PHONES[4], 5)
+    assert db.digest_cursor("today:x", "tasks.db") == PHONES[9]
+    assert db.claim_digest_batch("today:x", "tasks.db", PHONES[9], PHONES[19], 10)
+    assert db.get_digest_run("today:x")["claimed"] == 20
+
+def test_monthly_schedule_clamps_to_month_end():
+    schedule = DigestSchedule("month", "31 08:00")
+    key, due = schedule.period(datetime(2026, 2, 10, 12, 0))
+    assert key == "2026-02"
+    assert due == datetime(2026, 2, 28, 8, 0)
+    assert schedule.next_due(datetime(2026, 2, 28, 9, 0)) == datetime(2026, 3, 31, 8, 0)
+    assert schedule.next_due(datetime(2026, 4, 1)) == datetime(2026, 4, 30, 8, 0)
@@ -0,0 +1,70 @@
+import asyncio
+import time
+
+from whatsappbot import extract
+from whatsappbot.extract import Extractor
+
+PAGE = "<html><body><nav>menu</nav><p>Senior Python engineer</p></body></html>"
+
+def convert(html):
+    """Stands in for html_to_markdown_timed in the worker processes."""
+    if "stuck" in html:
+        time.sleep(60)
+    if "steady" in html:
+        time.sleep(0.4)
+    return "markdown", 0.0, 0.0
+
+def run(extractor, *pages):
+    async def go():
+        try:
+            return await asyncio.gather(*(extractor.extract(p) for p in pages))
+        finally:
+            extractor.shutdown()
+    return asyncio.run(go())
+
+def test_extracts_in_a_worker(monkeypatch):
+    monkeypatch.setattr(extract, "html_to_markdown_timed", convert)
+    extractor = Extractor(workers=1)
+    assert run(extractor, PAGE) == ["markdown"]
+    assert extractor.completed == 1
+
+def test_timeout_falls_back_and_spares_other_workers(monkeypatch):
+    monkeypatch.setattr(extract, "html_to_markdown_timed", convert)
+    extractor = Extractor(workers=2, timeout=0.6)
+
+    async def go():
+        async def later():
+            await asyncio.sleep(0.4)   # still running when the stuck one is stopped
+            return await extractor.extract("<p>steady</p>")
+        try:
+            return await asyncio.gather(extractor.extract("<p>stuck</p>"), later())
+        finally:
+            extractor.shutdown()
+    stuck, steady = asyncio.run(go())
+    assert stuck == "stuck"          # html_to_text of the page
+    assert steady == "markdown"
+    assert (extractor.timeouts, extractor.errors, extractor.replaced) == (1, 0, 1)
+
+def test_replaced_worker_serves_the_next_page(monkeypatch):
+    monkeypatch.setattr(extract, "html_to_markdown_timed", convert)
+    extractor = Extractor(workers=1, timeout=0.5)
+
+    async def go():
+        try:
+            first = await extractor.extract("<p>stuck</p>")
+            return first, await extractor.extract(PAGE)
+        finally:
+            extractor.shutdown()
+    assert asyncio.run(go()) == ("stuck", "markdown")
+
+def test_oversized_page_uses_the_text_fallback():
+    extractor = Extractor(workers=1, max_bytes=len(PAGE) - 1)
+    assert run(extractor, PAGE) == ["menu\nSenior Python engineer"]
+    assert (extractor.too_large, extractor.completed) == (1, 0)
+
+def test_sheds_when_the_queue_is_full(monkeypatch):
+    monkeypatch.setattr(extract, "html_to_markdown_timed", convert)
+    extractor = Extractor(workers=1, max_queue=1)
+    queued, shed = run(extractor, "<p>steady</p>", "<p>extra</p>")
+    assert (queued, shed) == ("markdown", "extra")
+    assert (extractor.shed, extractor.completed) == (1, 1)
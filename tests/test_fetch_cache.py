@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from whatsappbot.fetch_cache import CacheEntry, FetchCache, normalize_query, normalize_url, ttl_from_headers
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "fetch_cache.db"
+
+def test_normalize_url():
+    assert normalize_url(" HTTPS://Jobs.Example.COM:443/post?b=2&a=1#apply ") == \
+        "https://jobs.example.com/post?a=1&b=2"
+    assert normalize_url("http://example.com") == "http://example.com/"
+    assert normalize_url("http://example.com:8080/x?q=") == "http://example.com:8080/x?q="
+    assert normalize_query("  Python   JOBS ") == "python jobs"
+
+@pytest.mark.parametrize("cache_control, ttl", [
+    (None, 3600.0),
+    ("max-age=60", 60.0),
+    ("public, max-age=60", 60.0),
+    ("no-cache", 0.0),
+    ("no-cache, max-age=60", 0.0),
+    ("no-store", None),
+    ("private, max-age=60", None),
+    ("s-maxage=60", 3600.0),
+])
+def test_ttl_from_headers(cache_control, ttl):
+    headers = {"cache-control": cache_control} if cache_control else {}
+    assert ttl_from_headers(headers, 3600.0) == ttl
+
+def test_memory_then_disk_then_stale(cache_path):
+    async def scenario():
+        cache = FetchCache(cache_path, max_entries=1)
+        await cache.put("a", CacheEntry("A", expires_at=time.time() + 60))
+        await cache.put("b", CacheEntry("B", etag='"v1"', expires_at=time.time() - 1))
+        # "a" was evicted from memory by "b", so it comes from disk
+        assert (await cache.get("a")).value == "A"
+        assert (await cache.get("a")).value == "A"
+        stale = await cache.get("b")
+        assert not stale.fresh and stale.conditional_headers() == {"If-None-Match": '"v1"'}
+        assert await cache.get("missing") is None
+        stats = cache.stats()
+        cache.close()
+        # a new process sees the disk tier
+        restarted = FetchCache(cache_path)
+        assert (await restarted.get("a")).value == "A"
+        restarted.close()
+        return stats
+    stats = asyncio.run(scenario())
+    assert (stats["disk_hits"], stats["memory_hits"], stats["stale"], stats["misses"]) == (1, 1, 1, 1)
+
+def test_refresh_extends_a_stale_entry(cache_path):
+    async def scenario():
+        cache = FetchCache(cache_path)
+        await cache.put("a", CacheEntry("A", etag='"v1"', expires_at=time.time() - 1))
+        await cache.refresh("a", await cache.get("a"), 60)
+        cache.close()
+        restarted = FetchCache(cache_path)
+        entry = await restarted.get("a")
+        restarted.close()
+        return entry, cache.revalidated
+    entry, revalidated = asyncio.run(scenario())
+    assert entry.fresh and entry.value == "A" and revalidated == 1
+
+def test_prune_keeps_entries_within_the_revalidation_window(cache_path):
+    async def scenario():
+        cache = FetchCache(cache_path)
+        await cache.put("recent", CacheEntry("R", expires_at=time.time() - 60))
+        await cache.put("ancient", CacheEntry("X", expires_at=time.time() - 365 * 86400))
+        pruned = await cache.run(cache.prune)
+        cache.close()
+        return pruned
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,58 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+from whatsappbot.group_commit import GroupCommitter
+
+@pytest.fixture
+def committer(tmp_path):
+    path = tmp_path / "gc.db"
+    setup = sqlite3.connect(path)
+    setup.execute("CREATE TABLE t (x INTEGER)")
+    setup.commit()
+    setup.close()
+
+    @contextmanager
+    def connection():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            yield conn
+        finally:
+            conn.close()
+    c = GroupCommitter(connection, window=0.001)
+    yield c
+    c.close()
+
+def insert(conn, x):
+    return conn.execute("INSERT INTO t (x) VALUES (?)", (x,)).rowcount
+
+def test_failing_op_is_rolled_back_alone(committer):
+    ok = committer.submit(insert, (1,))
+    bad = committer.submit(lambda conn: conn.execute("INSERT INTO missing VALUES (1)"))
+    assert ok.result(5) == 1
+    with pytest.raises(sqlite3.OperationalError):
+        bad.result(5)
+
+def test_submit_after_close_fails_fast(committer):
+    assert committer.submit(insert, (1,)).result(5) == 1
+    committer.close()
+    with pytest.raises(RuntimeError):
+        committer.submit(insert, (2,)).result(1)
+
+def test_close_fails_writes_the_writer_never_reached(committer):
+    started, release = threading.Event(), threading.Event()
+
+    def block(conn):
+        started.set()
+        release.wait(5)
+        return 1
+    first = committer.submit(block)
+    started.wait(5)
+    queued = committer.submit(insert, (3,))   # lands in a later batch
+    committer.close(timeout=0.05)             # writer is still stuck on the first batch
+    with pytest.raises(RuntimeError):
+        queued.result(1)
+    release.set()
+    assert first.result(5) == 1
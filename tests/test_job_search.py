@@ -0,0 +1,132 @@
+import asyncio
+import importlib
+import os
+
+import httpx
+import pytest
+
+from whatsappbot.fetch_cache import FetchCache
+
+@pytest.fixture(scope="module")
+def starter():
+    os.environ.setdefault("AUTH_TOKEN", "test-token")
+    os.environ.setdefault("MY_NUMBER", "910000000000")
+    return importlib.import_module("mcp_starter")
+
+class FakeWeb:
+    """httpx MockTransport handler: records requests, answers with ``handler``."""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.handler = None
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        return self.handler(request)
+
+@pytest.fixture
+def web(starter, tmp_path, monkeypatch):
+    """Route the server's fetches to a FakeWeb, with an empty fetch cache."""
+    fake = FakeWeb(FetchCache(tmp_path / "fetch_cache.db"))
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    monkeypatch.setattr(starter.http, "get", lambda name: client)
+    monkeypatch.setattr(starter, "fetch_cache", fake.cache)
+    yield fake
+    fake.cache.close()
+    asyncio.run(client.aclose())
+
+def fetch(starter, url, force_raw=False):
+    return asyncio.run(starter.Fetch.fetch_url(url, "test-agent", force_raw=force_raw))
+
+def test_result_url_decodes_duckduckgo_redirects(starter):
+    href = "//duckduckgo.com/l/?uddg=https%3A%2F%2Fjobs.example.com%2Fpost%3Fid%3D7&rut=abc"
+    assert starter.Fetch.result_url(href) == "https://jobs.example.com/post?id=7"
+    assert starter.Fetch.result_url("https://example.com/a") == "https://example.com/a"
+    assert starter.Fetch.result_url("/html/?q=next") is None
+
+def test_one_failing_link_does_not_fail_the_search(starter, monkeypatch):
+    links = ["https://a.example/1", "https://b.example/2"]
+
+    async def search(query, num_results=5):
+        return links
+
+    async def fetch_url(url, user_agent, force_raw=False):
+        if url == links[0]:
+            raise UnicodeDecodeError("utf-8", b"", 0, 1, "bad")
+        return "# Engineer\nBuild things.", ""
+
+    monkeypatch.setattr(starter.Fetch, "Google_Search_links", staticmethod(search))
+    monkeypatch.setattr(starter.Fetch, "fetch_url", staticmethod(fetch_url))
+    results = dict(asyncio.run(starter.Fetch.search_and_summarize("python jobs")))
+    assert results[links[0]].startswith("⚠️")
+    assert "Build things." in results[links[1]]
+
+def test_no_cache_response_is_revalidated_with_its_etag(starter, web):
+    def handler(request):
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"cache-control": "max-age=60"})
+        return httpx.Response(200, text="hello", headers={
+            "content-type": "text/plain", "etag": '"v1"', "cache-control": "no-cache"})
+    web.handler = handler
+    url = "https://jobs.example/post.txt"
+    first = fetch(starter, url)
+    assert "hello" in first[0]
+    assert fetch(starter, url) == first          # stale: revalidated, 304
+    assert fetch(starter, url) == first          # fresh for 60 s: no request
+    assert [r.headers.get("if-none-match") for r in web.requests] == [None, '"v1"']
+    assert web.cache.revalidated == 1
+
+def test_private_response_is_not_cached(starter, web):
+    web.handler = lambda request: httpx.Response(200, text="mine", headers={
+        "content-type": "text/plain", "cache-control": "private, max-age=600"})
+    fetch(starter, "https://jobs.example/me.txt")
+    fetch(starter, "https://jobs.example/me.txt")
+    assert len(web.requests) == 2
+    assert web.cache.stores == 0
+
+class Body(httpx.AsyncByteStream):
+    """A response body that records how much of it was read and whether it was closed."""
+
+    def __init__(self, chunk: bytes, count: int):
+        self.chunk, self.count = chunk, count
+        self.sent = 0
+        self.closed = False
+
+    async def __aiter__(self):
+        for _ in range(self.count):
+            self.sent += 1
+            yield self.chunk
+
+    async def aclose(self):
+        self.closed = True
+
+def test_oversized_page_is_truncated_at_the_byte_budget(starter, web, monkeypatch):
+    monkeypatch.setattr(starter, "FETCH_MAX_BYTES", 2500)
+    body = Body(b"x" * 1000, 1000)
+    web.handler = lambda request: httpx.Response(200, headers={"content-type": "text/plain"}, stream=body)
+    content, prefix = fetch(starter, "https://jobs.example/huge.txt")
+    assert content == "x" * 2500
+    assert prefix.startswith("Page exceeds 2500 bytes")
+    # stopped at the third chunk and hung up instead of draining the rest
+    assert body.sent == 3
+    assert body.closed
+
+def test_non_text_content_is_not_downloaded(starter, web):
+    body = Body(b"\x89PNG" * 256, 100)
+    web.handler = lambda request: httpx.Response(
+        200, headers={"content-type": "image/png", "content-length": "102400"}, stream=body)
+    content, prefix = fetch(starter, "https://jobs.example/logo.png")
+    assert content == ""
+    assert prefix == "Content type image/png (102400 bytes) is not text and was not downloaded.\n"
+    assert body.sent == 0
+    assert body.closed
+
+def test_page_within_the_budget_is_read_whole(starter, web, monkeypatch):
+    monkeypatch.setattr(starter, "FETCH_MAX_BYTES", 2500)
+    body = Body("é".encode() * 500, 2)
+    web.handler = lambda request: httpx.Response(
+        200, headers={"content-type": "text/plain; charset=utf-8"}, stream=body)
+    content, prefix = fetch(starter, "https://jobs.example/post.txt")
+    assert content == "é" * 1000
+    assert not prefix.startswith("Page exceeds")
@@ -0,0 +1,67 @@
+import pytest
+
+from whatsappbot import db
+from whatsappbot.cache import task_cache
+
+PHONE = "911"
+
+def open_texts(phone=PHONE):
+    return sorted(r["text"] for r in db.list_tasks(phone))
+
+@pytest.fixture
+def no_fts5(tmp_path, monkeypatch):
+    """A fresh tasks.db on a build without FTS5."""
+    db.close_pool()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "tasks.db")
+    monkeypatch.setattr(db, "SHARD_MAP_PATH", tmp_path / "shards.json")
+    monkeypatch.setattr(db, "fts5_available", lambda conn: False)
+    task_cache.clear()
+    db.init_db()
+    yield tmp_path
+    db.close_pool()
+    task_cache.clear()
+
+def test_fts_query_prefixes_words_and_scopes_to_phone():
+    assert db.fts_query(PHONE, 'Buy "milk"!') == 'phone : "911" AND text : ("buy"* "milk"*)'
+    assert db.fts_query(PHONE, "!!") is None
+
+def test_match_ranks_the_best_open_candidate(tmp_db):
+    db.add_task(PHONE, "today", "milk")
+    long_id = db.add_task(PHONE, "today", "buy oat milk at the big store on main street")
+    db.complete_task(PHONE, str(db.add_task(PHONE, "today", "milk the cow")))
+    db.add_task("912", "today", "milk")
+    assert db.match_task(PHONE, "milk")["text"] == "milk"
+    assert db.match_task(PHONE, "oat mil")["id"] == long_id
+    # finished tasks and other users' tasks are never candidates
+    assert db.match_task(PHONE, "cow") is None
+    db.delete_task(PHONE, "milk")
+    assert db.match_task(PHONE, "milk")["id"] == long_id
+
+def test_text_match_changes_one_task(tmp_db):
+    db.add_tasks(PHONE, "today", ["buy milk", "buy milk", "buy bread"])
+    assert db.complete_task(PHONE, "milk") == 1
+    assert open_texts() == ["buy bread", "buy milk"]
+    db.add_task(PHONE, "week", "buy milk")
+    assert db.delete_task(PHONE, "milk") == 1
+    assert open_texts() == ["buy bread", "buy milk"]
+    assert db.delete_tasks(PHONE, ["milk", "bread"]) == 2
+    assert open_texts() == []
+    assert db.complete_task(PHONE, "milk") == 0
+
+def test_like_fallback_without_fts5(no_fts5):
+    with db.get_conn() as conn:
+        assert conn.execute("SELECT 1 FROM sqlite_master WHERE name='tasks_fts'").fetchone() is None
+    older = db.add_task(PHONE, "today", "call mom")
+    newer = db.add_task(PHONE, "today", "call mom about dinner")
+    assert db.match_task(PHONE, "call mom")["id"] == newer
+    assert db.complete_task(PHONE, "mom") == 1
+    assert [r["id"] for r in db.list_tasks(PHONE)] == [older]
+    assert db.match_task(PHONE, "dinner") is None
+
+def test_fts_detection_is_reset_with_the_pool(tmp_db):
+    db._fts_enabled = False   # as left by a previous file without FTS5
+    db.close_pool()
+    assert db._fts_enabled is None
+    with db.get_conn(PHONE) as conn:
+        sql, _ = db._match_sql(conn, PHONE, "plants")
+    assert "tasks_fts" in sql
@@ -0,0 +1,38 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from whatsappbot.mcp_client import MCPClient, MCPError
+
+def make_client(fail_first_call: Exception) -> "tuple[MCPClient, list]":
+    tool_calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        message = json.loads(request.content)
+        if message["method"] == "initialize":
+            return httpx.Response(200, headers={"mcp-session-id": "s1"},
+                                  json={"jsonrpc": "2.0", "id": message["id"], "result": {}})
+        if "id" not in message:
+            return httpx.Response(202)
+        tool_calls.append(message)
+        if len(tool_calls) == 1:
+            raise fail_first_call
+        return httpx.Response(200, json={"jsonrpc": "2.0", "id": message["id"], "result": {
+            "content": [{"type": "text", "text": "✅ Added"}]}})
+
+    client = MCPClient("http://mcp.test/mcp", "token")
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, tool_calls
+
+def test_connect_error_is_retried():
+    client, tool_calls = make_client(httpx.ConnectError("refused"))
+    assert asyncio.run(client.add_task("p1", "today", "milk")) == "✅ Added"
+    assert len(tool_calls) == 2
+
+def test_read_timeout_is_not_retried():
+    client, tool_calls = make_client(httpx.ReadTimeout("slow"))
+    with pytest.raises(MCPError):
+        asyncio.run(client.add_task("p1", "today", "milk"))
+    assert len(tool_calls) == 1
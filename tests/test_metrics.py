@@ -0,0 +1,59 @@
+import importlib
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from whatsappbot import main, metrics
+from whatsappbot.metrics import MIN_INTERVAL, Registry, SlowRequestProfiler
+
+@pytest.mark.parametrize("params", [{"threshold_ms": "abc"}, {"interval_ms": "fast"},
+                                    {"threshold_ms": "-5"}, {"interval_ms": "nan"}])
+def test_control_rejects_bad_values_without_changing_state(params):
+    profiler = SlowRequestProfiler(threshold=1.0, interval=0.005)
+    with pytest.raises(ValueError):
+        profiler.control({"enable": "true", **params})
+    assert not profiler.enabled
+    assert (profiler.threshold, profiler.interval) == (1.0, 0.005)
+
+def test_interval_is_clamped():
+    profiler = SlowRequestProfiler(interval=0)
+    assert profiler.interval == MIN_INTERVAL
+    state = profiler.control({"interval_ms": "0", "threshold_ms": "250"})
+    assert profiler.interval == MIN_INTERVAL
+    assert state["threshold_ms"] == 250.0
+
+def test_profiler_endpoint_returns_400_on_bad_params(monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILER_TOKEN", "secret")
+    client = TestClient(main.app)
+    response = client.get("/debug/profiler", params={"token": "secret", "interval_ms": "soon"})
+    assert response.status_code == 400
+    assert "interval_ms" in response.json()["detail"]
+    assert client.get("/debug/profiler", params={"token": "secret"}).status_code == 200
+
+def test_stats_needs_the_profiler_token(monkeypatch):
+    client = TestClient(main.app)
+    assert client.get("/stats").status_code == 403          # no PROFILER_TOKEN: off
+    monkeypatch.setattr(metrics, "PROFILER_TOKEN", "secret")
+    assert client.get("/stats", params={"token": "wrong"}).status_code == 403
+    response = client.get("/stats", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert "work_queue" in response.json()
+
+def test_mcp_stats_needs_the_profiler_token(monkeypatch):
+    monkeypatch.setenv("AUTH_TOKEN", os.environ.get("AUTH_TOKEN", "test-token"))
+    monkeypatch.setenv("MY_NUMBER", os.environ.get("MY_NUMBER", "910000000000"))
+    starter = importlib.import_module("mcp_starter")
+    client = TestClient(starter.mcp.http_app())
+    assert client.get("/stats").status_code == 403
+    monkeypatch.setattr(metrics, "PROFILER_TOKEN", "secret")
+    response = client.get("/stats", params={"token": "secret"})
+    assert response.status_code == 200
+    assert "fetch_cache" in response.json()
+
+def test_register_stats_excludes_fields():
+    registry = Registry()
+    registry.register_stats("out", lambda: {"in_flight": 2, "sent": 5}, exclude=("in_flight",))
+    rendered = registry.render()
+    assert "out_sent 5" in rendered
+    assert "out_in_flight" not in rendered
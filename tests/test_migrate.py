@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+from whatsappbot import db
+from whatsappbot.cache import task_cache
+
+# tasks.db as the first release created it
+BASELINE_SCHEMA = """
+    CREATE TABLE tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        phone TEXT NOT NULL,
+        scope TEXT NOT NULL,
+        text  TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'open',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_tasks_phone ON tasks(phone);
+    CREATE INDEX idx_tasks_phone_status ON tasks(phone, status);
+"""
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    """A baseline-schema tasks.db with a few open and done tasks, not yet migrated."""
+    db.close_pool()
+    path = tmp_path / "tasks.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        "INSERT INTO tasks (phone, scope, text, status, created_at) VALUES (?, ?, ?, ?, ?)",
+        [("911", "today", "buy milk", "open", "2026-01-01 09:00:00"),
+         ("911", "today", "call mom", "done", "2026-01-02 09:00:00"),
+         ("912", "week", "file taxes", "open", "2026-01-03 09:00:00")],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, "DB_PATH", path)
+    monkeypatch.setattr(db, "SHARD_MAP_PATH", tmp_path / "shards.json")
+    task_cache.clear()
+    yield path
+    db.close_pool()
+    task_cache.clear()
+
+def test_migrate_baseline_file(baseline_db):
+    db.init_db()
+    with db.get_conn() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION == 1
+        rows = {r["text"]: r for r in conn.execute("SELECT * FROM tasks")}
+        assert rows["call mom"]["completed_at"] == "2026-01-02 09:00:00"
+        assert rows["buy milk"]["completed_at"] is None
+        indexes = {r["name"] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        assert "idx_tasks_open" in indexes
+        assert not indexes & {"idx_tasks_phone", "idx_tasks_phone_status"}
+        plan = " ".join(r["detail"] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM tasks WHERE phone=? AND status='open' ORDER BY id DESC",
+            ("911",)))
+        assert "idx_tasks_open" in plan
+    assert [r["text"] for r in db.list_tasks("911")] == ["buy milk"]
+
+def test_migrate_leaves_the_full_vacuum_to_an_explicit_step(baseline_db):
+    db.init_db()
+    with db.get_conn() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    assert db.full_vacuum_pending() == [baseline_db]
+    assert db.enable_incremental_vacuum() == [baseline_db]
+    with db.get_conn() as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert db.full_vacuum_pending() == []
+    # a second startup is a no-op
+    db.close_pool()
+    db.init_db()
+    with db.get_conn() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+
+def test_new_file_starts_incremental(tmp_db):
+    assert db.full_vacuum_pending() == []
+
+def test_archive_done_tasks(tmp_db):
+    old, recent, open_id = (db.add_task("911", "today", t) for t in ("old", "recent", "open"))
+    db.complete_tasks("911", [str(old), str(recent)])
+    with db.get_conn() as conn:
+        conn.execute("UPDATE tasks SET completed_at = datetime('now', '-40 days') WHERE id=?", (old,))
+        conn.commit()
+    assert db.archive_done_tasks(30 * 86400, batch=1) == 1
+    with db.get_conn() as conn:
+        assert [r["id"] for r in conn.execute("SELECT id FROM tasks ORDER BY id")] == [recent, open_id]
+        [archived] = conn.execute("SELECT * FROM tasks_archive").fetchall()
+    assert (archived["id"], archived["text"]) == (old, "old")
+    assert db.archive_done_tasks(30 * 86400) == 0
+
+def test_incremental_vacuum_returns_free_pages(tmp_db):
+    db.add_tasks("911", "today", ["x" * 4000 for _ in range(50)])
+    db.delete_tasks("911", [str(r["id"]) for r in db.list_tasks("911")])
+    with db.get_conn() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+    assert db.incremental_vacuum() == 0
@@ -0,0 +1,23 @@
+from bench.nlu import load_corpus, reference_parse, variations
+from whatsappbot import nlu
+
+def test_split_items_separators():
+    assert nlu.split_items("milk, eggs and bread") == ["milk", "eggs", "bread"]
+    assert nlu.split_items("groceries; laundry") == ["groceries", "laundry"]
+    assert nlu.split_items("call mom & dad") == ["call mom", "dad"]
+    assert nlu.split_items("3 5 8") == ["3", "5", "8"]
+    assert nlu.split_items("#3, #5") == ["3", "5"]
+    assert nlu.split_items("buy milk") is None
+
+def test_split_items_keeps_unspaced_ampersand():
+    assert nlu.split_items("r&d report") is None
+    parsed = nlu.parse("add r&d report to today")
+    assert parsed["intent"] == "add"
+    assert parsed["text"] == "r&d report"
+    assert parsed["items"] is None
+
+def test_parse_matches_reference_parser():
+    messages = load_corpus() + variations(20000)
+    mismatches = [(m, reference_parse(m), nlu.parse(m)) for m in messages
+                  if reference_parse(m) != nlu.parse(m)]
+    assert mismatches == []
@@ -0,0 +1,80 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from whatsappbot import async_db
+from whatsappbot.outbound import OutboundDispatcher
+
+@pytest.fixture
+def dead_letters(monkeypatch):
+    rows = []
+
+    async def add_dead_letter(phone, body, error):
+        rows.append((phone, body, error))
+    monkeypatch.setattr(async_db, "add_dead_letter", add_dead_letter)
+    return rows
+
+def dispatcher(handler, **kwargs) -> OutboundDispatcher:
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    kwargs.setdefault("base_delay", 0.001)
+    return OutboundDispatcher(lambda: client, "https://graph.test/messages", "token", **kwargs)
+
+def ok(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"messages": [{"id": "wamid.1"}]})
+
+def test_enqueue_returns_before_delivery(dead_letters):
+    async def scenario():
+        release = asyncio.Event()
+        sent = []
+
+        async def slow(request):
+            await release.wait()
+            sent.append(request)
+            return ok(request)
+        out = dispatcher(slow)
+        await out.start()
+        assert await out.enqueue("p1", "hello")
+        assert sent == []
+        release.set()
+        await out.stop()
+        return sent
+    assert len(asyncio.run(scenario())) == 1
+
+def test_retry_after_is_capped(dead_letters):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(429, headers={"retry-after": "86400"})
+        return ok(request)
+
+    started = time.monotonic()
+    results = asyncio.run(dispatcher(handler, max_delay=0.05).send("p1", "hi"))
+    assert len(results) == 1 and len(calls) == 2
+    assert time.monotonic() - started < 5
+
+def test_connect_errors_are_retried(dead_letters):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise httpx.ConnectError("refused", request=request)
+        return ok(request)
+
+    assert len(asyncio.run(dispatcher(handler).send("p1", "hi"))) == 1
+    assert len(calls) == 2
+
+def test_errors_after_sending_are_not_retried(dead_letters):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ReadTimeout("slow", request=request)
+
+    assert asyncio.run(dispatcher(handler).send("p1", "hi")) == []
+    assert len(calls) == 1
+    assert [(phone, body) for phone, body, _ in dead_letters] == [("p1", "hi")]
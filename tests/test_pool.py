@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from whatsappbot.pool import ConnectionPool, PoolTimeout
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db", max_size=2, timeout=0.2)
+    yield pool
+    pool.close()
+
+def test_most_recently_released_connection_is_reused_first(pool):
+    a, b = pool.acquire(), pool.acquire()
+    pool.release(a)
+    pool.release(b)
+    assert pool.acquire() is b
+    assert pool.acquire() is a
+    assert pool.stats()["created"] == 2
+
+def test_acquire_times_out_when_every_connection_is_out(pool):
+    held = [pool.acquire(), pool.acquire()]
+    started = time.perf_counter()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert time.perf_counter() - started >= 0.2
+    stats = pool.stats()
+    assert (stats["open"], stats["in_use"], stats["timeouts"]) == (2, 2, 1)
+    for conn in held:
+        pool.release(conn)
+
+def test_acquire_waits_for_a_release(pool):
+    held = [pool.acquire(), pool.acquire()]
+    threading.Timer(0.05, pool.release, args=(held[0],)).start()
+    assert pool.acquire() is held[0]
+    stats = pool.stats()
+    assert (stats["created"], stats["waits"]) == (2, 1)
+    assert stats["wait_time_s"] > 0
+    pool.release(held[1])
+
+def test_connections_get_the_pragmas(pool):
+    with pool.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1      # NORMAL
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2      # INCREMENTAL
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2       # MEMORY
+        assert isinstance(conn.execute("SELECT 1 AS one").fetchone(), sqlite3.Row)
+
+def test_release_rolls_back_an_open_transaction(pool):
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE t (x)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT count(*) FROM t").fetchone()[0] == 0
+
+def test_close_closes_idle_and_later_released_connections(pool):
+    idle, busy = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        idle.execute("SELECT 1")
+    busy.execute("SELECT 1")
+    pool.release(busy)
+    with pytest.raises(sqlite3.ProgrammingError):
+        busy.execute("SELECT 1")
+    with pytest.raises(RuntimeError, match="closed"):
+        pool.acquire()
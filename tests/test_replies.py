@@ -0,0 +1,32 @@
+from whatsappbot import db, replies
+
+def rows(*tasks):
+    return [{"id": i, "scope": "today", "text": t} for i, t in tasks]
+
+def test_last_page_has_no_cursor_even_if_text_looks_like_one():
+    reply, cursor = replies.render_task_page(rows((9, "ask about the ticket older than #5.")), None)
+    assert reply.endswith("older than #5.")
+    assert cursor is None
+
+def test_page_cursor_is_the_last_task_shown():
+    page = rows(*((i, "x" * 40) for i in range(100, 0, -1)))
+    reply, cursor = replies.render_task_page(iter(page), None, max_bytes=500)
+    assert cursor is not None
+    assert reply.endswith(f"older than #{cursor}.")
+    assert f"#{cursor} [today]" in reply and f"#{cursor - 1} [today]" not in reply
+
+def test_paging_walks_every_task_once(tmp_db, monkeypatch):
+    monkeypatch.setattr(replies, "PAGE_FETCH", 7)
+    ids = db.add_tasks("p1", "week", [f"task {i} " + "y" * 60 for i in range(60)])
+    seen, cursor = [], None
+    while True:
+        reply, cursor = replies.build_task_list_reply("p1", None, cursor)
+        seen += [int(line.split()[1][1:]) for line in reply.splitlines() if line.startswith("• #")]
+        if cursor is None:
+            break
+    assert seen == sorted(ids, reverse=True)
+
+def test_list_tasks_keeps_all_columns(tmp_db):
+    db.add_task("p1", "today", "buy milk")
+    row = db.list_tasks("p1")[0]
+    assert {"id", "scope", "text", "status", "created_at"} <= set(row.keys())
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from whatsappbot import db, reshard
+from whatsappbot.cache import task_cache
+
+PHONES = [f"91{i:08d}" for i in range(12)]
+
+@pytest.fixture
+def sharded_db(tmp_path, monkeypatch):
+    """DB_PATH plus three shard files under tmp_path."""
+    db.close_pool()
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "tasks.db")
+    monkeypatch.setattr(db, "SHARD_MAP_PATH", tmp_path / "shards.json")
+    db.write_shard_map([tmp_path / f"tasks-{i}.db" for i in range(3)])
+    task_cache.clear()
+    db.init_db()
+    yield tmp_path
+    db.close_pool()
+    task_cache.clear()
+
+def test_ids_follow_allocation_order_across_processes(sharded_db):
+    # a second connection to DB_PATH stands in for another process
+    other = sqlite3.connect(db.DB_PATH)
+    ids = db.allocate_ids(3) + db._take_ids(other, 4) + db.allocate_ids(1) + db._take_ids(other, 2)
+    other.close()
+    assert ids == list(range(ids[0], ids[0] + 10))
+
+def test_sharded_tasks_list_in_insertion_order(sharded_db):
+    phone = PHONES[0]
+    other = sqlite3.connect(db.DB_PATH)
+    added = []
+    for n in range(4):
+        added.append(db.add_task(phone, "today", f"task {n}"))
+        db._take_ids(other, 3)   # another process adding tasks in between
+    other.close()
+    assert [r["id"] for r in db.list_tasks(phone)] == added[::-1]
+    assert [r["id"] for r in db.list_tasks_page(phone, before_id=added[2])] == added[1::-1]
+
+def test_sharded_ids_are_unique_across_shards(sharded_db):
+    ids = [db.add_task(phone, "today", f"task {n}") for n in range(3) for phone in PHONES]
+    ids += db.add_tasks(PHONES[0], "week", ["a", "b", "c"])
+    assert len(ids) == len(set(ids))
+    assert {db.task_db_path(p) for p in PHONES} == set(db.shards())
+    for phone in PHONES:
+        with sqlite3.connect(db.task_db_path(phone)) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM tasks WHERE phone=?", (phone,)).fetchone()[0] >= 3
+
+def test_reshard_moves_tasks_and_keeps_ids(tmp_db):
+    before = {phone: db.add_tasks(phone, "today", ["one", "two"]) for phone in PHONES}
+    db.complete_task(PHONES[0], str(before[PHONES[0]][0]))
+    db.archive_done_tasks(older_than=-3600)
+    db.close_pool()
+
+    out = tmp_db / "new"
+    out.mkdir()
+    targets = reshard.reshard(4, out)
+
+    assert db.shards() == targets
+    for phone, ids in before.items():
+        path = db.task_db_path(phone)
+        assert path == targets[db.shard_index(phone, 4)]
+        with sqlite3.connect(path) as conn:
+            open_ids = [r[0] for r in conn.execute("SELECT id FROM tasks WHERE phone=? ORDER BY id", (phone,))]
+            archived = [r[0] for r in conn.execute("SELECT id FROM tasks_archive WHERE phone=?", (phone,))]
+        assert sorted(open_ids + archived) == ids
+    assert [r["text"] for r in db.list_tasks(PHONES[1])] == ["two", "one"]
+    # the id allocator continues above every copied id
+    highest = max(i for ids in before.values() for i in ids)
+    assert db.add_task(PHONES[2], "week", "after reshard") > highest
@@ -0,0 +1,23 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from whatsappbot import main
+
+@pytest.mark.parametrize("body", [b"not json", b"[]", b'{"entry": "x"}', b'{"entry": [{"changes": [1]}]}'])
+def test_malformed_webhook_body_is_acknowledged(body):
+    response = TestClient(main.app).post("/wa/webhook", content=body)
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+def test_malformed_webhook_body_is_logged(caplog):
+    with caplog.at_level("WARNING", logger="whatsappbot.main"):
+        TestClient(main.app).post("/wa/webhook", content=b"not json")
+    assert "malformed body" in caplog.text
+
+def test_lifespan_starts_and_stops_the_workers(tmp_db):
+    with TestClient(main.app) as client:
+        assert client.get("/").status_code == 200
+        workers = list(main.work_queue._tasks)
+        assert workers and not any(t.done() for t in workers)
+    assert all(t.done() for t in workers)
+    assert main.work_queue._tasks == []
@@ -0,0 +1,123 @@
+# whatsappbot/async_db.py
+"""Awaitable wrappers around whatsappbot.db.
+
+sqlite3 calls block, so each one runs on a dedicated, bounded thread pool
+instead of the event loop. The worker count defaults to the connection pool
+size so a worker never waits on a connection.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Mapping, Optional, Tuple, TypeVar
+
+from whatsappbot import db, replies
+from whatsappbot.metrics import registry
+
+T = TypeVar("T")
+
+query_seconds = registry.histogram(
+    "db_query_seconds", "Time spent running each whatsappbot.db call on a db thread.", ("op",))
+queue_wait_seconds = registry.histogram(
+    "db_queue_wait_seconds", "Time db calls waited for a free db thread.", ("pool",))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_write_executor: Optional[ThreadPoolExecutor] = None
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv("DB_WORKERS", os.getenv("DB_POOL_SIZE", "8")))
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+    return _executor
+
+def get_write_executor() -> ThreadPoolExecutor:
+    """Threads for writes. Under group commit a write parks its thread until
+    the batch commits, so these get a pool of their own, sized to fill a
+    batch, and reads never queue behind them."""
+    global _write_executor
+    if not db.GROUP_COMMIT:
+        return get_executor()
+    if _write_executor is None:
+        workers = int(os.getenv("DB_WRITE_WORKERS", os.getenv("DB_GROUP_COMMIT_MAX_BATCH", "64")))
+        _write_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db-write")
+    return _write_executor
+
+def shutdown() -> None:
+    """Stop the worker threads and close the connection pool."""
+    global _executor, _write_executor
+    for executor in (_write_executor, _executor):
+        if executor is not None:
+            executor.shutdown(wait=True)
+    _executor = _write_executor = None
+    db.close_pool()
+
+def _timed(fn: Callable[..., T], args: tuple, kwargs: dict, pool: str) -> Callable[[], T]:
+    queued = time.perf_counter()
+    op = getattr(fn, "__name__", "call")
+
+    def call() -> T:
+        started = time.perf_counter()
+        queue_wait_seconds.observe(started - queued, pool=pool)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            query_seconds.observe(time.perf_counter() - started, op=op)
+    return call
+
+async def run(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking db callable on the db executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), _timed(fn, args, kwargs, "read"))
+
+async def run_write(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run a blocking db write on the write executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_write_executor(), _timed(fn, args, kwargs, "write"))
+
+async def init_db() -> None:
+    await run(db.init_db)
+
+async def add_task(phone: str, scope: str, text: str) -> int:
+    return await run_write(db.add_task, phone, scope, text)
+
+async def add_tasks(phone: str, scope: str, texts: List[str]) -> List[int]:
+    return await run_write(db.add_tasks, phone, scope, texts)
+
+async def list_tasks(phone: str, scope: Optional[str] = None) -> List[sqlite3.Row]:
+    return await run(db.list_tasks, phone, scope)
+
+async def list_tasks_page(phone: str, scope: Optional[str] = None, before_id: Optional[int] = None,
+                          limit: int = 50) -> List[sqlite3.Row]:
+    return await run(db.list_tasks_page, phone, scope, before_id, limit)
+
+async def list_tasks_reply(phone: str, scope: Optional[str] = None,
+                           cursor: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """(reply, next cursor) for one list page; the cursor is None on the last page."""
+    # even a cache hit reads the phone's task version, so it runs on a db thread
+    return await run(replies.task_list_reply, phone, scope, cursor)
+
+async def complete_task(phone: str, task_text_or_id: str) -> int:
+    return await run_write(db.complete_task, phone, task_text_or_id)
+
+async def delete_task(phone: str, task_text_or_id: str) -> int:
+    return await run_write(db.delete_task, phone, task_text_or_id)
+
+async def complete_tasks(phone: str, items: List[str]) -> int:
+    return await run_write(db.complete_tasks, phone, items)
+
+async def delete_tasks(phone: str, items: List[str]) -> int:
+    return await run_write(db.delete_tasks, phone, items)
+
+async def add_dead_letter(phone: str, body: str, error: str) -> int:
+    return await run_write(db.add_dead_letter, phone, body, error)
+
+async def claim_message_ids(ids: List[str], senders: Optional[Mapping[str, str]] = None) -> List[str]:
+    return await run_write(db.claim_message_ids, ids, senders)
+
+async def release_message_ids(ids: List[str]) -> None:
+    await run_write(db.release_message_ids, ids)
+
+async def prune_message_ids(older_than: float) -> int:
+    return await run_write(db.prune_message_ids, older_than)
@@ -0,0 +1,122 @@
+# whatsappbot/backends.py
+"""Where the bot's task intents are executed.
+
+All three backends return the same reply strings as the MCP tools in
+mcp_starter.py, so switching TASK_BACKEND never changes what users see:
+
+- ``direct``:   whatsappbot.async_db in this process (default)
+- ``inprocess``: the MCP server's task tools (whatsappbot.task_tools), called in process
+- ``mcp``:      a remote MCP server over streamable-http (USE_MCP=true)
+"""
+import os
+from typing import List, Optional, Protocol, Tuple
+
+# (reply, cursor for the next page or None)
+Page = Tuple[str, Optional[int]]
+
+from whatsappbot import async_db, mcp_client, replies, task_tools
+
+class TaskBackend(Protocol):
+    async def add_task(self, phone: str, scope: str, text: str) -> str: ...
+    async def add_tasks(self, phone: str, scope: str, texts: List[str]) -> str: ...
+    async def list_tasks(self, phone: str, scope: Optional[str] = None, cursor: Optional[int] = None) -> Page: ...
+    async def complete_task(self, phone: str, text_or_id: str) -> str: ...
+    async def complete_tasks(self, phone: str, items: List[str]) -> str: ...
+    async def delete_task(self, phone: str, text_or_id: str) -> str: ...
+    async def delete_tasks(self, phone: str, items: List[str]) -> str: ...
+    async def close(self) -> None: ...
+
+class DirectBackend:
+    async def add_task(self, phone: str, scope: str, text: str) -> str:
+        return replies.added(await async_db.add_task(phone, scope, text), scope, text)
+
+    async def add_tasks(self, phone: str, scope: str, texts: List[str]) -> str:
+        return replies.added_many(await async_db.add_tasks(phone, scope, texts), scope, texts)
+
+    async def list_tasks(self, phone: str, scope: Optional[str] = None, cursor: Optional[int] = None) -> Page:
+        return await async_db.list_tasks_reply(phone, scope, cursor)
+
+    async def complete_task(self, phone: str, text_or_id: str) -> str:
+        return replies.completed(await async_db.complete_task(phone, text_or_id))
+
+    async def complete_tasks(self, phone: str, items: List[str]) -> str:
+        return replies.completed_many(await async_db.complete_tasks(phone, items), len(items))
+
+    async def delete_task(self, phone: str, text_or_id: str) -> str:
+        return replies.deleted(await async_db.delete_task(phone, text_or_id))
+
+    async def delete_tasks(self, phone: str, items: List[str]) -> str:
+        return replies.deleted_many(await async_db.delete_tasks(phone, items), len(items))
+
+    async def close(self) -> None:
+        pass
+
+class InProcessBackend:
+    """Runs the MCP server's task tools (whatsappbot.task_tools) in this
+    process: the server's code and McpError wrapping, minus JSON-RPC, HTTP
+    and the server's own middleware."""
+
+    async def add_task(self, phone: str, scope: str, text: str) -> str:
+        return await task_tools.add_task(phone, scope, text)
+
+    async def add_tasks(self, phone: str, scope: str, texts: List[str]) -> str:
+        return await task_tools.add_tasks(phone, scope, texts)
+
+    async def list_tasks(self, phone: str, scope: Optional[str] = None, cursor: Optional[int] = None) -> Page:
+        return await task_tools.list_tasks(phone, scope, None if cursor is None else str(cursor))
+
+    async def complete_task(self, phone: str, text_or_id: str) -> str:
+        return await task_tools.complete_task(phone, text_or_id)
+
+    async def complete_tasks(self, phone: str, items: List[str]) -> str:
+        return await task_tools.complete_tasks(phone, items)
+
+    async def delete_task(self, phone: str, text_or_id: str) -> str:
+        return await task_tools.delete_task(phone, text_or_id)
+
+    async def delete_tasks(self, phone: str, items: List[str]) -> str:
+        return await task_tools.delete_tasks(phone, items)
+
+    async def close(self) -> None:
+        pass
+
+class MCPBackend:
+    def __init__(self):
+        self.client = mcp_client.get_client()
+
+    async def add_task(self, phone: str, scope: str, text: str) -> str:
+        return await self.client.add_task(phone, scope, text)
+
+    async def add_tasks(self, phone: str, scope: str, texts: List[str]) -> str:
+        return await self.client.add_tasks(phone, scope, texts)
+
+    async def list_tasks(self, phone: str, scope: Optional[str] = None, cursor: Optional[int] = None) -> Page:
+        return await self.client.list_tasks(phone, scope, cursor)
+
+    async def complete_task(self, phone: str, text_or_id: str) -> str:
+        return await self.client.complete_task(phone, text_or_id)
+
+    async def complete_tasks(self, phone: str, items: List[str]) -> str:
+        return await self.client.complete_tasks(phone, items)
+
+    async def delete_task(self, phone: str, text_or_id: str) -> str:
+        return await self.client.delete_task(phone, text_or_id)
+
+    async def delete_tasks(self, phone: str, items: List[str]) -> str:
+        return await self.client.delete_tasks(phone, items)
+
+    async def close(self) -> None:
+        await mcp_client.close_client()
+
+BACKENDS = {"direct": DirectBackend, "inprocess": InProcessBackend, "mcp": MCPBackend}
+
+def backend_name() -> str:
+    name = os.getenv("TASK_BACKEND", "").lower()
+    if not name:
+        name = "mcp" if os.getenv("USE_MCP", "false").lower() == "true" else "direct"
+    if name not in BACKENDS:
+        raise ValueError(f"TASK_BACKEND must be one of {', '.join(BACKENDS)}, got {name!r}")
+    return name
+
+def make_backend(name: Optional[str] = None) -> TaskBackend:
+    return BACKENDS[name or backend_name()]()
@@ -0,0 +1,119 @@
+# whatsappbot/cache.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Set, Tuple
+
+MISS = object()
+
+class LRUCache:
+    """Thread-safe LRU cache with a TTL, keyed by tuples whose first element
+    is the owning phone number so all of a user's entries can be dropped at
+    once.
+
+    Every invalidation bumps a per-phone generation. Readers take the
+    generation *before* querying and pass it to ``set``; a value computed
+    across a concurrent write is then discarded instead of cached stale.
+
+    Entries may also carry a ``version`` read from shared storage; ``get``
+    with a different version treats the entry as stale, so writes made by
+    other processes invalidate it too.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple, Tuple[float, Any, Any]]" = OrderedDict()
+        self._by_phone: Dict[Hashable, Set[Tuple]] = {}
+        self._gen: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    def generation(self, phone: Hashable) -> int:
+        with self._lock:
+            return self._gen.get(phone, 0)
+
+    def get(self, key: Tuple, version: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return MISS
+            expires, stored_version, value = item
+            if expires < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            if stored_version != version:
+                self._drop(key)
+                self.stale += 1
+                self.misses += 1
+                return MISS
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Tuple, value: Any, generation: int, version: Any = None) -> None:
+        phone = key[0]
+        with self._lock:
+            if self._gen.get(phone, 0) != generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, version, value)
+            self._data.move_to_end(key)
+            self._by_phone.setdefault(phone, set()).add(key)
+            while len(self._data) > self.max_size:
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, phone: Hashable) -> None:
+        with self._lock:
+            self._gen[phone] = self._gen.get(phone, 0) + 1
+            for key in self._by_phone.pop(phone, ()):
+                self._data.pop(key, None)
+            self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for phone in self._by_phone:
+                self._gen[phone] = self._gen.get(phone, 0) + 1
+            self._data.clear()
+            self._by_phone.clear()
+
+    def _drop(self, key: Tuple) -> None:
+        self._data.pop(key, None)
+        keys = self._by_phone.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_phone[key[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale": self.stale,
+            }
+
+# Open-task rows and rendered "Your tasks" replies, keyed (phone, scope, kind)
+# and checked against the phone's task_versions row on every read.
+task_cache = LRUCache(
+    max_size=int(os.getenv("TASK_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("TASK_CACHE_TTL", "60")),
+)
@@ -1,19 +1,324 @@
 # whatsappbot/db.py
+import functools
+import itertools
+import json
+import os
+import random
+import re
 import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, Deque, Dict, Iterator, List, Mapping, Optional, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+from whatsappbot.cache import MISS, task_cache
+from whatsappbot.group_commit import GroupCommitter
+from whatsappbot.pool import ConnectionPool
 
 # DB file at project root: <project>/tasks.db
 DB_PATH = Path(__file__).resolve().parent.parent / "tasks.db"
 
-def get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# Sharded mode: tasks live in N files chosen by hashing the phone, listed in a
+# JSON shard map ({"shards": ["tasks-0.db", ...]}, paths relative to the map).
+# DB_PATH then keeps only the shared tables: dead letters, processed message
+# ids and the task id allocator. Build or change a layout offline with
+# `python -m whatsappbot.reshard`.
+#
+# Sharding spreads storage only. Several bot processes may share these
+# files, but per-phone message ordering, "more" cursors and the outbound
+# rate limits are per process (see main.py): route each phone to one
+# process and set BOT_PROCESSES.
+SHARD_MAP_PATH = Path(os.getenv("DB_SHARD_MAP", Path(__file__).resolve().parent.parent / "shards.json"))
+
+# Coalesce concurrent writes into shared transactions (see group_commit.py).
+GROUP_COMMIT = os.getenv("DB_GROUP_COMMIT", "false").lower() == "true"
+
+_pools: Dict[str, ConnectionPool] = {}
+_committers: Dict[str, GroupCommitter] = {}
+_pools_lock = threading.Lock()
+_shards: Optional[List[Path]] = None
+_fts_enabled: Optional[bool] = None
+
+def load_shard_map(path: Optional[Path] = None) -> List[Path]:
+    """Shard files from the map, or [] when the map doesn't exist (unsharded)."""
+    path = Path(path or SHARD_MAP_PATH)
+    if not path.exists():
+        return []
+    with open(path) as f:
+        config = json.load(f)
+    return [path.parent / p for p in config["shards"]]
+
+def write_shard_map(shards: List[Path], path: Optional[Path] = None) -> None:
+    path = Path(path or SHARD_MAP_PATH)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"shards": [os.path.relpath(s, path.parent) for s in shards]}, f, indent=2)
+    os.replace(tmp, path)
+
+def shards() -> List[Path]:
+    global _shards
+    if _shards is None:
+        _shards = load_shard_map()
+    return _shards
+
+def shard_index(phone: str, count: int) -> int:
+    return zlib.crc32(phone.encode()) % count
+
+def task_db_path(phone: str) -> Path:
+    """File holding ``phone``'s tasks."""
+    files = shards()
+    return files[shard_index(phone, len(files))] if files else DB_PATH
+
+def task_db_paths() -> List[Path]:
+    return shards() or [DB_PATH]
+
+def get_pool(path: Optional[Path] = None) -> ConnectionPool:
+    """Connection pool for ``path`` (default DB_PATH), created on first use."""
+    key = str(path or DB_PATH)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(
+                    key,
+                    max_size=int(os.getenv("DB_POOL_SIZE", "8")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+                    busy_timeout=float(os.getenv("DB_BUSY_TIMEOUT", "5")),
+                )
+    return pool
+
+def close_pool() -> None:
+    """Flush pending group commits, close every pool and forget the shard
+    map and FTS5 detection (both re-read on next use)."""
+    global _shards, _fts_enabled
+    with _pools_lock:
+        for committer in _committers.values():
+            committer.close()
+        _committers.clear()
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+    _shards = None
+    _fts_enabled = None
+
+def pool_stats() -> Dict[str, Any]:
+    stats: Dict[str, Any] = dict(get_pool().stats())
+    if shards():
+        stats["shards"] = [get_pool(p).stats() for p in shards()]
+    if _committers:
+        stats["group_commit"] = group_commit_stats()
+    return stats
+
+@contextmanager
+def get_conn(phone: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """Borrow a pooled connection; it is returned to the pool on exit.
+
+    With a phone, the connection is to the file holding that phone's tasks;
+    without one, to DB_PATH.
+    """
+    path = task_db_path(phone) if phone is not None else None
+    with get_pool(path).connection() as conn:
+        yield conn
+
+def write(phone: Optional[str], op: Callable[..., T], *args: Any) -> T:
+    """Run ``op(conn, *args)`` against phone's file (DB_PATH for None) and
+    commit it; returns op's result once it is durable.
+
+    With DB_GROUP_COMMIT on, the op joins that file's next group commit
+    instead of committing alone. A truthy result (rows written) bumps the
+    phone's task version in the same transaction, which invalidates its
+    cached lists in every process, and drops them from this one's cache.
+    """
+    path = task_db_path(phone) if phone is not None else DB_PATH
+    if phone is not None:
+        op, args = _versioned, (phone, op) + args
+    if GROUP_COMMIT:
+        result = _committer(path).submit(op, args).result()
+    else:
+        with get_pool(path).connection() as conn:
+            result = op(conn, *args)
+            conn.commit()
+    if phone is not None and result:
+        task_cache.invalidate(phone)
+    return result
+
+def _versioned(conn: sqlite3.Connection, phone: str, op: Callable[..., T], *args: Any) -> T:
+    result = op(conn, *args)
+    if result:
+        conn.execute(
+            "INSERT INTO task_versions (phone, version) VALUES (?, 1) "
+            "ON CONFLICT(phone) DO UPDATE SET version = version + 1",
+            (phone,),
+        )
+    return result
+
+def _task_version(conn: sqlite3.Connection, phone: str) -> int:
+    row = conn.execute("SELECT version FROM task_versions WHERE phone=?", (phone,)).fetchone()
+    return row[0] if row else 0
+
+def task_version(phone: str) -> int:
+    """Bumped by every write to phone's tasks, from any process; cached
+    lists are only served while it is unchanged."""
+    with get_conn(phone) as conn:
+        return _task_version(conn, phone)
+
+def _committer(path: Path) -> GroupCommitter:
+    key = str(path)
+    committer = _committers.get(key)
+    if committer is None:
+        with _pools_lock:
+            committer = _committers.get(key)
+            if committer is None:
+                committer = _committers[key] = GroupCommitter(
+                    get_pool(path).connection,
+                    window=float(os.getenv("DB_GROUP_COMMIT_WINDOW_MS", "2")) / 1000,
+                    max_batch=int(os.getenv("DB_GROUP_COMMIT_MAX_BATCH", "64")),
+                    name=f"db-writer-{len(_committers)}",
+                )
+    return committer
+
+def group_commit_stats() -> Dict[str, Any]:
+    return {path: c.stats() for path, c in _committers.items()}
+
+def retry_locked(fn: Callable[..., T]) -> Callable[..., T]:
+    """Retry a write that still found the database locked after the busy
+    timeout (several worker processes contending for one file)."""
+    attempts = int(os.getenv("DB_LOCKED_RETRIES", "3"))
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        for attempt in range(attempts):
+            try:
+                return fn(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e) or attempt + 1 == attempts:
+                    raise
+                time.sleep(0.05 * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
+
+# --- Task ids ---
+# Unsharded, ids come from AUTOINCREMENT. Sharded, they come from a counter
+# in DB_PATH, so they stay small, are unique across every shard and survive
+# resharding unchanged. Lists, keyset pages and match tiebreaks read id as
+# insertion order, so every write takes its ids from the counter itself
+# (no per-process blocks): ids follow allocation order across processes.
+
+def _take_ids(conn: sqlite3.Connection, n: int) -> List[int]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        start = conn.execute("SELECT next FROM task_ids WHERE name='tasks'").fetchone()[0]
+        conn.execute("UPDATE task_ids SET next=? WHERE name='tasks'", (start + n,))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return list(range(start, start + n))
+
+@retry_locked
+def allocate_ids(n: int) -> Optional[List[int]]:
+    """``n`` fresh, consecutive task ids in sharded mode; None means use
+    AUTOINCREMENT."""
+    if not shards():
+        return None
+    with get_conn() as conn:
+        return _take_ids(conn, n)
+
+def seed_task_ids(conn: sqlite3.Connection, next_id: int) -> None:
+    """Make sure the allocator in DB_PATH never hands out an id below ``next_id``."""
+    conn.execute("INSERT OR IGNORE INTO task_ids (name, next) VALUES ('tasks', 1)")
+    conn.execute("UPDATE task_ids SET next = MAX(next, ?) WHERE name='tasks'", (next_id,))
+
+# Bumped by each step in _migrate; stored in PRAGMA user_version.
+SCHEMA_VERSION = 1
 
 def init_db() -> None:
-    """Create tables/indexes if they don't exist."""
-    conn = get_conn()
+    """Create tables/indexes if they don't exist and migrate older files.
+
+    Sharded, DB_PATH gets the shared tables and each shard the task tables.
+    """
+    with get_conn() as conn:
+        _init_shared(conn)
+        conn.commit()
+        if not shards():
+            _init_tasks(conn)
+    for path in shards():
+        init_task_db(path)
+
+def init_task_db(path: Path) -> None:
+    """Create or migrate the task tables in one shard file."""
+    with get_pool(path).connection() as conn:
+        _init_tasks(conn)
+
+def _init_shared(conn: sqlite3.Connection) -> None:
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT NOT NULL,
+            body  TEXT NOT NULL,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS processed_messages (
+            id TEXT PRIMARY KEY,                 -- WhatsApp message id (wamid)
+            seen_at REAL NOT NULL
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS inbound_contacts (
+            phone TEXT PRIMARY KEY,
+            last_at REAL NOT NULL                -- when their latest message arrived
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_ids (
+            name TEXT PRIMARY KEY,
+            next INTEGER NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS digest_runs (
+            id TEXT PRIMARY KEY,                 -- <scope>:<period>, e.g. today:2026-10-16
+            scope TEXT NOT NULL,
+            started_at REAL NOT NULL,
+            finished_at REAL,
+            claimed INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,  -- no inbound message in the last 24 h
+            unsent INTEGER NOT NULL DEFAULT 0    -- claimed, outcome not recorded (yet)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS digest_cursors (
+            run_id TEXT NOT NULL,
+            shard TEXT NOT NULL,
+            after_phone TEXT NOT NULL,           -- every phone <= this has been claimed
+            PRIMARY KEY (run_id, shard)
+        ) WITHOUT ROWID
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS digest_claims (
+            run_id TEXT NOT NULL,
+            shard TEXT NOT NULL,
+            after_phone TEXT NOT NULL,           -- the batch is the phones in
+            last_phone TEXT NOT NULL,            -- (after_phone, last_phone]
+            users INTEGER NOT NULL,
+            claimed_at REAL NOT NULL,
+            PRIMARY KEY (run_id, shard, after_phone)
+        ) WITHOUT ROWID
+    """)
+    seed_task_ids(conn, 1)
+
+def _init_tasks(conn: sqlite3.Connection) -> None:
     cur = conn.cursor()
     cur.execute("""
         CREATE TABLE IF NOT EXISTS tasks (
@@ -22,76 +327,556 @@ def init_db() -> None:
             scope TEXT NOT NULL,                 -- 'today' | 'week' | 'month'
             text  TEXT NOT NULL,
             status TEXT NOT NULL DEFAULT 'open', -- 'open' | 'done'
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            completed_at TIMESTAMP
         )
     """)
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_phone ON tasks(phone)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_phone_status ON tasks(phone, status)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER PRIMARY KEY,
+            phone TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            text  TEXT NOT NULL,
+            created_at TIMESTAMP,
+            completed_at TIMESTAMP,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_archive_phone ON tasks_archive(phone)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS task_versions (
+            phone TEXT PRIMARY KEY,
+            version INTEGER NOT NULL             -- bumped by every write to the phone's tasks
+        ) WITHOUT ROWID
+    """)
+    _init_fts(conn)
     conn.commit()
-    conn.close()
+    _migrate(conn)
 
-def add_task(phone: str, scope: str, text: str) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Bring a tasks.db created by an older version up to SCHEMA_VERSION."""
+    # the write lock makes a second process wait here, then see the new version
+    conn.execute("BEGIN IMMEDIATE")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        conn.commit()
+        return
+    if version < 1:
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(tasks)")}
+        if "completed_at" not in columns:
+            conn.execute("ALTER TABLE tasks ADD COLUMN completed_at TIMESTAMP")
+            # best guess for tasks finished before the column existed
+            conn.execute("UPDATE tasks SET completed_at = created_at WHERE status='done'")
+        # Partial indexes: the hot paths only ever look at open tasks, so
+        # finished history doesn't grow them. idx_tasks_open is covering for
+        # list pages and the LIKE fallback match, in keyset (id) order; the
+        # trailing status column lets the planner skip the table entirely.
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tasks_open
+            ON tasks(phone, id, scope, text, status) WHERE status='open'
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tasks_done
+            ON tasks(completed_at) WHERE status='done'
+        """)
+        # the full-table indexes they replace
+        conn.execute("DROP INDEX IF EXISTS idx_tasks_phone")
+        conn.execute("DROP INDEX IF EXISTS idx_tasks_phone_status")
+        conn.execute("PRAGMA user_version = 1")
+        # An existing file stays in auto_vacuum=NONE (incremental_vacuum is
+        # then a no-op) until one full VACUUM, which rewrites the whole file
+        # under an exclusive lock: too slow for startup, so it is an explicit
+        # step (enable_incremental_vacuum). Planner statistics are left to
+        # the maintenance loop.
+    conn.commit()
+
+# --- Full-text matching ---
+# tasks_fts indexes only *open* tasks (external content on `tasks`), so text
+# matching in complete/delete never touches a user's finished history.
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def _init_fts(conn: sqlite3.Connection) -> None:
+    global _fts_enabled
+    if not fts5_available(conn):
+        _fts_enabled = False
+        return
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='tasks_fts'"
+    ).fetchone()
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            text, phone,
+            content='tasks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks
+        WHEN new.status='open' BEGIN
+            INSERT INTO tasks_fts(rowid, text, phone) VALUES (new.id, new.text, new.phone);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks
+        WHEN old.status='open' BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, text, phone) VALUES ('delete', old.id, old.text, old.phone);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF text, phone, status ON tasks BEGIN
+            INSERT INTO tasks_fts(tasks_fts, rowid, text, phone)
+                SELECT 'delete', old.id, old.text, old.phone WHERE old.status='open';
+            INSERT INTO tasks_fts(rowid, text, phone)
+                SELECT new.id, new.text, new.phone WHERE new.status='open';
+        END
+    """)
+    if not exists:
+        # existing databases: index the open tasks that predate the triggers
+        conn.execute(
+            "INSERT INTO tasks_fts(rowid, text, phone) SELECT id, text, phone FROM tasks WHERE status='open'"
+        )
+    _fts_enabled = True
+
+def _use_fts(conn: sqlite3.Connection) -> bool:
+    global _fts_enabled
+    if _fts_enabled is None:
+        _fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='tasks_fts'"
+        ).fetchone() is not None
+    return _fts_enabled
+
+def _phrase(s: str) -> str:
+    return '"' + s.replace('"', '""') + '"'
+
+def fts_query(phone: str, text: str) -> Optional[str]:
+    """Build an FTS5 MATCH expression: every word as a prefix, scoped to phone."""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return f"phone : {_phrase(phone)} AND text : (" + " ".join(_phrase(w) + "*" for w in words) + ")"
+
+# Best open candidate first: bm25 rank, newest task breaks ties.
+_FTS_MATCH_SQL = """
+    SELECT t.id FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid
+    WHERE tasks_fts MATCH ? AND t.phone=? AND t.status='open'
+    ORDER BY bm25(tasks_fts), t.id DESC LIMIT 1
+"""
+# Fallback when FTS5 is not compiled in (or the text has no words).
+_LIKE_MATCH_SQL = """
+    SELECT id FROM tasks
+    WHERE phone=? AND status='open' AND text LIKE ?
+    ORDER BY id DESC LIMIT 1
+"""
+
+def _match_sql(conn: sqlite3.Connection, phone: str, text: str) -> Tuple[str, tuple]:
+    query = fts_query(phone, text) if _use_fts(conn) else None
+    if query:
+        return _FTS_MATCH_SQL, (query, phone)
+    return _LIKE_MATCH_SQL, (phone, f"%{text}%")
+
+def match_task(phone: str, text: str) -> Optional[sqlite3.Row]:
+    """Return the best-matching open task for free text, or None."""
+    with get_conn(phone) as conn:
+        sql, params = _match_sql(conn, phone, text)
+        row = conn.execute(sql, params).fetchone()
+        if row is None:
+            return None
+        return conn.execute("SELECT * FROM tasks WHERE id=?", (row["id"],)).fetchone()
+
+def _insert_task(conn: sqlite3.Connection, phone: str, scope: str, text: str,
+                 task_id: Optional[int]) -> int:
+    return conn.execute(
+        "INSERT INTO tasks (id, phone, scope, text) VALUES (?, ?, ?, ?)",
+        (task_id, phone, scope, text),
+    ).lastrowid
+
+def _insert_tasks(conn: sqlite3.Connection, phone: str, scope: str, texts: List[str],
+                  ids: Optional[List[int]]) -> List[int]:
+    if ids:
+        conn.executemany(
+            "INSERT INTO tasks (id, phone, scope, text) VALUES (?, ?, ?, ?)",
+            [(i, phone, scope, t) for i, t in zip(ids, texts)],
+        )
+        return ids
+    conn.executemany(
         "INSERT INTO tasks (phone, scope, text) VALUES (?, ?, ?)",
-        (phone, scope, text),
+        [(phone, scope, t) for t in texts],
     )
-    conn.commit()
-    task_id = cur.lastrowid
-    conn.close()
-    return task_id
+    # the write lock is held until commit, so AUTOINCREMENT ids are contiguous
+    last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last - len(texts) + 1, last + 1))
+
+@retry_locked
+def add_task(phone: str, scope: str, text: str) -> int:
+    ids = allocate_ids(1)
+    return write(phone, _insert_task, phone, scope, text, ids and ids[0])
+
+@retry_locked
+def add_tasks(phone: str, scope: str, texts: List[str]) -> List[int]:
+    """Insert several tasks in one transaction; returns their ids in order."""
+    if not texts:
+        return []
+    return write(phone, _insert_tasks, phone, scope, texts, allocate_ids(len(texts)))
+
+# list pages and digests only ever show these (all in idx_tasks_open)
+_LIST_COLUMNS = "id, scope, text"
 
 def list_tasks(phone: str, scope: Optional[str] = None) -> List[sqlite3.Row]:
-    conn = get_conn()
-    cur = conn.cursor()
+    """Every open task (all columns), newest first."""
+    key = (phone, scope, "rows")
+    generation = task_cache.generation(phone)
+    with get_conn(phone) as conn:
+        version = _task_version(conn, phone)
+        cached = task_cache.get(key, version)
+        if cached is not MISS:
+            return list(cached)
+        if scope:
+            cur = conn.execute(
+                "SELECT * FROM tasks WHERE phone=? AND scope=? AND status='open' ORDER BY id DESC",
+                (phone, scope),
+            )
+        else:
+            cur = conn.execute(
+                "SELECT * FROM tasks WHERE phone=? AND status='open' ORDER BY id DESC",
+                (phone,),
+            )
+        rows = cur.fetchall()
+    task_cache.set(key, tuple(rows), generation, version)
+    return rows
+
+def list_tasks_page(phone: str, scope: Optional[str] = None, before_id: Optional[int] = None,
+                    limit: int = 50) -> List[sqlite3.Row]:
+    """Open tasks newest first, strictly older than ``before_id`` (keyset page).
+
+    Served entirely from the partial idx_tasks_open index, so each page is a
+    range seek rather than an OFFSET scan, however much history exists.
+    """
+    sql = f"SELECT {_LIST_COLUMNS} FROM tasks WHERE phone=? AND status='open'"
+    params: list = [phone]
     if scope:
-        cur.execute(
-            "SELECT * FROM tasks WHERE phone=? AND scope=? AND status='open' ORDER BY id DESC",
-            (phone, scope),
-        )
-    else:
-        cur.execute(
-            "SELECT * FROM tasks WHERE phone=? AND status='open' ORDER BY id DESC",
-            (phone,),
+        sql += " AND scope=?"
+        params.append(scope)
+    if before_id is not None:
+        sql += " AND id<?"
+        params.append(before_id)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    with get_conn(phone) as conn:
+        return conn.execute(sql, params).fetchall()
+
+def iter_open_tasks(phone: str, scope: Optional[str] = None, before_id: Optional[int] = None,
+                    batch: int = 50) -> Iterator[sqlite3.Row]:
+    """Yield open tasks newest first, fetching ``batch`` rows per query."""
+    while True:
+        rows = list_tasks_page(phone, scope, before_id, batch)
+        yield from rows
+        if len(rows) < batch:
+            return
+        before_id = rows[-1]["id"]
+
+def digest_batch(path: Path, scope: str, after_phone: str, users: int,
+                 keep: int = 15) -> List[Tuple[str, int, List[sqlite3.Row]]]:
+    """Open ``scope`` tasks of the next ``users`` phones after ``after_phone``
+    in one task file, grouped per phone as (phone, open count, newest
+    ``keep`` tasks newest first).
+
+    A single query walks idx_tasks_open in (phone, id) order, so there is
+    no sort and no per-user query; rows are streamed off the cursor and the
+    scan stops at the first phone past the batch.
+    """
+    out: List[Tuple[str, int, List[sqlite3.Row]]] = []
+    with get_pool(path).connection() as conn:
+        cur = conn.execute(
+            f"SELECT phone, {_LIST_COLUMNS} FROM tasks WHERE status='open' AND scope=? AND phone>? "
+            "ORDER BY phone, id",
+            (scope, after_phone),
         )
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+        for phone, rows in itertools.groupby(cur, key=lambda r: r["phone"]):
+            if len(out) == users:
+                break
+            newest: Deque[sqlite3.Row] = deque(maxlen=keep)
+            count = 0
+            for r in rows:
+                newest.append(r)
+                count += 1
+            out.append((phone, count, list(reversed(newest))))
+        cur.close()
+    return out
 
-def complete_task(phone: str, task_text_or_id: str) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
+# re-completing a finished task keeps its original completion time
+_DONE = "status='done', completed_at=COALESCE(completed_at, CURRENT_TIMESTAMP)"
+
+def _update_one(conn: sqlite3.Connection, phone: str, task_text_or_id: str,
+                by_id_sql: str, by_match_sql: str) -> int:
     if task_text_or_id.isdigit():
-        cur.execute(
-            "UPDATE tasks SET status='done' WHERE phone=? AND id=?",
-            (phone, int(task_text_or_id)),
-        )
-    else:
-        cur.execute(
-            "UPDATE tasks SET status='done' WHERE phone=? AND text LIKE ? LIMIT 1",
-            (phone, f"%{task_text_or_id}%"),
-        )
-    conn.commit()
-    count = cur.rowcount
-    conn.close()
+        return conn.execute(by_id_sql, (phone, int(task_text_or_id))).rowcount
+    sql, params = _match_sql(conn, phone, task_text_or_id)
+    return conn.execute(by_match_sql.format(match=sql), params).rowcount
+
+def _apply_many(conn: sqlite3.Connection, phone: str, items: List[str],
+                by_id_sql: str, by_match_sql: str) -> int:
+    ids = [(phone, int(i)) for i in items if i.isdigit()]
+    count = 0
+    if ids:
+        count += conn.executemany(by_id_sql, ids).rowcount
+    for text in (i for i in items if not i.isdigit()):
+        sql, params = _match_sql(conn, phone, text)
+        count += conn.execute(by_match_sql.format(match=sql), params).rowcount
     return count
 
+_COMPLETE = (
+    f"UPDATE tasks SET {_DONE} WHERE phone=? AND id=?",
+    f"UPDATE tasks SET {_DONE} WHERE id = ({{match}})",
+)
+_DELETE = (
+    "DELETE FROM tasks WHERE phone=? AND id=?",
+    "DELETE FROM tasks WHERE id = ({match})",
+)
+
+@retry_locked
+def complete_task(phone: str, task_text_or_id: str) -> int:
+    return write(phone, _update_one, phone, task_text_or_id, *_COMPLETE)
+
+@retry_locked
 def delete_task(phone: str, task_text_or_id: str) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
-    if task_text_or_id.isdigit():
-        cur.execute(
-            "DELETE FROM tasks WHERE phone=? AND id=?",
-            (phone, int(task_text_or_id)),
+    return write(phone, _update_one, phone, task_text_or_id, *_DELETE)
+
+@retry_locked
+def complete_tasks(phone: str, items: List[str]) -> int:
+    """Complete several tasks (ids or text) in one transaction."""
+    return write(phone, _apply_many, phone, items, *_COMPLETE)
+
+@retry_locked
+def delete_tasks(phone: str, items: List[str]) -> int:
+    """Delete several tasks (ids or text) in one transaction."""
+    return write(phone, _apply_many, phone, items, *_DELETE)
+
+# --- History maintenance ---
+
+def archive_done_tasks(older_than: float, batch: int = 5000) -> int:
+    """Move tasks finished more than ``older_than`` seconds ago into
+    tasks_archive, ``batch`` rows per transaction. Returns rows moved."""
+    return sum(_archive_file(path, older_than, batch) for path in task_db_paths())
+
+@retry_locked
+def _archive_file(path: Path, older_than: float, batch: int) -> int:
+    cutoff = f"-{int(older_than)} seconds"
+    moved = 0
+    while True:
+        with get_pool(path).connection() as conn:
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM tasks WHERE status='done' AND completed_at < datetime('now', ?) LIMIT ?",
+                (cutoff, batch),
+            )]
+            if not ids:
+                return moved
+            marks = ",".join("?" * len(ids))
+            conn.execute(f"""
+                INSERT OR REPLACE INTO tasks_archive (id, phone, scope, text, created_at, completed_at)
+                SELECT id, phone, scope, text, created_at, completed_at FROM tasks WHERE id IN ({marks})
+            """, ids)
+            conn.execute(f"DELETE FROM tasks WHERE id IN ({marks})", ids)
+            conn.commit()
+        moved += len(ids)
+
+def incremental_vacuum(pages: int = 0) -> int:
+    """Return up to ``pages`` free pages per file to the OS (0 = all).
+    Returns free pages left across all task files."""
+    free = 0
+    for path in task_db_paths():
+        with get_pool(path).connection() as conn:
+            # execute() steps the pragma once, freeing a single page;
+            # executescript runs it to completion
+            conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            free += conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return free
+
+def full_vacuum_pending() -> List[Path]:
+    """Task files not yet in auto_vacuum=INCREMENTAL mode (created before it)."""
+    pending = []
+    for path in task_db_paths():
+        with get_pool(path).connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                pending.append(path)
+    return pending
+
+def enable_incremental_vacuum() -> List[Path]:
+    """Switch older task files to auto_vacuum=INCREMENTAL with the one full
+    VACUUM that takes. It rewrites each file and locks it throughout, so run
+    it with the bot stopped or quiet. Returns the files converted."""
+    converted = full_vacuum_pending()
+    for path in converted:
+        with get_pool(path).connection() as conn:
+            # the mode only sticks through a VACUUM on the same connection
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+    return converted
+
+def analyze(limit: int = 1000) -> None:
+    """Refresh planner statistics, sampling about ``limit`` rows per index."""
+    for path in task_db_paths():
+        with get_pool(path).connection() as conn:
+            conn.execute(f"PRAGMA analysis_limit={int(limit)}")
+            conn.execute("ANALYZE")
+
+# --- Outbound messages that exhausted their retries ---
+
+def _insert_dead_letter(conn: sqlite3.Connection, phone: str, body: str, error: str) -> int:
+    return conn.execute(
+        "INSERT INTO dead_letters (phone, body, error) VALUES (?, ?, ?)",
+        (phone, body, error),
+    ).lastrowid
+
+@retry_locked
+def add_dead_letter(phone: str, body: str, error: str) -> int:
+    return write(None, _insert_dead_letter, phone, body, error)
+
+def list_dead_letters(limit: int = 100) -> List[sqlite3.Row]:
+    with get_conn() as conn:
+        return conn.execute(
+            "SELECT * FROM dead_letters ORDER BY id DESC LIMIT ?", (limit,)
+        ).fetchall()
+
+# --- Webhook idempotency: message ids already accepted ---
+
+def _claim(conn: sqlite3.Connection, ids: List[str], senders: Mapping[str, str],
+           now: float) -> List[str]:
+    fresh = []
+    for msg_id in ids:
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO processed_messages (id, seen_at) VALUES (?, ?)",
+            (msg_id, now),
         )
-    else:
-        # Corrected: Removed "LIMIT 1" from the DELETE query
-        cur.execute(
-            "DELETE FROM tasks WHERE phone=? AND text LIKE ?",
-            (phone, f"%{task_text_or_id}%"),
+        if cur.rowcount:
+            fresh.append(msg_id)
+    phones = {senders[i] for i in fresh if senders.get(i)}
+    conn.executemany(
+        "INSERT INTO inbound_contacts (phone, last_at) VALUES (?, ?) "
+        "ON CONFLICT(phone) DO UPDATE SET last_at = MAX(last_at, excluded.last_at)",
+        [(phone, now) for phone in phones],
+    )
+    return fresh
+
+def _release(conn: sqlite3.Connection, ids: List[str]) -> None:
+    conn.executemany("DELETE FROM processed_messages WHERE id=?", [(i,) for i in ids])
+
+def _prune(conn: sqlite3.Connection, cutoff: float) -> int:
+    return conn.execute("DELETE FROM processed_messages WHERE seen_at < ?", (cutoff,)).rowcount
+
+@retry_locked
+def claim_message_ids(ids: List[str], senders: Optional[Mapping[str, str]] = None) -> List[str]:
+    """Record ids as processed; returns the ones not seen before, in order.
+    ``senders`` (id -> phone) also marks those phones as just heard from."""
+    return write(None, _claim, ids, senders or {}, time.time())
+
+@retry_locked
+def release_message_ids(ids: List[str]) -> None:
+    """Forget claimed ids (e.g. they could not be queued) so a redelivery is processed."""
+    write(None, _release, ids)
+
+@retry_locked
+def prune_message_ids(older_than: float) -> int:
+    return write(None, _prune, time.time() - older_than)
+
+def recent_senders(phones: List[str], since: float) -> Set[str]:
+    """The phones that sent a message at or after ``since``."""
+    out: Set[str] = set()
+    with get_conn() as conn:
+        for i in range(0, len(phones), 500):
+            chunk = phones[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            out.update(r["phone"] for r in conn.execute(
+                f"SELECT phone FROM inbound_contacts WHERE last_at >= ? AND phone IN ({marks})",
+                [since, *chunk],
+            ))
+    return out
+
+# --- Digest checkpoints: which users each scheduled digest run has claimed ---
+
+def _start_digest(conn: sqlite3.Connection, run_id: str, scope: str, now: float) -> None:
+    conn.execute(
+        "INSERT OR IGNORE INTO digest_runs (id, scope, started_at) VALUES (?, ?, ?)",
+        (run_id, scope, now),
+    )
+
+def _claim_digest(conn: sqlite3.Connection, run_id: str, shard: str, expected: str,
+                  after_phone: str, users: int) -> bool:
+    conn.execute(
+        "INSERT OR IGNORE INTO digest_cursors (run_id, shard, after_phone) VALUES (?, ?, '')",
+        (run_id, shard),
+    )
+    claimed = conn.execute(
+        "UPDATE digest_cursors SET after_phone=? WHERE run_id=? AND shard=? AND after_phone=?",
+        (after_phone, run_id, shard, expected),
+    ).rowcount
+    if claimed:
+        conn.execute(
+            "INSERT INTO digest_claims (run_id, shard, after_phone, last_phone, users, claimed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, shard, expected, after_phone, users, time.time()),
         )
-    conn.commit()
-    count = cur.rowcount
-    conn.close()
-    return count
+        conn.execute("UPDATE digest_runs SET claimed=claimed+?, unsent=unsent+? WHERE id=?",
+                     (users, users, run_id))
+    return bool(claimed)
+
+def _count_digest(conn: sqlite3.Connection, run_id: str, shard: str, after_phone: str,
+                  sent: int, failed: int, skipped: int) -> None:
+    conn.execute("DELETE FROM digest_claims WHERE run_id=? AND shard=? AND after_phone=?",
+                 (run_id, shard, after_phone))
+    conn.execute(
+        "UPDATE digest_runs SET sent=sent+?, failed=failed+?, skipped=skipped+?, unsent=unsent-? "
+        "WHERE id=?",
+        (sent, failed, skipped, sent + failed + skipped, run_id),
+    )
+
+def _finish_digest(conn: sqlite3.Connection, run_id: str, now: float) -> None:
+    conn.execute("UPDATE digest_runs SET finished_at=? WHERE id=? AND finished_at IS NULL", (now, run_id))
+    conn.execute("DELETE FROM digest_cursors WHERE run_id=?", (run_id,))
+
+@retry_locked
+def start_digest_run(run_id: str, scope: str) -> None:
+    write(None, _start_digest, run_id, scope, time.time())
+
+def get_digest_run(run_id: str) -> Optional[sqlite3.Row]:
+    with get_conn() as conn:
+        return conn.execute("SELECT * FROM digest_runs WHERE id=?", (run_id,)).fetchone()
+
+def digest_cursor(run_id: str, shard: str) -> str:
+    """Last phone claimed in ``shard`` by the run ('' before the first batch)."""
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT after_phone FROM digest_cursors WHERE run_id=? AND shard=?", (run_id, shard)
+        ).fetchone()
+    return row["after_phone"] if row else ""
+
+@retry_locked
+def claim_digest_batch(run_id: str, shard: str, expected: str, after_phone: str, users: int) -> bool:
+    """Move the shard's cursor from ``expected`` to ``after_phone``. False if
+    another process moved it first (the batch is theirs)."""
+    return write(None, _claim_digest, run_id, shard, expected, after_phone, users)
+
+@retry_locked
+def record_digest_sends(run_id: str, shard: str, after_phone: str,
+                        sent: int, failed: int, skipped: int = 0) -> None:
+    """Record the outcome of the batch claimed from ``after_phone``. Until
+    this runs the batch stays in digest_claims and counts as unsent, so a
+    crash mid-batch leaves a record of whom it may have missed."""
+    write(None, _count_digest, run_id, shard, after_phone, sent, failed, skipped)
+
+def unsent_digest_claims(run_id: str) -> List[sqlite3.Row]:
+    """Batches of the run that were claimed but never recorded."""
+    with get_conn() as conn:
+        return conn.execute(
+            "SELECT * FROM digest_claims WHERE run_id=? ORDER BY shard, after_phone", (run_id,)
+        ).fetchall()
+
+@retry_locked
+def finish_digest_run(run_id: str) -> None:
+    write(None, _finish_digest, run_id, time.time())
@@ -0,0 +1,77 @@
+# whatsappbot/dedupe.py
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional
+
+from whatsappbot import async_db
+
+class MessageDeduper:
+    """Drops webhook redeliveries by WhatsApp message id.
+
+    A bounded in-memory set answers the common case (a retry seconds after
+    the original); the processed_messages table catches the rest across
+    restarts and worker processes. Ids older than ``ttl`` are pruned.
+    """
+
+    def __init__(self, max_recent: int = 10000, ttl: float = 86400.0,
+                 prune_every: float = 3600.0):
+        self.max_recent = max_recent
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._last_prune = 0.0
+        self.checked = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.released = 0
+        self.pruned = 0
+
+    def _remember(self, msg_id: str) -> None:
+        self._recent[msg_id] = None
+        self._recent.move_to_end(msg_id)
+        while len(self._recent) > self.max_recent:
+            self._recent.popitem(last=False)
+
+    async def filter_new(self, ids: List[str], senders: Optional[Mapping[str, str]] = None) -> List[str]:
+        """Claim ids and return the ones that have not been seen before.
+        ``senders`` maps ids to the phone that sent them; see
+        db.claim_message_ids."""
+        self.checked += len(ids)
+        unseen = []
+        for msg_id in ids:
+            if msg_id in self._recent or msg_id in unseen:
+                self.memory_hits += 1
+            else:
+                unseen.append(msg_id)
+        if not unseen:
+            return []
+        fresh = await async_db.claim_message_ids(unseen, senders)
+        self.db_hits += len(unseen) - len(fresh)
+        for msg_id in unseen:
+            self._remember(msg_id)
+        await self._maybe_prune()
+        return fresh
+
+    async def release(self, ids: List[str]) -> None:
+        for msg_id in ids:
+            self._recent.pop(msg_id, None)
+        self.released += len(ids)
+        await async_db.release_message_ids(ids)
+
+    async def _maybe_prune(self) -> None:
+        now = time.monotonic()
+        if now - self._last_prune >= self.prune_every:
+            self._last_prune = now
+            self.pruned += await async_db.prune_message_ids(self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recent": len(self._recent),
+            "max_recent": self.max_recent,
+            "checked": self.checked,
+            "duplicates": self.memory_hits + self.db_hits,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "released": self.released,
+            "pruned": self.pruned,
+        }
@@ -0,0 +1,215 @@
+# whatsappbot/digests.py
+import asyncio
+import calendar
+import os
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from whatsappbot import async_db, db, replies
+from whatsappbot.outbound import TokenBucket
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+class DigestSchedule:
+    """When one scope's digest goes out: ``"08:00"`` daily for today,
+    ``"mon 08:00"`` weekly for week, ``"1 08:00"`` monthly for month (a day
+    past the month's end means its last day)."""
+
+    def __init__(self, scope: str, spec: str):
+        self.scope = scope
+        self.spec = spec
+        *day, at = spec.split()
+        self.hour, self.minute = (int(x) for x in at.split(":"))
+        self.weekday = WEEKDAYS.index(day[0][:3].lower()) if scope == "week" and day else 0
+        self.monthday = int(day[0]) if scope == "month" and day else 1
+        if day and scope == "today":
+            raise ValueError(f"today digests run daily; got {spec!r}")
+
+    def period(self, now: datetime) -> Tuple[str, datetime]:
+        """(period key, due time) for the period containing ``now``."""
+        at = {"hour": self.hour, "minute": self.minute, "second": 0, "microsecond": 0}
+        if self.scope == "week":
+            year, week, _ = now.isocalendar()
+            monday = now - timedelta(days=now.weekday())
+            return f"{year}-W{week:02d}", (monday + timedelta(days=self.weekday)).replace(**at)
+        if self.scope == "month":
+            last = calendar.monthrange(now.year, now.month)[1]
+            return f"{now:%Y-%m}", now.replace(day=min(self.monthday, last), **at)
+        return f"{now:%Y-%m-%d}", now.replace(**at)
+
+    def next_due(self, now: datetime) -> datetime:
+        _, due = self.period(now)
+        if due > now:
+            return due
+        if self.scope == "week":
+            following = now + timedelta(days=7 - now.weekday())
+        elif self.scope == "month":
+            following = (now.replace(day=1) + timedelta(days=32)).replace(day=1)
+        else:
+            following = now + timedelta(days=1)
+        return self.period(following)[1]
+
+class DigestScheduler:
+    """Proactive digests of each user's open tasks for a scope.
+
+    A run walks the task files one at a time. Each batch of ``batch`` users
+    comes from a single grouped query (db.digest_batch), is rendered in one
+    go and handed to ``send`` with ``concurrency`` sends in flight, paced to
+    ``rate`` messages a second so replies keep the rest of the business
+    number's throughput.
+
+    Digests are plain text, which WhatsApp only delivers within 24 hours of
+    the user's last message to us, so users not heard from within
+    ``window`` seconds are skipped (and counted) rather than sent a message
+    that would be rejected. Failed sends are counted, not dead-lettered: a
+    replay hours later would be stale and outside the window anyway.
+
+    Progress is checkpointed in DB_PATH per run (``<scope>:<period>``) and
+    task file: a batch is claimed by moving the file's cursor past it before
+    anything in it is sent. A crash mid-batch therefore skips the unsent
+    rest of that batch instead of ever sending twice; the batch stays in
+    digest_claims and in the run's ``unsent`` count, so the loss is on
+    record. A restart within the same period resumes from the cursors. A
+    run missed while the bot was down still starts up to ``grace`` seconds
+    after its due time.
+    """
+
+    def __init__(self, send: Callable[[str, str], Awaitable[Any]], schedules: List[DigestSchedule],
+                 tz: tzinfo = timezone.utc, batch: int = 200, concurrency: int = 32,
+                 rate: float = 40.0, max_tasks: int = 15, grace: float = 6 * 3600,
+                 window: float = 24 * 3600):
+        self.send = send
+        self.schedules = schedules
+        self.tz = tz
+        self.batch = batch
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, max(rate, 1.0))
+        self.max_tasks = max_tasks
+        self.grace = grace
+        self.window = window
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.current: Optional[Dict[str, Any]] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        if self.schedules and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="digests")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            for schedule in self.schedules:
+                try:
+                    await self._run_if_due(schedule, datetime.now(self.tz))
+                except Exception as e:
+                    self.failures += 1
+                    self.current = None
+                    print("Digest run failed:", schedule.scope, e)
+            now = datetime.now(self.tz)
+            wait = min((s.next_due(now) - now).total_seconds() for s in self.schedules)
+            # wake at least every 5 minutes so a failed run is retried and clock jumps are noticed
+            await asyncio.sleep(min(max(wait, 1.0), 300.0))
+
+    async def _run_if_due(self, schedule: DigestSchedule, now: datetime) -> None:
+        key, due = schedule.period(now)
+        if now < due:
+            return
+        run_id = f"{schedule.scope}:{key}"
+        run = await async_db.run(db.get_digest_run, run_id)
+        if run is None and (now - due).total_seconds() > self.grace:
+            return   # missed by too long; wait for the next period
+        if run is None or run["finished_at"] is None:
+            await self.run(schedule.scope, run_id)
+
+    async def run(self, scope: str, run_id: str) -> Dict[str, Any]:
+        """Send (or resume) one run; returns its totals. A finished run is
+        never sent again."""
+        run = await async_db.run(db.get_digest_run, run_id)
+        if run is not None and run["finished_at"] is not None:
+            return {k: run[k] for k in ("claimed", "sent", "failed", "skipped", "unsent")}
+        started = time.perf_counter()
+        await async_db.run_write(db.start_digest_run, run_id, scope)
+        self.current = progress = {"run": run_id, "claimed": 0, "sent": 0, "failed": 0, "skipped": 0}
+        # cursors are keyed by file name, so reshard between runs, not during one
+        for path in db.task_db_paths():
+            shard = path.name
+            after = await async_db.run(db.digest_cursor, run_id, shard)
+            while True:
+                batch = await async_db.run(db.digest_batch, path, scope, after, self.batch, self.max_tasks)
+                if not batch:
+                    break
+                last = batch[-1][0]
+                if not await async_db.run_write(db.claim_digest_batch, run_id, shard, after, last, len(batch)):
+                    # another process claimed past ``after``; continue from its cursor
+                    after = await async_db.run(db.digest_cursor, run_id, shard)
+                    continue
+                claimed_from, after = after, last
+                progress["claimed"] += len(batch)
+                recent = await async_db.run(
+                    db.recent_senders, [phone for phone, _, _ in batch], time.time() - self.window)
+                reachable = [item for item in batch if item[0] in recent]
+                sent, failed = await self._send_batch(scope, reachable)
+                skipped = len(batch) - len(reachable)
+                progress["sent"] += sent
+                progress["failed"] += failed
+                progress["skipped"] += skipped
+                await async_db.run_write(db.record_digest_sends, run_id, shard, claimed_from,
+                                         sent, failed, skipped)
+        await async_db.run_write(db.finish_digest_run, run_id)
+        # batches claimed (by any process) and never recorded, e.g. after a crash
+        lost = await async_db.run(db.unsent_digest_claims, run_id)
+        for claim in lost:
+            print("Digest batch claimed but not sent:", run_id, claim["shard"],
+                  f"({claim['after_phone']!r}, {claim['last_phone']!r}]", claim["users"], "users")
+        self.runs += 1
+        self.last_run = {**progress, "unsent": sum(c["users"] for c in lost),
+                         "seconds": round(time.perf_counter() - started, 3), "at": time.time()}
+        self.current = None
+        return self.last_run
+
+    async def _send_batch(self, scope: str, batch: List[Tuple[str, int, list]]) -> Tuple[int, int]:
+        slots = asyncio.Semaphore(self.concurrency)
+
+        async def send_one(phone: str, body: str) -> bool:
+            async with slots:
+                await self.bucket.acquire()
+                try:
+                    return bool(await self.send(phone, body))
+                except Exception as e:
+                    print("Digest send failed:", phone, e)
+                    return False
+
+        bodies = [(phone, replies.render_digest(scope, rows, total)) for phone, total, rows in batch]
+        results = await asyncio.gather(*(send_one(phone, body) for phone, body in bodies))
+        sent = sum(results)
+        return sent, len(results) - sent
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "schedules": {s.scope: s.spec for s in self.schedules},
+            "runs": self.runs,
+            "failures": self.failures,
+            "running": self.current,
+            "last_run": self.last_run,
+        }
+
+def schedules_from_env() -> List[DigestSchedule]:
+    """DIGEST_TODAY_AT / DIGEST_WEEK_AT / DIGEST_MONTH_AT; unset ones are off."""
+    specs = (("today", "DIGEST_TODAY_AT"), ("week", "DIGEST_WEEK_AT"), ("month", "DIGEST_MONTH_AT"))
+    return [DigestSchedule(scope, os.environ[var]) for scope, var in specs if os.getenv(var)]
+
+def timezone_from_env() -> tzinfo:
+    name = os.getenv("DIGEST_TZ", "UTC")
+    return timezone.utc if name.upper() == "UTC" else ZoneInfo(name)
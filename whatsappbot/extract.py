@@ -0,0 +1,150 @@
+# whatsappbot/extract.py
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Tuple
+
+import markdownify
+import readabilipy
+from bs4 import BeautifulSoup
+
+from whatsappbot.metrics import registry
+
+# readability, markdownify and text_fallback here; mcp_starter adds network and search
+stage_seconds = registry.histogram(
+    "fetch_stage_seconds", "Time spent in each stage of fetching and simplifying a page.", ("stage",))
+
+FAILED = "<error>Page failed to be simplified from HTML</error>"
+
+def html_to_markdown(html: str) -> str:
+    """Readability + markdownify. CPU heavy; runs inside pool workers."""
+    return html_to_markdown_timed(html)[0]
+
+def html_to_markdown_timed(html: str) -> Tuple[str, float, float]:
+    """html_to_markdown plus the seconds spent in readability and in
+    markdownify, for workers to report back to the parent's metrics."""
+    started = time.perf_counter()
+    ret = readabilipy.simple_json.simple_json_from_html_string(html, use_readability=True)
+    readable = time.perf_counter()
+    if not ret or not ret.get("content"):
+        return FAILED, readable - started, 0.0
+    markdown = markdownify.markdownify(ret["content"], heading_style=markdownify.ATX)
+    return markdown, readable - started, time.perf_counter() - readable
+
+def html_to_text(html: str) -> str:
+    """Cheap fallback: visible text only, no readability pass."""
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "noscript", "svg", "head"]):
+        tag.decompose()
+    lines = (line.strip() for line in soup.get_text("\n").splitlines())
+    return "\n".join(line for line in lines if line) or FAILED
+
+class Extractor:
+    """Runs html_to_markdown in a bounded set of worker processes.
+
+    Pages over ``max_bytes``, calls that would queue beyond ``max_queue``
+    and extractions slower than ``timeout`` all degrade to html_to_text
+    (on a thread) instead of holding up the event loop. Each worker is its
+    own single-process pool (a lane), so a worker that timed out or died is
+    replaced on its own while extractions on the other lanes carry on.
+    """
+
+    def __init__(self, workers: int = 2, timeout: float = 10.0,
+                 max_bytes: int = 2_000_000, max_queue: int = 8):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self._lanes: List[ProcessPoolExecutor] = []
+        # idle lanes; waiting here is queueing, so timeout counts CPU time only
+        self._idle: "asyncio.LifoQueue[ProcessPoolExecutor]" = asyncio.LifoQueue()
+        self._pending = 0
+        self.completed = 0
+        self.too_large = 0
+        self.shed = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.replaced = 0
+
+    def start(self) -> None:
+        while len(self._lanes) < self.workers:
+            lane = ProcessPoolExecutor(max_workers=1)
+            self._lanes.append(lane)
+            self._idle.put_nowait(lane)
+
+    def shutdown(self) -> None:
+        for lane in self._lanes:
+            lane.shutdown(wait=False, cancel_futures=True)
+        self._lanes = []
+        self._idle = asyncio.LifoQueue()
+
+    def _replace(self, lane: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Stop ``lane``'s worker (a stuck one never returns and would pin a
+        CPU) and return a fresh lane in its place."""
+        for proc in list(getattr(lane, "_processes", {}).values()):
+            proc.terminate()
+        lane.shutdown(wait=False, cancel_futures=True)
+        fresh = ProcessPoolExecutor(max_workers=1)
+        self._lanes = [fresh if l is lane else l for l in self._lanes]
+        self.replaced += 1
+        return fresh
+
+    async def _fallback(self, html: str) -> str:
+        with stage_seconds.time(stage="text_fallback"):
+            return await asyncio.to_thread(html_to_text, html)
+
+    async def extract(self, html: str) -> str:
+        if len(html) > self.max_bytes:
+            self.too_large += 1
+            return await self._fallback(html)
+        if self._pending >= self.max_queue:
+            self.shed += 1
+            return await self._fallback(html)
+        self._pending += 1
+        try:
+            self.start()
+            lane = await self._idle.get()
+            try:
+                future = asyncio.get_running_loop().run_in_executor(lane, html_to_markdown_timed, html)
+                result, readability_s, markdownify_s = await asyncio.wait_for(future, self.timeout)
+                stage_seconds.observe(readability_s, stage="readability")
+                stage_seconds.observe(markdownify_s, stage="markdownify")
+                self.completed += 1
+                return result
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                lane = self._replace(lane)
+            except BrokenProcessPool:
+                # the worker died (OOM, segfault in a parser)
+                self.errors += 1
+                lane = self._replace(lane)
+            except Exception:
+                self.errors += 1
+            finally:
+                if lane in self._lanes:
+                    self._idle.put_nowait(lane)
+        finally:
+            self._pending -= 1
+        return await self._fallback(html)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "too_large": self.too_large,
+            "shed": self.shed,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "replaced": self.replaced,
+        }
+
+extractor = Extractor(
+    workers=int(os.getenv("EXTRACT_WORKERS", "2")),
+    timeout=float(os.getenv("EXTRACT_TIMEOUT", "10")),
+    max_bytes=int(os.getenv("EXTRACT_MAX_BYTES", "2000000")),
+    max_queue=int(os.getenv("EXTRACT_MAX_QUEUE", "8")),
+)
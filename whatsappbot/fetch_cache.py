@@ -0,0 +1,208 @@
+# whatsappbot/fetch_cache.py
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from whatsappbot.pool import ConnectionPool
+
+T = TypeVar("T")
+
+CACHE_PATH = Path(os.getenv(
+    "FETCH_CACHE_PATH", Path(__file__).resolve().parent.parent / "fetch_cache.db"
+))
+# Stale entries are kept this long past expiry so they can be revalidated
+# with ETag / Last-Modified instead of downloaded again.
+STALE_KEEP = float(os.getenv("FETCH_CACHE_STALE_KEEP", str(7 * 24 * 3600)))
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def normalize_url(url: str) -> str:
+    """Canonical form for cache keys: lowercase scheme/host, no default port,
+    no fragment, sorted query."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+def ttl_from_headers(headers: Any, default: float) -> Optional[float]:
+    """Seconds to keep a response fresh; None when it must not be stored.
+
+    This is a shared cache, so ``private`` responses are not stored either;
+    ``no-cache`` ones are stored already stale (revalidated before reuse).
+    """
+    directives = {}
+    for part in (headers.get("cache-control") or "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    if directives.get("max-age", "").isdigit():
+        return float(directives["max-age"])
+    return default
+
+@dataclass
+class CacheEntry:
+    value: str                       # final markdown / JSON payload, not raw HTML
+    prefix: str = ""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    expires_at: float = 0.0
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class FetchCache:
+    """Two-tier cache: in-memory LRU in front of a SQLite file.
+
+    Disk reads and writes run on the cache's own threads, so they never
+    queue behind task queries on the db executor (or show up in its metrics).
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, max_entries: int = 512):
+        self.path = path
+        self.max_entries = max_entries
+        self._mem: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.mem_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.stores = 0
+
+    def _conn_pool(self) -> ConnectionPool:
+        with self._pool_lock:
+            if self._pool is None:
+                pool = ConnectionPool(self.path, max_size=4)
+                with pool.connection() as conn:
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS fetch_cache (
+                            key TEXT PRIMARY KEY,
+                            entry TEXT NOT NULL,
+                            expires_at REAL NOT NULL
+                        )
+                    """)
+                    conn.commit()
+                self._pool = pool
+            return self._pool
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a blocking cache call (e.g. ``prune``) on the cache's threads."""
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fetch-cache")
+            executor = self._executor
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    def _remember(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[CacheEntry]:
+        with self._conn_pool().connection() as conn:
+            row = conn.execute("SELECT entry FROM fetch_cache WHERE key=?", (key,)).fetchone()
+        return CacheEntry(**json.loads(row["entry"])) if row else None
+
+    def _disk_put(self, key: str, entry: CacheEntry) -> None:
+        with self._conn_pool().connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fetch_cache (key, entry, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(asdict(entry)), entry.expires_at),
+            )
+            conn.commit()
+
+    def prune(self) -> int:
+        """Drop disk entries that are past expiry plus the revalidation window."""
+        with self._conn_pool().connection() as conn:
+            cur = conn.execute("DELETE FROM fetch_cache WHERE expires_at < ?", (time.time() - STALE_KEEP,))
+            conn.commit()
+            return cur.rowcount
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """Return the entry (fresh or stale) from memory, then disk."""
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+        if entry is not None:
+            if entry.fresh:
+                self.mem_hits += 1
+            else:
+                self.stale += 1
+            return entry
+        entry = await self.run(self._disk_get, key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.fresh:
+            self.disk_hits += 1
+        else:
+            self.stale += 1
+        self._remember(key, entry)
+        return entry
+
+    async def put(self, key: str, entry: CacheEntry) -> None:
+        self._remember(key, entry)
+        self.stores += 1
+        await self.run(self._disk_put, key, entry)
+
+    async def refresh(self, key: str, entry: CacheEntry, ttl: float) -> CacheEntry:
+        """A 304 came back: extend the existing entry's lifetime."""
+        entry.expires_at = time.time() + ttl
+        self.revalidated += 1
+        await self.put(key, entry)
+        return entry
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._pool is not None:
+                self._pool.close()
+                self._pool = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "memory_entries": len(self._mem),
+            "max_entries": self.max_entries,
+            "memory_hits": self.mem_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "revalidated": self.revalidated,
+            "stores": self.stores,
+        }
+
+fetch_cache = FetchCache(max_entries=int(os.getenv("FETCH_CACHE_SIZE", "512")))
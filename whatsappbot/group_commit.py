@@ -0,0 +1,146 @@
+# whatsappbot/group_commit.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple
+
+import sqlite3
+
+Op = Callable[..., Any]
+_STOP = object()
+
+class GroupCommitter:
+    """Write-behind coordinator for one SQLite file.
+
+    Callers ``submit`` an op — a function taking a connection and returning
+    the caller's result (lastrowid, rowcount, ...) without committing. A
+    single writer thread takes whatever arrives within ``window`` seconds of
+    the first op, up to ``max_batch`` ops, and runs them in one transaction,
+    each inside its own SAVEPOINT so a failing op is rolled back alone.
+    Futures resolve only after the COMMIT, so a caller that waits on its
+    future reads its own write afterwards; ops later in a batch also see
+    the writes of earlier ones. Once ``close`` starts, new submissions fail
+    immediately, and anything the writer never reached fails on close.
+    """
+
+    def __init__(self, connection: Callable[[], ContextManager[sqlite3.Connection]],
+                 window: float = 0.002, max_batch: int = 64, name: str = "db-writer"):
+        self.connection = connection
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self.max_seen = 0
+        self.commit_time = 0.0
+
+    def submit(self, op: Op, args: Tuple = ()) -> "Future[Any]":
+        future: "Future[Any]" = Future()
+        with self._lock:
+            # checked under the lock so nothing is queued behind _STOP
+            if self._closed:
+                future.set_exception(RuntimeError("group committer is closed"))
+                return future
+            self._queue.put((op, args, future))
+        return future
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush pending writes and stop the writer thread; writes it didn't
+        reach within ``timeout`` fail instead of waiting forever."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[2].set_exception(RuntimeError("group committer closed before this write ran"))
+                with self._lock:
+                    self.failed += 1
+        if self._thread.is_alive():
+            self._queue.put(_STOP)   # drained above; a stuck writer still exits once it's free
+
+    def _collect(self, first: Any) -> Tuple[List[Tuple[Op, Tuple, Future]], bool]:
+        batch, stop = [first], False
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            self._apply(batch)
+            if stop:
+                return
+
+    def _apply(self, batch: List[Tuple[Op, Tuple, Future]]) -> None:
+        started = time.perf_counter()
+        results: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        try:
+            with self.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for op, args, future in batch:
+                    conn.execute("SAVEPOINT op")
+                    try:
+                        result = op(conn, *args)
+                    except Exception as e:
+                        conn.execute("ROLLBACK TO op")
+                        conn.execute("RELEASE op")
+                        results.append((future, None, e))
+                    else:
+                        conn.execute("RELEASE op")
+                        results.append((future, result, None))
+                conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed: nothing in the batch was written
+            for _, _, future in batch:
+                future.set_exception(e)
+            with self._lock:
+                self.failed += len(batch)
+            return
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        with self._lock:
+            self.batches += 1
+            self.writes += len(batch)
+            self.failed += sum(1 for _, _, error in results if error is not None)
+            self.max_seen = max(self.max_seen, len(batch))
+            self.commit_time += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending": self._queue.qsize(),
+                "batches": self.batches,
+                "writes": self.writes,
+                "failed": self.failed,
+                "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0.0,
+                "max_batch": self.max_seen,
+                "commit_time_s": round(self.commit_time, 3),
+            }
@@ -0,0 +1,69 @@
+# whatsappbot/http_clients.py
+import importlib.util
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+import httpx
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]").
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+@dataclass
+class PoolConfig:
+    max_connections: int = 20
+    max_keepalive: int = 10
+    keepalive_expiry: float = 60.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 15.0
+    write_timeout: float = 10.0
+    pool_timeout: float = 5.0
+    http2: bool = True
+    follow_redirects: bool = False
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    def build(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            http2=self.http2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=self.connect_timeout,
+                read=self.read_timeout,
+                write=self.write_timeout,
+                pool=self.pool_timeout,
+            ),
+            follow_redirects=self.follow_redirects,
+            headers=self.headers,
+        )
+
+class HTTPClients:
+    """Application-scoped httpx clients, one connection pool per upstream.
+
+    Owners call ``start()`` at startup and ``aclose()`` at shutdown. ``get``
+    also creates a client on first use so code paths exercised outside the
+    server lifecycle (scripts, in-process calls) still work.
+    """
+
+    def __init__(self, pools: Dict[str, PoolConfig]):
+        self._configs = pools
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._configs[name].build()
+        return client
+
+    async def start(self) -> None:
+        for name in self._configs:
+            self.get(name)
+
+    async def aclose(self, name: Optional[str] = None) -> None:
+        names = [name] if name else list(self._clients)
+        for n in names:
+            client = self._clients.pop(n, None)
+            if client is not None:
+                await client.aclose()
@@ -1,48 +1,145 @@
 from fastapi import FastAPI, Request, Response, HTTPException
 from dotenv import load_dotenv
-import os, json
-import httpx
+import os, json, logging, time
+from contextlib import asynccontextmanager
 
 from whatsappbot import nlu
-from whatsappbot.db import init_db, add_task, list_tasks, complete_task, delete_task
-from whatsappbot import mcp_client  # NEW
+from whatsappbot import async_db
+from whatsappbot.cache import MISS, LRUCache, task_cache
+from whatsappbot.db import pool_stats
+from whatsappbot.dedupe import MessageDeduper
+from whatsappbot.digests import DigestScheduler, schedules_from_env, timezone_from_env
+from whatsappbot.http_clients import HTTPClients, PoolConfig
+from whatsappbot.maintenance import maintenance
+from whatsappbot.metrics import CONTENT_TYPE, profiler, profiler_authorized, registry
+from whatsappbot.outbound import OutboundDispatcher
+from whatsappbot.work_queue import PhoneWorkQueue
+from whatsappbot import mcp_client
+from whatsappbot.backends import backend_name, make_backend
 
 load_dotenv()
 WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN", "")
 PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "")
 VERIFY_TOKEN = os.getenv("WHATSAPP_VERIFY_TOKEN", "")
-USE_MCP = os.getenv("USE_MCP", "false").lower() == "true"
+TASK_BACKEND = backend_name()   # direct | inprocess | mcp (USE_MCP=true -> mcp)
 
-API_URL = f"https://graph.facebook.com/v20.0/{PHONE_NUMBER_ID}/messages" if PHONE_NUMBER_ID else ""
+# overridable so load tests can point the bot at a local fake
+WHATSAPP_API_BASE = os.getenv("WHATSAPP_API_BASE", "https://graph.facebook.com/v20.0").rstrip("/")
+API_URL = f"{WHATSAPP_API_BASE}/{PHONE_NUMBER_ID}/messages" if PHONE_NUMBER_ID else ""
 
-app = FastAPI(title="WhatsApp Bot")
+# Per-process state: per-phone ordering (work_queue and the outbound queue),
+# "more" cursors (list_cursors) and the outbound token buckets. Running
+# several bot processes needs sticky routing by phone, and BOT_PROCESSES
+# set to their count so each takes its share of the business-number rate.
+BOT_PROCESSES = max(1, int(os.getenv("BOT_PROCESSES", "1")))
 
-@app.on_event("startup")
-def on_start():
-    init_db()
+log = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the queues, pools and schedulers below are module globals, started here
+    await async_db.init_db()
+    await http.start()
+    await outbound.start()
+    await work_queue.start()
+    maintenance.start()
+    digests.start()
+    try:
+        yield
+    finally:
+        await digests.stop()
+        await maintenance.stop()
+        await work_queue.stop()
+        await outbound.stop()
+        await backend.close()
+        await http.aclose()
+        async_db.shutdown()
+
+app = FastAPI(title="WhatsApp Bot", lifespan=lifespan)
+
+message_seconds = registry.histogram(
+    "bot_message_seconds", "Time from a worker taking a message to its reply being sent, by intent.", ("intent",))
+http_seconds = registry.histogram(
+    "bot_http_seconds", "Time to answer an HTTP request (webhook acks included), by route and status.",
+    ("route", "status"))
+messages_in_flight = registry.gauge("bot_messages_in_flight", "Messages being handled by workers.")
+errors_total = registry.counter("bot_errors_total", "Messages whose handling raised, by intent.", ("intent",))
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # the matched route's template, so unknown paths can't blow up the label set
+    route = getattr(request.scope.get("route"), "path", "other")
+    http_seconds.observe(time.perf_counter() - started, route=route, status=response.status_code)
+    return response
+
+backend = make_backend(TASK_BACKEND)
+
+# phone -> (scope, cursor) of the last list page sent, for "more"
+list_cursors = LRUCache(max_size=int(os.getenv("LIST_CURSORS", "10000")),
+                        ttl=float(os.getenv("LIST_CURSOR_TTL", "3600")))
+
+async def list_page(phone: str, scope, cursor=None) -> str:
+    reply, next_cursor = await backend.list_tasks(phone, scope, cursor)
+    list_cursors.set((phone,), (scope, next_cursor), list_cursors.generation(phone))
+    return reply
+
+# One keep-alive (HTTP/2 when available) pool to the Graph API for the app's lifetime
+http = HTTPClients({
+    "graph": PoolConfig(
+        max_connections=int(os.getenv("GRAPH_MAX_CONNECTIONS", "50")),
+        max_keepalive=int(os.getenv("GRAPH_MAX_KEEPALIVE", "20")),
+        read_timeout=15.0,
+    ),
+})
 
 @app.get("/")
 def home():
     return {"message": "WhatsApp Bot is running!"}
 
+# Rate-limited, retrying sender with its own queue; chunks long replies and
+# dead-letters failures
+outbound = OutboundDispatcher(
+    lambda: http.get("graph"),
+    API_URL,
+    WHATSAPP_TOKEN,
+    business_rate=float(os.getenv("WA_BUSINESS_RATE", "80")) / BOT_PROCESSES,
+    business_burst=float(os.getenv("WA_BUSINESS_BURST", "80")) / BOT_PROCESSES,
+    recipient_rate=float(os.getenv("WA_RECIPIENT_RATE", "1")),
+    recipient_burst=float(os.getenv("WA_RECIPIENT_BURST", "10")),
+    max_attempts=int(os.getenv("WA_SEND_ATTEMPTS", "5")),
+    senders=int(os.getenv("WA_SENDERS", "16")),
+    queue_size=int(os.getenv("WA_SEND_QUEUE_SIZE", "5000")),
+)
+
 async def send_whatsapp_text(to_phone: str, text: str):
+    """Queue a reply; returns as soon as it is queued, not when it is sent."""
     if not (WHATSAPP_TOKEN and API_URL):
-        print("WARN: Missing WHATSAPP_TOKEN or PHONE_NUMBER_ID.")
+        log.warning("Missing WHATSAPP_TOKEN or PHONE_NUMBER_ID.")
         return
-    headers = {
-        "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "messaging_product": "whatsapp",
-        "to": to_phone,
-        "type": "text",
-        "text": {"body": text}
-    }
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.post(API_URL, headers=headers, json=payload)
-        r.raise_for_status()
-        return r.json()
+    return await outbound.enqueue(to_phone, text)
+
+async def deliver_whatsapp_text(to_phone: str, text: str):
+    """Send now and wait; returns the API responses of the delivered chunks.
+    Failures are not dead-lettered: the caller counts and reports them."""
+    if not (WHATSAPP_TOKEN and API_URL):
+        log.warning("Missing WHATSAPP_TOKEN or PHONE_NUMBER_ID.")
+        return
+    return await outbound.send(to_phone, text, dead_letter=False)
+
+# Scheduled digests of open tasks (DIGEST_TODAY_AT etc.; all off by default),
+# paced below the business rate so replies still get through
+digests = DigestScheduler(
+    deliver_whatsapp_text,
+    schedules_from_env(),
+    tz=timezone_from_env(),
+    batch=int(os.getenv("DIGEST_BATCH", "200")),
+    concurrency=int(os.getenv("DIGEST_CONCURRENCY", "32")),
+    rate=float(os.getenv("DIGEST_RATE", "40")) / BOT_PROCESSES,
+    max_tasks=int(os.getenv("DIGEST_MAX_TASKS", "15")),
+    grace=float(os.getenv("DIGEST_GRACE_HOURS", "6")) * 3600,
+)
 
 @app.get("/wa/webhook")
 async def verify(request: Request):
@@ -54,18 +151,27 @@ async def verify(request: Request):
         return Response(content=challenge, media_type="text/plain")
     raise HTTPException(status_code=403, detail="Verification failed")
 
-@app.post("/wa/webhook")
-async def incoming(request: Request):
-    body = await request.json()
+def iter_messages(body: dict):
+    """Every message in a (possibly batched) webhook delivery."""
+    for entry in body.get("entry", []) or []:
+        for change in entry.get("changes", []) or []:
+            for msg in (change.get("value") or {}).get("messages", []) or []:
+                yield msg
+
+async def handle_message(msg: dict):
+    started = time.perf_counter()
+    labels = {"intent": "none"}
+    messages_in_flight.inc()
+    try:
+        with profiler.track("bot") as tracked:
+            await respond(msg, labels)
+            tracked["name"] = f"bot:{labels['intent']}"
+    finally:
+        messages_in_flight.dec()
+        message_seconds.observe(time.perf_counter() - started, **labels)
+
+async def respond(msg: dict, labels: dict):
     try:
-        entry = body.get("entry", [])[0]
-        changes = entry.get("changes", [])[0]
-        value = changes.get("value", {})
-        messages = value.get("messages", [])
-        if not messages:
-            return {"status": "ok"}
-
-        msg = messages[0]
         from_phone = msg.get("from")
         msg_type = msg.get("type")
 
@@ -83,64 +189,140 @@ async def incoming(request: Request):
             # --- NLU ---
             parsed = nlu.parse(user_text)
 
-            intent = parsed["intent"]
+            intent = labels["intent"] = parsed["intent"]
             scope = parsed["scope"]
             text = parsed["text"]
+            items = parsed["items"]
 
             if intent == "help":
                 reply = ("Try:\n"
                          "- add buy milk to today\n"
+                         "- add milk, eggs, bread to today\n"
                          "- show today\n"
+                         "- more (next page of a long list)\n"
                          "- complete buy milk\n"
+                         "- done 3 5 8\n"
                          "- delete 3 (by id)\n")
 
+            elif intent == "add" and scope and items:
+                reply = await backend.add_tasks(from_phone, scope, items)
+
             elif intent == "add" and scope and text:
-                if USE_MCP:
-                    resp = await mcp_client.mcp_add_task(from_phone, scope, text)
-                    reply = resp["message"]
-                else:
-                    task_id = add_task(from_phone, scope, text)
-                    reply = f"✅ Added (#{task_id}) to {scope}: “{text}”"
+                reply = await backend.add_task(from_phone, scope, text)
 
             elif intent == "list":
-                if USE_MCP:
-                    resp = await mcp_client.mcp_list_tasks(from_phone, scope)
-                    reply = resp["message"]
+                reply = await list_page(from_phone, scope)
+
+            elif intent == "more":
+                last = list_cursors.get((from_phone,))
+                if last is MISS or last[1] is None:
+                    reply = "That’s everything. Type *show* to list your tasks again."
                 else:
-                    rows = list_tasks(from_phone, scope)
-                    if not rows:
-                        sc = scope or "all"
-                        reply = f"(empty) No open tasks in {sc}."
-                    else:
-                        lines = [f"• #{r['id']} [{r['scope']}] {r['text']}" for r in rows]
-                        reply = "Your tasks:\n" + "\n".join(lines)
+                    reply = await list_page(from_phone, last[0], last[1])
+
+            elif intent == "complete" and items:
+                reply = await backend.complete_tasks(from_phone, items)
 
             elif intent == "complete" and text:
-                if USE_MCP:
-                    resp = await mcp_client.mcp_complete_task(from_phone, text)
-                    reply = resp["message"]
-                else:
-                    count = complete_task(from_phone, text)
-                    reply = "✅ Marked done." if count else "Couldn’t find that task."
+                reply = await backend.complete_task(from_phone, text)
+
+            elif intent == "delete" and items:
+                reply = await backend.delete_tasks(from_phone, items)
 
             elif intent == "delete" and text:
-                if USE_MCP:
-                    resp = await mcp_client.mcp_delete_task(from_phone, text)
-                    reply = resp["message"]
-                else:
-                    count = delete_task(from_phone, text)
-                    reply = "🗑️ Deleted." if count else "Couldn’t find that task."
+                reply = await backend.delete_task(from_phone, text)
 
             else:
                 reply = "Sorry, I didn’t get that. Type *help* for examples."
 
             await send_whatsapp_text(from_phone, reply)
 
-    except Exception as e:
-        print("Webhook error:", e, "\nBody:", json.dumps(body, indent=2))
+    except Exception:
+        errors_total.inc(**labels)
+        log.exception("Webhook error; message: %s", json.dumps(msg))
+
+deduper = MessageDeduper(
+    max_recent=int(os.getenv("DEDUPE_RECENT", "10000")),
+    ttl=float(os.getenv("DEDUPE_TTL", "86400")),
+)
+
+# Webhook deliveries are acknowledged as soon as their messages are queued;
+# the NLU, DB work and reply happen on these workers.
+work_queue = PhoneWorkQueue(
+    handle_message,
+    workers=int(os.getenv("WEBHOOK_WORKERS", "16")),
+    maxsize=int(os.getenv("WEBHOOK_QUEUE_SIZE", "2000")),
+    put_timeout=float(os.getenv("WEBHOOK_PUT_TIMEOUT", "2")),
+)
 
+# the /stats counters, also scraped from /metrics as gauges
+for prefix, source in (("bot_work_queue", work_queue.stats), ("bot_dedupe", deduper.stats),
+                       ("bot_task_cache", task_cache.stats), ("bot_maintenance", maintenance.stats),
+                       ("bot_digests", digests.stats)):
+    registry.register_stats(prefix, source)
+# in_flight is already the outbound_in_flight gauge
+registry.register_stats("bot_outbound", outbound.stats, exclude=("in_flight",))
+
+@app.post("/wa/webhook")
+async def incoming(request: Request):
+    try:
+        body = await request.json()
+        messages = [m for m in iter_messages(body) if isinstance(m, dict)]
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        # malformed delivery: acknowledge it so Meta doesn't keep redelivering
+        log.warning("Webhook error: malformed body: %r", e)
+        return {"status": "ok"}
+    # redeliveries are dropped here, before any NLU/DB work is queued
+    # also records when each sender last wrote, which gates scheduled digests
+    senders = {m["id"]: m["from"] for m in messages if m.get("id") and m.get("from")}
+    fresh = set(await deduper.filter_new([m["id"] for m in messages if m.get("id")], senders))
+    pending = []
+    for m in messages:
+        if not m.get("id"):
+            pending.append(m)
+        elif m["id"] in fresh:
+            fresh.discard(m["id"])   # a second copy in the same delivery is a duplicate too
+            pending.append(m)
+    for i, msg in enumerate(pending):
+        if not await work_queue.submit(msg.get("from"), msg):
+            # queue full: un-claim what wasn't queued and ask Meta to redeliver later
+            await deduper.release([m["id"] for m in pending[i:] if m.get("id")])
+            raise HTTPException(status_code=503, detail="Busy, retry later")
     return {"status": "ok"}
 
 @app.get("/healthz")
 def health():
-    return {"ok": True}
\ No newline at end of file
+    return {"ok": True}
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/debug/profiler")
+def profiler_control(request: Request):
+    """Switch the slow-request profiler on/off at runtime and read its captures."""
+    params = dict(request.query_params)
+    if not profiler_authorized(request.headers.get("authorization"), params.pop("token", None)):
+        raise HTTPException(status_code=403, detail="Profiler disabled or bad token")
+    try:
+        return profiler.control(params)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/stats")
+def stats(request: Request):
+    """Queue, cache and pool internals; guarded like the profiler."""
+    if not profiler_authorized(request.headers.get("authorization"), request.query_params.get("token")):
+        raise HTTPException(status_code=403, detail="Stats disabled or bad token")
+    return {
+        "db_pool": pool_stats(),
+        "task_cache": task_cache.stats(),
+        "work_queue": work_queue.stats(),
+        "outbound": outbound.stats(),
+        "dedupe": deduper.stats(),
+        "maintenance": maintenance.stats(),
+        "digests": digests.stats(),
+        "profiler": profiler.stats(),
+        "backend": TASK_BACKEND,
+        "mcp_client": mcp_client.get_client().stats() if TASK_BACKEND == "mcp" else None,
+    }
\ No newline at end of file
@@ -0,0 +1,113 @@
+# whatsappbot/maintenance.py
+"""Housekeeping for the task files: archiving, vacuum and planner statistics.
+
+The bot runs it in the background; the one-off full vacuum is too heavy to
+run while serving, so it is a separate command.
+
+    python -m whatsappbot.maintenance                 # one pass now
+    python -m whatsappbot.maintenance --full-vacuum   # once, bot stopped: files
+                                                      # created before incremental vacuum
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from whatsappbot import async_db, db
+
+class Maintenance:
+    """Background housekeeping for tasks.db.
+
+    Every ``interval`` seconds: move tasks finished more than
+    ``archive_after`` seconds ago into tasks_archive, hand up to
+    ``vacuum_pages`` free pages back with an incremental vacuum, and refresh
+    the planner statistics. Each step runs on the db executor, in short
+    transactions, so the bot keeps serving while it runs. Files that still
+    need the one-time full VACUUM (``--full-vacuum``) are counted in
+    ``full_vacuum_pending``; incremental vacuum does nothing for them.
+    """
+
+    def __init__(self, interval: float = 3600.0, archive_after: float = 30 * 86400,
+                 vacuum_pages: int = 2000):
+        self.interval = interval
+        self.archive_after = archive_after
+        self.vacuum_pages = vacuum_pages
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.archived = 0
+        self.free_pages = 0
+        self.full_vacuum_pending = 0
+        self.last_run_s = 0.0
+        self.last_run_at: Optional[float] = None
+
+    def start(self) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(), name="db-maintenance")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.failures += 1
+                print("Maintenance failed:", repr(e))
+
+    async def run_once(self) -> None:
+        started = time.perf_counter()
+        self.archived += await async_db.run(db.archive_done_tasks, self.archive_after)
+        self.free_pages = await async_db.run(db.incremental_vacuum, self.vacuum_pages)
+        self.full_vacuum_pending = len(await async_db.run(db.full_vacuum_pending))
+        await async_db.run(db.analyze)
+        self.runs += 1
+        self.last_run_s = time.perf_counter() - started
+        self.last_run_at = time.time()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "archived": self.archived,
+            "free_pages": self.free_pages,
+            "full_vacuum_pending": self.full_vacuum_pending,
+            "last_run_s": round(self.last_run_s, 3),
+            "last_run_at": self.last_run_at,
+        }
+
+maintenance = Maintenance(
+    interval=float(os.getenv("MAINTENANCE_INTERVAL", "3600")),   # 0 disables
+    archive_after=float(os.getenv("ARCHIVE_AFTER_DAYS", "30")) * 86400,
+    vacuum_pages=int(os.getenv("VACUUM_PAGES", "2000")),
+)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full-vacuum", action="store_true",
+                        help="switch older files to incremental vacuum (rewrites each file)")
+    args = parser.parse_args()
+    db.init_db()
+    if args.full_vacuum:
+        converted = db.enable_incremental_vacuum()
+        db.close_pool()
+        print(f"Converted {len(converted)} file(s):", *converted)
+        return
+    try:
+        asyncio.run(maintenance.run_once())
+    finally:
+        async_db.shutdown()
+    print(maintenance.stats())
+
+if __name__ == "__main__":
+    main()
@@ -1,64 +1,231 @@
-import os, asyncio, httpx
-from typing import Optional
+import os, asyncio, itertools, json, time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
 
 # ✅ use a connectable host, not 0.0.0.0
 MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://127.0.0.1:8086/mcp")
 MCP_AUTH_TOKEN = os.getenv("MCP_AUTH_TOKEN", "your-secret-token")
 
+PROTOCOL_VERSION = "2025-06-18"
+
+# the request never reached the server, so retrying can't run a tool twice
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
 class MCPError(Exception): ...
 
+class _SessionExpired(Exception): ...
+
+def _parse_sse(text: str) -> List[dict]:
+    """JSON-RPC messages carried in a text/event-stream body."""
+    messages, data = [], []
+    for line in text.splitlines():
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip())
+        elif not line.strip() and data:
+            messages.append(json.loads("\n".join(data)))
+            data = []
+    if data:
+        messages.append(json.loads("\n".join(data)))
+    return messages
+
 class MCPClient:
-    def __init__(self, base_url: str, token: str, timeout: float = 30.0):
+    """JSON-RPC client for a FastMCP server over streamable-http.
+
+    One initialized session is shared by all callers and requests run
+    concurrently over the pooled connection. An expired session or a
+    connection that could not be opened triggers a single re-initialize and
+    retry. Other failures (e.g. a read timeout) are not retried: the tool
+    may already have run, and add/complete/delete are not idempotent.
+    """
+
+    def __init__(self, base_url: str, token: str, timeout: float = 30.0,
+                 max_connections: int = 20):
+        self.url = base_url.rstrip("/") + "/"
         self._client = httpx.AsyncClient(
-            base_url=base_url.rstrip("/"),
             headers={"Authorization": f"Bearer {token}"},
             timeout=timeout,
             follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
         )
+        self._ids = itertools.count(1)
+        self._session_id: Optional[str] = None
+        self._init_lock = asyncio.Lock()
+        self.server_info: Dict[str, Any] = {}
+        self.reconnects = 0
+        self._timings: Dict[str, Dict[str, float]] = {}
 
     async def close(self):
+        if self._session_id:
+            try:
+                await self._client.delete(self.url, headers=self._headers())
+            except httpx.HTTPError:
+                pass
+            self._session_id = None
         await self._client.aclose()
 
-    async def _request(self, method: str, path: str, *, json=None, params=None):
-        # drop None-valued query params
-        if params:
-            params = {k: v for k, v in params.items() if v is not None}
+    def _headers(self) -> Dict[str, str]:
+        headers = {
+            "Accept": "application/json, text/event-stream",
+            "MCP-Protocol-Version": PROTOCOL_VERSION,
+        }
+        if self._session_id:
+            headers["Mcp-Session-Id"] = self._session_id
+        return headers
+
+    async def _post(self, message: dict) -> Optional[dict]:
         try:
-            r = await self._client.request(method, path, json=json, params=params)
-            r.raise_for_status()
-        except httpx.HTTPStatusError as e:
-            # surface server message to you
-            raise MCPError(
-                f"{method} {r.request.url} -> {r.status_code} {r.reason_phrase}\n{r.text}"
-            ) from e
+            r = await self._client.post(self.url, json=message, headers=self._headers())
         except httpx.RequestError as e:
             # network/DNS/timeout
-            raise MCPError(f"Network error calling {method} {path}: {e}") from e
-        return r.json()
+            raise MCPError(f"Network error calling {message.get('method')}: {e}") from e
+        # spec says 404 for an unknown session; the python SDK answers 400
+        if self._session_id and (r.status_code == 404 or (r.status_code == 400 and "session" in r.text.lower())):
+            raise _SessionExpired()
+        if r.status_code >= 400:
+            raise MCPError(f"POST {self.url} -> {r.status_code} {r.reason_phrase}\n{r.text}")
+        if "id" not in message:
+            return None   # notification: 202 Accepted, no body
+        if r.headers.get("mcp-session-id"):
+            self._session_id = r.headers["mcp-session-id"]
+        if r.headers.get("content-type", "").startswith("text/event-stream"):
+            replies = _parse_sse(r.text)
+        else:
+            replies = [r.json()]
+        for reply in replies:
+            if reply.get("id") == message["id"]:
+                if "error" in reply:
+                    raise MCPError(f"{message['method']}: {reply['error'].get('message')}")
+                return reply.get("result")
+        raise MCPError(f"No response to {message['method']} (id {message['id']})")
+
+    async def connect(self, force: bool = False) -> None:
+        """Initialize the session once; concurrent callers wait for it."""
+        async with self._init_lock:
+            if self._session_id and not force:
+                return
+            if force:
+                self.reconnects += 1
+            self._session_id = None
+            result = await self._post({
+                "jsonrpc": "2.0", "id": next(self._ids), "method": "initialize",
+                "params": {
+                    "protocolVersion": PROTOCOL_VERSION,
+                    "capabilities": {},
+                    "clientInfo": {"name": "whatsappbot", "version": "0.1.0"},
+                },
+            })
+            self.server_info = result.get("serverInfo", {})
+            await self._post({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> str:
+        """tools/call; returns the text content of the result."""
+        text, _ = await self.call_tool_structured(name, arguments)
+        return text
+
+    async def call_tool_structured(self, name: str, arguments: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        """tools/call; returns the result's text and its structured content ({} if none)."""
+        started = time.perf_counter()
+        ok = False
+        try:
+            for attempt in (1, 2):
+                if not self._session_id:
+                    await self.connect()
+                message = {
+                    "jsonrpc": "2.0", "id": next(self._ids), "method": "tools/call",
+                    "params": {"name": name, "arguments": arguments},
+                }
+                try:
+                    result = await self._post(message)
+                    break
+                except _SessionExpired:
+                    await self.connect(force=True)
+                except MCPError as e:
+                    if attempt == 2 or not isinstance(e.__cause__, NOT_SENT_ERRORS):
+                        raise
+                    await self.connect(force=True)
+            else:
+                raise MCPError(f"{name}: session could not be re-established")
+            text = "\n".join(c.get("text", "") for c in result.get("content", []) if c.get("type") == "text")
+            if result.get("isError"):
+                raise MCPError(f"{name}: {text}")
+            ok = True
+            return text, result.get("structuredContent") or {}
+        finally:
+            self._record(name, time.perf_counter() - started, ok)
+
+    def _record(self, name: str, elapsed: float, ok: bool) -> None:
+        t = self._timings.setdefault(name, {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+        t["calls"] += 1
+        t["errors"] += not ok
+        t["total_s"] += elapsed
+        t["max_s"] = max(t["max_s"], elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        tools = {
+            name: {**t, "avg_ms": round(1000 * t["total_s"] / t["calls"], 3) if t["calls"] else 0.0}
+            for name, t in self._timings.items()
+        }
+        return {"session": bool(self._session_id), "reconnects": self.reconnects, "tools": tools}
 
     async def add_task(self, phone: str, scope: str, text: str):
-        return await self._request("POST", "/add_task", json={"phone": phone, "scope": scope, "text": text})
+        return await self.call_tool("add_task", {"phone": phone, "scope": scope, "text": text})
 
-    async def list_tasks(self, phone: str, scope: Optional[str] = None):
-        return await self._request("GET", "/list_tasks", params={"phone": phone, "scope": scope})
+    async def add_tasks(self, phone: str, scope: str, texts: List[str]):
+        return await self.call_tool("add_tasks", {"phone": phone, "scope": scope, "texts": texts})
+
+    async def list_tasks(self, phone: str, scope: Optional[str] = None,
+                         cursor: Optional[int] = None) -> Tuple[str, Optional[int]]:
+        """(reply, cursor for the next page or None)."""
+        args = {"phone": phone, "scope": scope}
+        if cursor is not None:
+            args["cursor"] = str(cursor)
+        text, structured = await self.call_tool_structured("list_tasks", args)
+        return text, structured.get("cursor")
 
     async def complete_task(self, phone: str, text_or_id: str):
-        return await self._request("POST", "/complete_task", json={"phone": phone, "text_or_id": text_or_id})
+        return await self.call_tool("complete_task", {"phone": phone, "task_text_or_id": text_or_id})
+
+    async def complete_tasks(self, phone: str, items: List[str]):
+        return await self.call_tool("complete_tasks", {"phone": phone, "items": items})
 
     async def delete_task(self, phone: str, text_or_id: str):
-        # some servers ignore JSON bodies on DELETE; send as query params for compatibility
-        return await self._request("DELETE", "/delete_task", params={"phone": phone, "text_or_id": text_or_id})
+        return await self.call_tool("delete_task", {"phone": phone, "task_text_or_id": text_or_id})
+
+    async def delete_tasks(self, phone: str, items: List[str]):
+        return await self.call_tool("delete_tasks", {"phone": phone, "items": items})
+
+# --- Shared client used by the bot (USE_MCP=true) ---
+_client: Optional[MCPClient] = None
+
+def get_client() -> MCPClient:
+    global _client
+    if _client is None:
+        # read at first use so values from .env (loaded after import) apply
+        _client = MCPClient(
+            os.getenv("MCP_SERVER_URL", MCP_SERVER_URL),
+            os.getenv("MCP_AUTH_TOKEN", MCP_AUTH_TOKEN),
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
 
 # quick smoke test
 async def main():
     client = MCPClient(MCP_SERVER_URL, MCP_AUTH_TOKEN)
     try:
-        print(await client.add_task("+919999999999", "personal", "Buy milk"))
+        print(await client.add_task("+919999999999", "today", "Buy milk"))
         print(await client.list_tasks("+919999999999"))
         print(await client.complete_task("+919999999999", "Buy milk"))
         print(await client.delete_task("+919999999999", "Buy milk"))
+        print(client.stats())
     finally:
         await client.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
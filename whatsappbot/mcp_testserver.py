@@ -0,0 +1,122 @@
+# whatsappbot/mcp_testserver.py
+"""Run the real FastMCP server in-process on a loopback port and drive it
+with MCPClient, so the bot -> MCP path can be exercised and load-tested
+without a separate deployment.
+
+    python -m whatsappbot.mcp_testserver --calls 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import uvicorn
+
+from whatsappbot import db
+from whatsappbot.mcp_client import MCPClient
+
+TEST_TOKEN = "local-test-token"
+
+@asynccontextmanager
+async def local_mcp_server(db_path: Optional[Path] = None, host: str = "127.0.0.1",
+                           port: int = 0) -> AsyncIterator[str]:
+    """Start mcp_starter's server on a free port; yields its /mcp/ URL.
+
+    AUTH_TOKEN / MY_NUMBER (if unset) and db.DB_PATH (if db_path is given)
+    are set only for the lifetime of the server and restored on exit.
+    """
+    saved_env = {name: os.environ.get(name) for name in ("AUTH_TOKEN", "MY_NUMBER")}
+    saved_path = db.DB_PATH
+    os.environ.setdefault("AUTH_TOKEN", TEST_TOKEN)
+    os.environ.setdefault("MY_NUMBER", "919999999999")
+    server, task = None, None
+    try:
+        if db_path is not None:
+            db.close_pool()
+            db.DB_PATH = db_path
+        import mcp_starter   # noqa: E402 - needs the env above
+
+        db.init_db()
+        config = uvicorn.Config(mcp_starter.mcp.http_app(), host=host, port=port,
+                                log_level="warning", lifespan="on")
+        server = uvicorn.Server(config)
+        task = asyncio.create_task(server.serve())
+        while not server.started:
+            if task.done():
+                task.result()   # surface bind errors
+            await asyncio.sleep(0.01)
+        bound = server.servers[0].sockets[0].getsockname()[1]
+        yield f"http://{host}:{bound}/mcp/"
+    finally:
+        if task is not None and not task.done():
+            server.should_exit = True
+            await task
+        db.close_pool()
+        db.DB_PATH = saved_path
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def _percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+async def load_test(calls: int, concurrency: int, phones: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        async with local_mcp_server(Path(tmp) / "tasks.db") as url:
+            client = MCPClient(url, os.environ["AUTH_TOKEN"], max_connections=concurrency)
+            await client.connect()
+            latencies = []
+            errors = 0
+            sem = asyncio.Semaphore(concurrency)
+
+            async def one(i: int) -> None:
+                nonlocal errors
+                phone = f"91{random.randrange(phones):08d}"
+                async with sem:
+                    started = time.perf_counter()
+                    try:
+                        if i % 3 == 0:
+                            await client.list_tasks(phone, "today")
+                        elif i % 3 == 1:
+                            await client.add_task(phone, "today", f"task {i}")
+                        else:
+                            await client.complete_task(phone, f"task {i - 1}")
+                    except Exception:
+                        errors += 1
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(calls)))
+            elapsed = time.perf_counter() - started
+            await client.close()
+
+    latencies.sort()
+    print(f"{calls} calls, concurrency {concurrency}: {calls / elapsed:.1f} calls/s, {errors} errors")
+    print(f"  mean {1000 * statistics.mean(latencies):.2f} ms"
+          f"  p50 {1000 * _percentile(latencies, 50):.2f} ms"
+          f"  p95 {1000 * _percentile(latencies, 95):.2f} ms"
+          f"  p99 {1000 * _percentile(latencies, 99):.2f} ms")
+    for name, t in client.stats()["tools"].items():
+        print(f"  {name}: {t['calls']} calls, avg {t['avg_ms']} ms, max {1000 * t['max_s']:.2f} ms")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--phones", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(load_test(args.calls, args.concurrency, args.phones))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+# whatsappbot/metrics.py
+"""Process-wide metrics in the Prometheus text format, plus an on-demand
+sampling profiler for slow requests.
+
+Both servers render ``registry`` at ``/metrics``. Metrics are defined next
+to the code they measure; asking the registry for a name that already
+exists returns the existing metric, so modules loaded by both servers can
+share one.
+"""
+import bisect
+import hmac
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Counter, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 0.5 ms .. 30 s: covers a cached list reply up to a slow page fetch
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_str(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Mapping[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def lines(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._children.items())
+        return [f"{self.name}{_label_str(self.label_names, k)} {_num(v)}" for k, v in items]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._children[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._children[key] = self._children.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._children.items())
+        return [f"{self.name}{_label_str(self.label_names, k)} {_num(v)}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                # per-bucket counts (last one is +Inf), then the sum
+                child = self._children[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            child[i] += 1
+            child[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def lines(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._children.items())
+        out = []
+        for key, child in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child[:-1]):
+                cumulative += count
+                le = f'le="{_num(bound)}"'
+                out.append(f"{self.name}_bucket{_label_str(self.label_names, key, le)} {cumulative}")
+            labels = _label_str(self.label_names, key)
+            out.append(f"{self.name}_sum{labels} {_num(child[-1])}")
+            out.append(f"{self.name}_count{labels} {cumulative}")
+        return out
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._stats: Dict[str, Tuple[Callable[[], Mapping[str, Any]], frozenset]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_add(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind:
+                    raise ValueError(f"{metric.name} is already registered as a {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._get_or_add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._get_or_add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_add(Histogram(name, help, labels, buckets))
+
+    def register_stats(self, prefix: str, fn: Callable[[], Mapping[str, Any]],
+                       exclude: Sequence[str] = ()) -> None:
+        """Expose the numeric top-level fields of a ``stats()`` dict as
+        gauges named ``<prefix>_<field>``, read at scrape time. Fields in
+        ``exclude`` are left out, e.g. ones a real metric already exports."""
+        with self._lock:
+            self._stats[prefix] = (fn, frozenset(exclude))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            stats = list(self._stats.items())
+        out = []
+        for m in metrics:
+            out.append(f"# HELP {m.name} {m.help}")
+            out.append(f"# TYPE {m.name} {m.kind}")
+            out.extend(m.lines())
+        for prefix, (fn, exclude) in stats:
+            try:
+                values = fn()
+            except Exception as e:
+                print("Metrics: stats for", prefix, "failed:", e)
+                continue
+            for field, value in values.items():
+                if field in exclude:
+                    continue
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"{prefix}_{field}"
+                    out.append(f"# TYPE {name} gauge")
+                    out.append(f"{name} {_num(value)}")
+        return "\n".join(out) + "\n"
+
+registry = Registry()
+
+# --- Slow-request profiler ---
+
+# leaf frames of threads that are only waiting (idle pool workers, the idle
+# event loop); they would drown out the stacks doing work
+_IDLE_FILES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+
+# a shorter sampling interval would have the sampler thread hog the GIL
+MIN_INTERVAL = 0.001
+
+class SlowRequestProfiler:
+    """Statistical profiler for requests slower than ``threshold`` seconds.
+
+    Off by default and free while off. Once enabled, a sampler thread
+    records every busy thread's stack each ``interval`` while any tracked
+    request is in flight; when a request finishes over the threshold, the
+    stacks seen during its lifetime are kept (the last ``keep`` of them) in
+    collapsed form, ready for a flame graph. Samples cover the whole
+    process, so concurrent requests share them.
+    """
+
+    def __init__(self, threshold: float = 1.0, interval: float = 0.005,
+                 keep: int = 20, depth: int = 40, top: int = 25):
+        self.threshold = threshold
+        self.interval = max(interval, MIN_INTERVAL)
+        self.depth = depth
+        self.top = top
+        self.enabled = False
+        self.captures: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._active: Dict[int, _Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+        self.tracked = 0
+        self.captured = 0
+
+    def enable(self, threshold: Optional[float] = None, interval: Optional[float] = None) -> None:
+        if threshold is not None:
+            self.threshold = threshold
+        if interval is not None:
+            self.interval = max(interval, MIN_INTERVAL)
+        self.enabled = True
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def disable(self) -> None:
+        self.enabled = False   # the sampler thread exits after its next tick
+
+    @contextmanager
+    def track(self, name: str) -> Iterator[Dict[str, str]]:
+        """Profile the enclosed request. Yields a dict whose ``name`` the
+        caller may refine once it knows more (e.g. the parsed intent)."""
+        info = {"name": name}
+        if not self.enabled:
+            yield info
+            return
+        samples: _Counter = _Counter()
+        started = time.perf_counter()
+        with self._lock:
+            self._active[id(samples)] = samples
+            self.tracked += 1
+        try:
+            yield info
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._active.pop(id(samples), None)
+            if elapsed >= self.threshold:
+                self._capture(info["name"], elapsed, samples)
+
+    def _capture(self, name: str, elapsed: float, samples: _Counter) -> None:
+        self.captured += 1
+        self.captures.append({
+            "name": name,
+            "ms": round(1000 * elapsed, 1),
+            "at": time.time(),
+            "samples": sum(samples.values()),
+            "stacks": [{"stack": s, "count": c} for s, c in samples.most_common(self.top)],
+        })
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while self.enabled:
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                continue
+            stacks = self._stacks(me)
+            self.samples += 1
+            for samples in active:
+                samples.update(stacks)
+
+    def _stacks(self, skip: int) -> List[str]:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        out = []
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.depth:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if not frames or frames[0].split("(")[1].split(":")[0] in _IDLE_FILES:
+                continue
+            out.append(";".join([names.get(ident, str(ident))] + frames[::-1]))
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": round(1000 * self.threshold, 1),
+            "interval_ms": round(1000 * self.interval, 2),
+            "samples": self.samples,
+            "tracked": self.tracked,
+            "captured": self.captured,
+        }
+
+    def control(self, params: Mapping[str, str]) -> Dict[str, Any]:
+        """Apply ``enable``/``threshold_ms``/``interval_ms`` query params and
+        return the profiler state with its captures (``clear=true`` drops them).
+        Raises ValueError, before changing anything, on a bad value."""
+        threshold = _seconds(params, "threshold_ms")
+        interval = _seconds(params, "interval_ms")
+        if interval is not None:
+            interval = max(interval, MIN_INTERVAL)
+        enable = params.get("enable", "").lower()
+        if enable in ("1", "true", "on"):
+            self.enable(threshold, interval)
+        elif enable in ("0", "false", "off"):
+            self.disable()
+        elif threshold is not None or interval is not None:
+            self.threshold = threshold if threshold is not None else self.threshold
+            self.interval = interval if interval is not None else self.interval
+        captures = list(self.captures)
+        if params.get("clear", "").lower() in ("1", "true"):
+            self.captures.clear()
+        return {**self.stats(), "captures": captures}
+
+def _seconds(params: Mapping[str, str], name: str) -> Optional[float]:
+    """Optional non-negative millisecond param, in seconds."""
+    raw = params.get(name)
+    if not raw:
+        return None
+    try:
+        ms = float(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be a number of milliseconds") from None
+    if not math.isfinite(ms) or ms < 0:
+        raise ValueError(f"{name} must be a non-negative number of milliseconds")
+    return ms / 1000
+
+# PROFILER_TOKEN guards the runtime switch and both servers' /stats; without
+# it those endpoints are off
+PROFILER_TOKEN = os.getenv("PROFILER_TOKEN", "")
+
+def profiler_authorized(authorization: Optional[str], token: Optional[str] = None) -> bool:
+    """Bearer header or ``?token=`` matches PROFILER_TOKEN."""
+    if not PROFILER_TOKEN:
+        return False
+    given = token or (authorization or "").removeprefix("Bearer ").strip()
+    return hmac.compare_digest(given.encode(), PROFILER_TOKEN.encode())
+
+profiler = SlowRequestProfiler(
+    threshold=float(os.getenv("PROFILE_SLOW_MS", "1000")) / 1000,
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    keep=int(os.getenv("PROFILE_KEEP", "20")),
+)
+if os.getenv("PROFILE_ENABLED", "false").lower() == "true":
+    profiler.enable()
+
+registry.register_stats("profiler", profiler.stats)
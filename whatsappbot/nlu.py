@@ -1,49 +1,56 @@
 import re
-from typing import Dict, Optional
-
-SCOPES = ["today", "week", "weekly", "month", "monthly"]
-
-def normalize_scope(s: Optional[str]) -> Optional[str]:
-    if not s: return None
-    s = s.lower()
-    if s in ("weekly",): return "week"
-    if s in ("monthly",): return "month"
-    if s in ("today","week","month"): return s
-    return None
-
-def parse(text: str) -> Dict[str, Optional[str]]:
+from typing import Any, Dict, List, Optional
+
+def split_items(what: str) -> Optional[List[str]]:
+    """Split "milk, eggs and bread" / "3 5 8" into items; None for a single item.
+
+    "&" only separates when spaced ("mom & dad"), so "r&d report" stays whole.
+    """
+    parts = [p.strip() for p in re.split(r"\s*(?:,|;|\s&\s|\band\b)\s*", what) if p.strip()]
+    words = [w.lstrip("#") for p in parts for w in p.split()]
+    if words and all(w.isdigit() for w in words):
+        parts = words   # "3 5 8" / "#3, #5" -> ids
+    return parts if len(parts) > 1 else None
+
+_SCOPE = r"today|this week|week|weekly|this month|month|monthly"
+
+# "this week" -> "week", "monthly" -> "month", ...
+_SCOPE_OF = {"today": "today", "this week": "week", "week": "week", "weekly": "week",
+             "this month": "month", "month": "month", "monthly": "month"}
+
+# Every intent pattern as one alternation, tried in the order parse() has
+# always used; the outer named group of the branch that matched is
+# m.lastgroup. The bare-word shortcuts come last and must match the whole text.
+_MATCHER = re.compile(
+    rf"(?P<add>(add|append|put|create|new)\s+(?P<add_what>.+?)\s+(to\s+)?(my\s+)?(?P<add_scope>{_SCOPE}))"
+    rf"|(?P<list>(show|list|view|see)(\s+my)?\s+(?P<list_scope>{_SCOPE})?)"
+    rf"|(?P<complete>(complete|done|finish|tick|mark)\s+(?P<complete_what>.+))"
+    rf"|(?P<delete>(delete|del|remove|drop|cancel)\s+(?P<delete_what>.+))"
+    r"|(?P<scope_word>(today|week|weekly|month|monthly)\Z)"
+    r"|(?P<list_word>(list|show|tasks)\Z)"
+    r"|(?P<more>(more|next|more tasks|next page)\Z)"
+    r"|(?P<help>(help|hi|hello)\Z)"
+)
+
+def parse(text: str) -> Dict[str, Any]:
     t = text.strip().lower()
-
-    # add
-    m = re.match(r"(add|append|put|create|new)\s+(?P<what>.+?)\s+(to\s+)?(my\s+)?(?P<scope>today|this week|week|weekly|this month|month|monthly)", t)
-    if m:
-        what = m.group("what")
-        sc = m.group("scope").replace("this ","")
-        return {"intent":"add", "scope": normalize_scope(sc), "text": what}
-
-    # list/show
-    m = re.match(r"(show|list|view|see)(\s+my)?\s+(?P<scope>today|this week|week|weekly|this month|month|monthly)?", t)
-    if m:
-        sc = m.group("scope")
-        if sc: sc = sc.replace("this ","")
-        return {"intent":"list", "scope": normalize_scope(sc), "text": None}
-
-    # complete/done
-    m = re.match(r"(complete|done|finish|tick|mark)\s+(?P<what>.+)", t)
-    if m:
-        return {"intent":"complete", "scope": None, "text": m.group("what")}
-
-    # delete/remove
-    m = re.match(r"(delete|del|remove|drop|cancel)\s+(?P<what>.+)", t)
-    if m:
-        return {"intent":"delete", "scope": None, "text": m.group("what")}
-
-    # quick patterns
-    if t in ("today","week","weekly","month","monthly"):
-        return {"intent":"list", "scope": normalize_scope(t), "text": None}
-    if t in ("list","show", "tasks"):
-        return {"intent":"list", "scope": None, "text": None}
-    if t in ("help","hi","hello"):
-        return {"intent":"help", "scope": None, "text": None}
-
-    return {"intent":"unknown", "scope": None, "text": text}
\ No newline at end of file
+    m = _MATCHER.match(t)
+    kind = m.lastgroup if m else None
+
+    if kind == "add":
+        what = m.group("add_what")
+        return {"intent":"add", "scope": _SCOPE_OF[m.group("add_scope")], "text": what, "items": split_items(what)}
+    if kind == "list":
+        sc = m.group("list_scope")
+        return {"intent":"list", "scope": _SCOPE_OF[sc] if sc else None, "text": None, "items": None}
+    if kind in ("complete", "delete"):
+        what = m.group(kind + "_what")
+        return {"intent":kind, "scope": None, "text": what, "items": split_items(what)}
+    if kind == "scope_word":
+        return {"intent":"list", "scope": _SCOPE_OF[t], "text": None, "items": None}
+    if kind == "list_word":
+        return {"intent":"list", "scope": None, "text": None, "items": None}
+    if kind in ("more", "help"):
+        return {"intent":kind, "scope": None, "text": None, "items": None}
+
+    return {"intent":"unknown", "scope": None, "text": text, "items": None}
@@ -0,0 +1,237 @@
+# whatsappbot/outbound.py
+import asyncio
+import email.utils
+import random
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from whatsappbot import async_db
+from whatsappbot.metrics import registry
+from whatsappbot.work_queue import PhoneWorkQueue
+
+# WhatsApp rejects text bodies longer than this
+MAX_BODY_CHARS = 4096
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# failures before the request was written, so a retry can't double-send
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+send_seconds = registry.histogram(
+    "outbound_send_seconds", "Graph API send latency per attempt, by outcome (ok, retry, error).", ("outcome",))
+throttle_seconds = registry.histogram(
+    "outbound_throttle_seconds", "Time a chunk waited on the rate limiters before sending.")
+in_flight_sends = registry.gauge("outbound_in_flight", "Graph API sends awaiting a response.")
+
+class TokenBucket:
+    """Async token bucket: ``rate`` tokens per second, up to ``burst`` saved."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns seconds waited."""
+        async with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0.0
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+                self.updated = time.monotonic()
+                self.tokens = 1
+            self.tokens -= 1
+            return wait
+
+def split_message(text: str, limit: int = MAX_BODY_CHARS) -> List[str]:
+    """Split on line boundaries where possible so no chunk exceeds ``limit``."""
+    if len(text) <= limit:
+        return [text]
+    chunks, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:                      # a single over-long line
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return [c.rstrip("\n") for c in chunks if c.strip()]
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class OutboundDispatcher:
+    """Rate-limited, retrying sender for WhatsApp text replies.
+
+    Every chunk takes a token from the business-number bucket and from the
+    recipient's bucket. 429, 5xx and connect-phase errors are retried with
+    jittered exponential backoff, honouring Retry-After up to ``max_delay``.
+    Any other network error may have reached Graph, so it is not retried.
+    Messages that still fail land in the dead-letter table.
+
+    ``enqueue`` hands a message to ``senders`` sender tasks (ordered per
+    recipient) and returns once it is queued, so throttling and retries
+    never hold up the caller; ``send`` delivers inline and waits.
+    """
+
+    def __init__(self, client: Callable[[], httpx.AsyncClient], api_url: str, token: str,
+                 business_rate: float = 80.0, business_burst: float = 80.0,
+                 recipient_rate: float = 1.0, recipient_burst: float = 10.0,
+                 max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 max_recipients: int = 10000, senders: int = 16, queue_size: int = 5000,
+                 put_timeout: float = 2.0):
+        self.client = client
+        self.api_url = api_url
+        self.token = token
+        self.business = TokenBucket(business_rate, business_burst)
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_recipients = max_recipients
+        self._recipients: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._queue = PhoneWorkQueue(self._deliver, workers=senders, maxsize=queue_size,
+                                     put_timeout=put_timeout)
+        self.in_flight = 0
+        self.sent = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.throttle_wait = 0.0
+
+    async def start(self) -> None:
+        await self._queue.start()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Let queued messages go out (up to ``timeout``), then stop the senders."""
+        await self._queue.stop(timeout)
+
+    async def enqueue(self, to_phone: str, text: str) -> bool:
+        """Queue ``text`` for delivery; returns once queued. A message the
+        queue has no room for is dead-lettered and False returned."""
+        if await self._queue.submit(to_phone, (to_phone, text)):
+            return True
+        await self._dead_letter(to_phone, text, "send queue full")
+        return False
+
+    async def _deliver(self, item: Tuple[str, str]) -> None:
+        await self.send(*item)
+
+    def _bucket(self, to_phone: str) -> TokenBucket:
+        bucket = self._recipients.get(to_phone)
+        if bucket is None:
+            bucket = self._recipients[to_phone] = TokenBucket(self.recipient_rate, self.recipient_burst)
+            while len(self._recipients) > self.max_recipients:
+                self._recipients.popitem(last=False)
+        self._recipients.move_to_end(to_phone)
+        return bucket
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def send(self, to_phone: str, text: str, dead_letter: bool = True) -> List[Any]:
+        """Send ``text`` (split into chunks as needed). Returns API responses
+        for the chunks that were delivered. Undelivered chunks are
+        dead-lettered unless ``dead_letter`` is False."""
+        results = []
+        chunks = split_message(text)
+        for i, chunk in enumerate(chunks):
+            result, error = await self._send_chunk(to_phone, chunk)
+            if error is not None:
+                if dead_letter:
+                    # keep the rest together with the failed chunk for replay
+                    await self._dead_letter(to_phone, "\n".join(chunks[i:]), error)
+                else:
+                    print("Send failed:", to_phone, error)
+                break
+            results.append(result)
+        return results
+
+    async def _send_chunk(self, to_phone: str, body: str) -> Tuple[Optional[Any], Optional[str]]:
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": to_phone,
+            "type": "text",
+            "text": {"body": body}
+        }
+        error = None
+        for attempt in range(self.max_attempts):
+            waited = await self._bucket(to_phone).acquire() + await self.business.acquire()
+            self.throttle_wait += waited
+            throttle_seconds.observe(waited)
+            delay = None
+            outcome = "retry"
+            self.in_flight += 1
+            in_flight_sends.inc()
+            started = time.perf_counter()
+            try:
+                r = await self.client().post(self.api_url, headers=headers, json=payload)
+            except RETRY_ERRORS as e:
+                error = repr(e)
+            except httpx.HTTPError as e:
+                # the request may have been delivered; retrying could double-send
+                outcome = "error"
+                return None, repr(e)
+            else:
+                if r.status_code < 400:
+                    self.sent += 1
+                    outcome = "ok"
+                    return r.json(), None
+                error = f"{r.status_code}: {r.text[:500]}"
+                if r.status_code not in RETRY_STATUSES:
+                    outcome = "error"
+                    return None, error
+                delay = retry_after(r)
+            finally:
+                self.in_flight -= 1
+                in_flight_sends.dec()
+                send_seconds.observe(time.perf_counter() - started, outcome=outcome)
+            if attempt + 1 < self.max_attempts:
+                self.retries += 1
+                await asyncio.sleep(min(delay, self.max_delay) if delay is not None else self._backoff(attempt))
+        return None, error
+
+    async def _dead_letter(self, to_phone: str, body: str, error: str) -> None:
+        self.dead_lettered += 1
+        print("Send failed, dead-lettered:", to_phone, error)
+        try:
+            await async_db.add_dead_letter(to_phone, body, error)
+        except Exception as e:
+            print("Dead-letter write failed:", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "throttle_wait_s": round(self.throttle_wait, 3),
+            "tracked_recipients": len(self._recipients),
+            "queue_depth": self._queue.depth(),
+            "queue_high_water": self._queue.high_water,
+            "queue_rejected": self._queue.rejected,
+        }
@@ -0,0 +1,141 @@
+# whatsappbot/pool.py
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+# Applied to every new connection. WAL lets readers run alongside the single
+# writer; synchronous=NORMAL is safe under WAL (only the last commit can be
+# lost on power failure, never corruption). auto_vacuum only takes on a file
+# that is still empty, and must come before journal_mode writes its header.
+PRAGMAS = (
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+class PoolTimeout(Exception): ...
+
+class ConnectionPool:
+    """Bounded pool of reusable sqlite3 connections for one database file.
+
+    Connections are opened lazily up to ``max_size`` and handed out LIFO so
+    the hottest connection (warm page cache, prepared statements) is reused
+    first. ``acquire`` blocks for up to ``timeout`` seconds when every
+    connection is checked out; a statement waits up to ``busy_timeout``
+    seconds (default: ``timeout``) for another process's write lock.
+    """
+
+    def __init__(self, path: Union[str, Path], max_size: int = 8,
+                 timeout: float = 10.0, cached_statements: int = 256,
+                 busy_timeout: Optional[float] = None):
+        self.path = str(path)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.busy_timeout = timeout if busy_timeout is None else busy_timeout
+        self.cached_statements = cached_statements
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        # stats
+        self._created = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,   # sqlite's busy handler
+            check_same_thread=False,   # connections move between executor threads
+            cached_statements=self.cached_statements,
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._all) < self.max_size:
+                    conn = self._connect()
+                    self._all.append(conn)
+                    self._created += 1
+            if conn is None:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise PoolTimeout(f"no free connection to {self.path} after {self.timeout}s")
+                with self._lock:
+                    self._waits += 1
+                    self._wait_time += time.perf_counter() - started
+        with self._lock:
+            self._acquired += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self._in_use -= 1
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Close idle connections; busy ones are closed when released."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._all.clear()
+
+    def stats(self) -> Dict[str, Union[int, float, str]]:
+        with self._lock:
+            return {
+                "path": self.path,
+                "max_size": self.max_size,
+                "open": len(self._all),
+                "idle": self._idle.qsize(),
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "created": self._created,
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "wait_time_s": round(self._wait_time, 6),
+                "timeouts": self._timeouts,
+            }
@@ -0,0 +1,100 @@
+# whatsappbot/replies.py
+import os
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from whatsappbot import db
+from whatsappbot.cache import MISS, task_cache
+
+# list replies are paged by rendered size; WhatsApp caps a text body at 4096
+PAGE_BYTES = int(os.getenv("LIST_PAGE_BYTES", "3500"))
+PAGE_FETCH = 50   # rows per keyset query while filling a page
+
+def added(task_id: int, scope: str, text: str) -> str:
+    return f"✅ Added (#{task_id}) to {scope}: “{text}”"
+
+def added_many(ids: List[int], scope: str, texts: List[str]) -> str:
+    added = ", ".join(f"#{i} “{t}”" for i, t in zip(ids, texts))
+    return f"✅ Added {len(ids)} to {scope}: {added}"
+
+def completed(count: int) -> str:
+    return "✅ Marked done." if count else "Couldn’t find that task."
+
+def completed_many(count: int, requested: int) -> str:
+    return f"✅ Marked {count} of {requested} done." if count else "Couldn’t find those tasks."
+
+def deleted(count: int) -> str:
+    return "🗑️ Deleted." if count else "Couldn’t find that task."
+
+def deleted_many(count: int, requested: int) -> str:
+    return f"🗑️ Deleted {count} of {requested}." if count else "Couldn’t find those tasks."
+
+def _task_line(r) -> str:
+    return f"• #{r['id']} [{r['scope']}] {r['text']}"
+
+def render_task_list(rows: Sequence, scope: Optional[str]) -> str:
+    if not rows:
+        sc = scope or "all"
+        return f"(empty) No open tasks in {sc}."
+    lines = [_task_line(r) for r in rows]
+    return "Your tasks:\n" + "\n".join(lines)
+
+def _more_footer(cursor: int) -> str:
+    return f"\n\n➡️ Reply “more” for tasks older than #{cursor}."
+
+def render_task_page(rows: Iterable, scope: Optional[str], cursor: Optional[int] = None,
+                     max_bytes: int = PAGE_BYTES) -> Tuple[str, Optional[int]]:
+    """Render rows until the reply would exceed ``max_bytes`` (UTF-8).
+
+    ``rows`` is consumed lazily, so only one row past the page is read.
+    Returns (reply, next cursor). When rows remain, the next cursor is the
+    id of the last task shown and the reply ends with a footer naming it;
+    otherwise it is None.
+    """
+    header = "Your tasks:" if cursor is None else "More tasks:"
+    budget = max_bytes - len(header.encode()) - len(_more_footer(10 ** 12).encode())
+    lines: List[str] = []
+    last_id = None
+    for r in rows:
+        line = _task_line(r)
+        size = len(line.encode()) + 1
+        if lines and size > budget:
+            return header + "\n" + "\n".join(lines) + _more_footer(last_id), last_id
+        lines.append(line)
+        budget -= size
+        last_id = r["id"]
+    if not lines:
+        sc = scope or "all"
+        return (f"(empty) No open tasks in {sc}." if cursor is None else f"No more open tasks in {sc}."), None
+    return header + "\n" + "\n".join(lines), None
+
+def task_list_reply(phone: str, scope: Optional[str] = None,
+                    cursor: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """One page of the "Your tasks" reply and its next cursor, cached per
+    cursor until the next write to the phone's tasks by any process
+    (blocking: reads its version)."""
+    version = db.task_version(phone)
+    page = task_cache.get((phone, scope, "reply", cursor), version)
+    if page is not MISS:
+        return page
+    return build_task_list_reply(phone, scope, cursor, version)
+
+def build_task_list_reply(phone: str, scope: Optional[str] = None, cursor: Optional[int] = None,
+                          version: Optional[int] = None) -> Tuple[str, Optional[int]]:
+    """Query, render and cache a list page (blocking; cache miss path)."""
+    generation = task_cache.generation(phone)
+    if version is None:
+        version = db.task_version(phone)
+    page = render_task_page(db.iter_open_tasks(phone, scope, cursor, PAGE_FETCH), scope, cursor)
+    task_cache.set((phone, scope, "reply", cursor), page, generation, version)
+    return page
+
+_DIGEST_PERIODS = {"today": "today", "week": "this week", "month": "this month"}
+
+def render_digest(scope: str, rows: Sequence, total: int) -> str:
+    """Scheduled digest: the newest open tasks in ``scope`` (``rows``, already
+    capped) out of ``total``."""
+    lines = [f"• #{r['id']} {r['text']}" for r in rows]
+    reply = f"🗓️ Your open tasks for {_DIGEST_PERIODS.get(scope, scope)} ({total}):\n" + "\n".join(lines)
+    if total > len(rows):
+        reply += f"\n…and {total - len(rows)} more. Reply “show {scope}” for the full list."
+    return reply
@@ -0,0 +1,97 @@
+# whatsappbot/reshard.py
+"""Offline resharding: copy every task into a new set of shard files and
+point the shard map at them.
+
+Stop the bot and the MCP server first. The current layout (the shard map,
+or tasks in DB_PATH when there is no map) is read but never modified, so a
+failed run leaves it intact; the old shard files (or the tasks tables left
+in DB_PATH) can be dropped once the new layout is confirmed. Task ids are
+kept, so a user's "#12" still means #12.
+
+    python -m whatsappbot.reshard --shards 8
+    python -m whatsappbot.reshard --shards 1 --out-dir /data/tasks
+"""
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from whatsappbot import db
+
+TASK_COLUMNS = "id, phone, scope, text, status, created_at, completed_at"
+ARCHIVE_COLUMNS = "id, phone, scope, text, created_at, completed_at, archived_at"
+
+def _copy_table(src: sqlite3.Connection, dests: List[sqlite3.Connection], table: str,
+                columns: str, batch: int) -> int:
+    marks = ", ".join("?" * len(columns.split(",")))
+    insert = f"INSERT INTO {table} ({columns}) VALUES ({marks})"
+    cur = src.execute(f"SELECT {columns} FROM {table} ORDER BY id")
+    copied = 0
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            return copied
+        by_shard: Dict[int, list] = {}
+        for row in rows:
+            by_shard.setdefault(db.shard_index(row["phone"], len(dests)), []).append(tuple(row))
+        for i, shard_rows in by_shard.items():
+            dests[i].executemany(insert, shard_rows)
+        copied += len(rows)
+
+def reshard(count: int, out_dir: Path, batch: int = 10000) -> List[Path]:
+    sources = db.task_db_paths()
+    stamp = time.strftime("%Y%m%d%H%M%S")
+    targets = [out_dir / f"tasks-{stamp}-{i}of{count}.db" for i in range(count)]
+    for path in targets:
+        if path.exists():
+            raise SystemExit(f"{path} already exists")
+
+    db.init_db()                     # brings the current layout up to date
+    dests = []
+    for path in targets:
+        db.init_task_db(path)
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        dests.append(conn)
+
+    max_id = 0
+    for source in sources:
+        with db.get_pool(source).connection() as src:
+            tasks = _copy_table(src, dests, "tasks", TASK_COLUMNS, batch)
+            archived = _copy_table(src, dests, "tasks_archive", ARCHIVE_COLUMNS, batch)
+            max_id = max(max_id, src.execute(
+                "SELECT MAX(m) FROM (SELECT MAX(id) AS m FROM tasks UNION ALL SELECT MAX(id) FROM tasks_archive)"
+            ).fetchone()[0] or 0)
+            # AUTOINCREMENT high-water mark, in case the newest tasks were deleted
+            seq = src.execute("SELECT seq FROM sqlite_sequence WHERE name='tasks'").fetchone()
+            max_id = max(max_id, seq[0] if seq else 0)
+        print(f"{source}: {tasks} tasks, {archived} archived")
+
+    for conn in dests:
+        conn.commit()
+        conn.execute("ANALYZE")
+        conn.close()
+    with db.get_conn() as conn:
+        db.seed_task_ids(conn, max_id + 1)
+        conn.commit()
+    db.close_pool()
+    db.write_shard_map(targets)
+    return targets
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, required=True, help="number of shard files")
+    parser.add_argument("--out-dir", type=Path, default=None,
+                        help="where to create the shard files (default: next to the shard map)")
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+    out_dir = args.out_dir or db.SHARD_MAP_PATH.parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+    targets = reshard(args.shards, out_dir.resolve(), args.batch)
+    print(f"Wrote {len(targets)} shard(s); shard map: {db.SHARD_MAP_PATH}")
+
+if __name__ == "__main__":
+    main()
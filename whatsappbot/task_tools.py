@@ -0,0 +1,66 @@
+# whatsappbot/task_tools.py
+"""The task operations behind mcp_starter's task tools.
+
+mcp_starter registers each of these as an MCP tool; the bot's ``inprocess``
+backend awaits them directly. Both run the same code and get the same
+replies, with failures raised as McpError, but the bot never imports the
+server module (its auth setup and its mcp_* metrics).
+"""
+from typing import List, Optional, Tuple
+
+from mcp import ErrorData, McpError
+from mcp.types import INTERNAL_ERROR, INVALID_PARAMS
+
+from whatsappbot import async_db, replies
+
+async def add_task(phone: str, scope: str, text: str) -> str:
+    try:
+        task_id = await async_db.add_task(phone, scope, text)
+        return replies.added(task_id, scope, text)
+    except Exception as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to add task: {e}"))
+
+async def list_tasks(phone: str, scope: Optional[str] = None,
+                     cursor: Optional[str] = None) -> Tuple[str, Optional[int]]:
+    """(reply, cursor for the next page or None)."""
+    if cursor is not None and not cursor.lstrip("#").isdigit():
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=f"cursor must be a task id, got {cursor!r}"))
+    try:
+        return await async_db.list_tasks_reply(phone, scope, int(cursor.lstrip("#")) if cursor else None)
+    except Exception as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to list tasks: {e}"))
+
+async def complete_task(phone: str, task_text_or_id: str) -> str:
+    try:
+        count = await async_db.complete_task(phone, task_text_or_id)
+        return replies.completed(count)
+    except Exception as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to complete task: {e}"))
+
+async def delete_task(phone: str, task_text_or_id: str) -> str:
+    try:
+        count = await async_db.delete_task(phone, task_text_or_id)
+        return replies.deleted(count)
+    except Exception as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to delete task: {e}"))
+
+async def add_tasks(phone: str, scope: str, texts: List[str]) -> str:
+    try:
+        ids = await async_db.add_tasks(phone, scope, texts)
+        return replies.added_many(ids, scope, texts)
+    except Exception as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to add tasks: {e}"))
+
+async def complete_tasks(phone: str, items: List[str]) -> str:
+    try:
+        count = await async_db.complete_tasks(phone, items)
+        return replies.completed_many(count, len(items))
+    except Exception as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to complete tasks: {e}"))
+
+async def delete_tasks(phone: str, items: List[str]) -> str:
+    try:
+        count = await async_db.delete_tasks(phone, items)
+        return replies.deleted_many(count, len(items))
+    except Exception as e:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to delete tasks: {e}"))
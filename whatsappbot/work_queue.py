@@ -0,0 +1,108 @@
+# whatsappbot/work_queue.py
+import asyncio
+import logging
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+Handler = Callable[[Any], Awaitable[None]]
+
+class PhoneWorkQueue:
+    """Bounded async work queue: ordered per phone, parallel across phones.
+
+    Each phone hashes to one worker lane, and a lane runs its items one at a
+    time, so messages from the same user are handled in arrival order while
+    different users proceed concurrently. ``submit`` waits up to
+    ``put_timeout`` for room and returns False when the lane is still full,
+    which callers turn into backpressure (e.g. a 503 so the sender retries).
+    """
+
+    def __init__(self, handler: Handler, workers: int = 8, maxsize: int = 1000,
+                 put_timeout: float = 2.0):
+        self.handler = handler
+        self.workers = workers
+        self.lane_size = max(1, maxsize // workers)
+        self.put_timeout = put_timeout
+        self._lanes: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.waited = 0
+        self.high_water = 0
+        self.busy_time = 0.0
+
+    def lane_for(self, phone: Optional[str]) -> int:
+        return zlib.crc32((phone or "").encode()) % self.workers
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._lanes = [asyncio.Queue(self.lane_size) for _ in range(self.workers)]
+        self._tasks = [asyncio.create_task(self._run(q), name=f"wa-worker-{i}")
+                       for i, q in enumerate(self._lanes)]
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Let queued work drain (up to ``timeout``), then cancel the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self._lanes)), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._lanes = [], []
+
+    async def submit(self, phone: Optional[str], item: Any) -> bool:
+        if not self._tasks:
+            await self.start()
+        lane = self._lanes[self.lane_for(phone)]
+        if lane.full():
+            self.waited += 1
+            try:
+                await asyncio.wait_for(lane.put(item), self.put_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+        else:
+            lane.put_nowait(item)
+        self.enqueued += 1
+        self.high_water = max(self.high_water, self.depth())
+        return True
+
+    async def _run(self, lane: asyncio.Queue) -> None:
+        while True:
+            item = await lane.get()
+            started = time.perf_counter()
+            try:
+                await self.handler(item)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                log.exception("Worker error")
+            finally:
+                self.busy_time += time.perf_counter() - started
+                lane.task_done()
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._lanes)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "capacity": self.lane_size * self.workers,
+            "depth": self.depth(),
+            "lane_depths": [q.qsize() for q in self._lanes],
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "waited": self.waited,
+            "rejected": self.rejected,
+            "busy_time_s": round(self.busy_time, 3),
+        }